@@ -0,0 +1,57 @@
+"""
+Active song projection for the Online Music Player application.
+Active_Songs_Catalog holds one narrow row per active song with its artist,
+album and genre names copied in, so song lists and searches read a single
+indexed table instead of joining four and filtering Songs (and staying
+clear of its blob column). Like the lists it replaces, it leaves out songs
+without an artist. Writers of Songs call refresh_active_songs in the same
+transaction; the caller owns the connection and commits.
+"""
+
+# Denormalized rows of active songs, for INSERT ... SELECT into the projection
+ACTIVE_SONGS_SELECT = """
+SELECT s.song_id, s.title, s.artist_id, a.name, s.album_id, al.title,
+       s.genre_id, g.name, s.duration, s.file_type, s.file_size, s.upload_date
+FROM Songs s
+JOIN Artists a ON s.artist_id = a.artist_id
+LEFT JOIN Albums al ON s.album_id = al.album_id
+LEFT JOIN Genres g ON s.genre_id = g.genre_id
+WHERE s.is_active = 1
+"""
+
+ACTIVE_SONGS_INSERT = """
+INSERT INTO Active_Songs_Catalog (song_id, title, artist_id, artist_name, album_id, album_name,
+                                  genre_id, genre_name, duration, file_type, file_size, upload_date)
+"""
+
+REFRESH_BATCH = 1000
+
+def refresh_active_songs(cursor, song_ids):
+    """Bring the projection rows of song_ids in line with Songs
+
+    Inserted, edited and re-activated songs get a fresh row; deactivated
+    and deleted ones lose theirs.
+    """
+    song_ids = sorted({int(song_id) for song_id in song_ids})
+    for i in range(0, len(song_ids), REFRESH_BATCH):
+        chunk = song_ids[i:i + REFRESH_BATCH]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"DELETE FROM Active_Songs_Catalog WHERE song_id IN ({placeholders})", chunk)
+        cursor.execute(
+            ACTIVE_SONGS_INSERT + ACTIVE_SONGS_SELECT + f" AND s.song_id IN ({placeholders})",
+            chunk
+        )
+
+def rebuild_active_catalog(cursor):
+    """Rebuild the whole projection from Songs; returns the number of active songs"""
+    cursor.execute("DELETE FROM Active_Songs_Catalog")
+    cursor.execute(ACTIVE_SONGS_INSERT + ACTIVE_SONGS_SELECT)
+    cursor.execute("SELECT COUNT(*) FROM Active_Songs_Catalog")
+    return cursor.fetchone()[0]
+
+def active_catalog_stale(cursor):
+    """Whether the projection holds a different number of songs than it should"""
+    cursor.execute("SELECT COUNT(*) FROM Active_Songs_Catalog")
+    projected = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM Songs s JOIN Artists a ON s.artist_id = a.artist_id WHERE s.is_active = 1")
+    return projected != cursor.fetchone()[0]
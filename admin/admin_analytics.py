@@ -0,0 +1,277 @@
+"""
+Listening-history analytics for the Admin section of the Online Music Player application.
+Computes hourly/daily play counts per song, artist, genre and user over any
+date range. Listening_History is streamed in chunks and grouped with NumPy;
+per-hour counts of completed days are cached in Listening_Stats_Hourly so a
+repeated report only rescans days that are not cached yet (always today).
+"""
+
+import os
+import sys
+import datetime
+from collections import Counter
+import mysql.connector
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_utils import connect_db
+from change_log import database_now
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DIMENSIONS = ("song", "artist", "genre", "user")
+
+# Rows pulled from the server per fetchmany() call
+SCAN_CHUNK_SIZE = 50000
+
+# ------------------- Listening History Scan -------------------
+def _group_chunk(rows, start_date, dimensions, counts):
+    """Add the (day, hour, dimension, key) play counts of one chunk into counts
+
+    rows are (user_id, song_id, artist_id, genre_id, played_at) tuples; missing
+    artist/genre ids are counted under key 0.
+    """
+    if np is None:
+        for user_id, song_id, artist_id, genre_id, played_at in rows:
+            day = (played_at.date() - start_date).days
+            keys = {"song": song_id, "artist": artist_id or 0, "genre": genre_id or 0, "user": user_id}
+            for dimension in dimensions:
+                counts[dimension][(day, played_at.hour, keys[dimension])] += 1
+        return
+
+    user_ids, song_ids, artist_ids, genre_ids, played_at = zip(*rows)
+    timestamps = np.array(played_at, dtype="datetime64[s]")
+    days = timestamps.astype("datetime64[D]")
+    hours = (timestamps.astype("datetime64[h]") - days).astype(np.int64)
+    slots = (days - np.datetime64(start_date, "D")).astype(np.int64) * 24 + hours
+
+    columns = {
+        "song": song_ids,
+        "artist": artist_ids,
+        "genre": genre_ids,
+        "user": user_ids
+    }
+    for dimension in dimensions:
+        keys = np.array([k or 0 for k in columns[dimension]], dtype=np.int64)
+        # One composite int64 per (slot, key) so grouping is a single np.unique
+        stride = int(keys.max()) + 1
+        codes = slots * stride + keys
+        unique_codes, code_counts = np.unique(codes, return_counts=True)
+        for code, count in zip(unique_codes.tolist(), code_counts.tolist()):
+            slot, key = divmod(code, stride)
+            day, hour = divmod(slot, 24)
+            counts[dimension][(day, hour, key)] += count
+
+def _scan_listening_history(connection, start_date, end_date, dimensions):
+    """Stream Listening_History rows in [start_date, end_date] and group them per hour"""
+    counts = {dimension: Counter() for dimension in dimensions}
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT lh.user_id, lh.song_id, s.artist_id, s.genre_id, lh.played_at
+            FROM Listening_History lh
+            JOIN Songs s ON lh.song_id = s.song_id
+            WHERE lh.played_at >= %s AND lh.played_at < %s
+            """,
+            (start_date, end_date + datetime.timedelta(days=1))
+        )
+        while True:
+            rows = cursor.fetchmany(SCAN_CHUNK_SIZE)
+            if not rows:
+                break
+            _group_chunk(rows, start_date, dimensions, counts)
+    finally:
+        cursor.close()
+    return counts
+
+def _day_spans(days):
+    """Collapse sorted dates into contiguous (first, last) spans"""
+    spans = []
+    for day in days:
+        if spans and day == spans[-1][1] + datetime.timedelta(days=1):
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+    return spans
+
+# ------------------- Rollup Cache -------------------
+def _cached_days(cursor, start_date, end_date):
+    """Dates in the range whose hourly counts are already rolled up"""
+    cursor.execute(
+        "SELECT stat_date FROM Listening_Stats_Days WHERE stat_date BETWEEN %s AND %s",
+        (start_date, end_date)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+def _store_rollup(connection, span_start, counts, days):
+    """Persist hourly counts for completed days and mark them cached"""
+    cursor = connection.cursor()
+    try:
+        for day in days:
+            cursor.execute("DELETE FROM Listening_Stats_Hourly WHERE stat_date = %s", (day,))
+
+        day_set = set(days)
+        day_totals = Counter()
+        rows = []
+        for dimension, dimension_counts in counts.items():
+            for (day_offset, hour, key), plays in dimension_counts.items():
+                day = span_start + datetime.timedelta(days=day_offset)
+                if day in day_set:
+                    rows.append((day, hour, dimension, key, plays))
+                    if dimension == "song":
+                        day_totals[day] += plays
+
+        if rows:
+            cursor.executemany(
+                "INSERT INTO Listening_Stats_Hourly (stat_date, stat_hour, dimension, key_id, play_count) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                rows
+            )
+        cursor.executemany(
+            "REPLACE INTO Listening_Stats_Days (stat_date, play_count) VALUES (%s, %s)",
+            [(day, day_totals[day]) for day in days]
+        )
+        connection.commit()
+    finally:
+        cursor.close()
+
+def _load_rollup(cursor, start_date, end_date, dimensions):
+    """Read cached hourly counts for a date range"""
+    placeholders = ", ".join(["%s"] * len(dimensions))
+    cursor.execute(
+        f"""
+        SELECT stat_date, stat_hour, dimension, key_id, play_count
+        FROM Listening_Stats_Hourly
+        WHERE stat_date BETWEEN %s AND %s AND dimension IN ({placeholders})
+        """,
+        [start_date, end_date] + list(dimensions)
+    )
+    return cursor.fetchall()
+
+def forget_rollup_days(cursor, days):
+    """Mark days uncached in the caller's transaction, so the next report rescans them"""
+    days = sorted(set(days))
+    if days:
+        cursor.executemany(
+            "DELETE FROM Listening_Stats_Days WHERE stat_date = %s",
+            [(day,) for day in days]
+        )
+
+def invalidate_analytics_days(days):
+    """Drop cached rollups for days whose history changed after the fact"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+
+        cursor = connection.cursor()
+        forget_rollup_days(cursor, days)
+        connection.commit()
+        return True
+
+    except mysql.connector.Error as e:
+        print(f"Error invalidating analytics cache: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# ------------------- Name Resolution -------------------
+NAME_QUERIES = {
+    "song": "SELECT song_id, title FROM Songs WHERE song_id IN ({})",
+    "artist": "SELECT artist_id, name FROM Artists WHERE artist_id IN ({})",
+    "genre": "SELECT genre_id, name FROM Genres WHERE genre_id IN ({})",
+    "user": "SELECT user_id, CONCAT(first_name, ' ', last_name) FROM Users WHERE user_id IN ({})"
+}
+
+def _resolve_names(cursor, dimension, key_ids):
+    """Map ids of one dimension to display names"""
+    names = {0: "Unknown"}
+    key_ids = [key for key in key_ids if key]
+    for i in range(0, len(key_ids), 1000):
+        chunk = key_ids[i:i + 1000]
+        cursor.execute(NAME_QUERIES[dimension].format(", ".join(["%s"] * len(chunk))), chunk)
+        names.update(dict(cursor.fetchall()))
+    return names
+
+# ------------------- Analytics Report -------------------
+def get_listening_analytics(start_date, end_date, dimensions=DIMENSIONS, granularity="daily"):
+    """Play counts per period and song/artist/genre/user between two dates (inclusive)
+
+    Returns dicts with period (datetime), dimension, key_id, name and plays,
+    ordered by period and descending plays.
+    """
+    try:
+        connection = connect_db()
+        if not connection:
+            return []
+
+        cursor = connection.cursor()
+        # The server's date, which stamps played_at, not this machine's
+        today = database_now(cursor).date()
+
+        cached = _cached_days(cursor, start_date, end_date)
+        missing = []
+        day = start_date
+        while day <= end_date:
+            # Today is still receiving plays, so it is never served from cache
+            if day not in cached or day >= today:
+                missing.append(day)
+            day += datetime.timedelta(days=1)
+
+        totals = Counter()
+        for span_start, span_end in _day_spans(missing):
+            # Scan completed days for every dimension so the rollup is reusable
+            scan_dimensions = DIMENSIONS if span_start < today else dimensions
+            counts = _scan_listening_history(connection, span_start, span_end, scan_dimensions)
+
+            completed = [d for d in missing if span_start <= d <= span_end and d < today]
+            if completed:
+                _store_rollup(connection, span_start, counts, completed)
+
+            for dimension in dimensions:
+                for (day_offset, hour, key), plays in counts[dimension].items():
+                    day = span_start + datetime.timedelta(days=day_offset)
+                    totals[(day, hour, dimension, key)] += plays
+
+        missing_set = set(missing)
+        for stat_date, stat_hour, dimension, key_id, play_count in _load_rollup(cursor, start_date, end_date, dimensions):
+            if stat_date not in missing_set:
+                totals[(stat_date, stat_hour, dimension, key_id)] += play_count
+
+        if granularity == "daily":
+            daily = Counter()
+            for (day, hour, dimension, key), plays in totals.items():
+                daily[(day, 0, dimension, key)] += plays
+            totals = daily
+
+        names = {}
+        for dimension in dimensions:
+            key_ids = sorted({key for (_, _, dim, key) in totals if dim == dimension})
+            names[dimension] = _resolve_names(cursor, dimension, key_ids)
+
+        rows = [
+            {
+                "period": datetime.datetime.combine(day, datetime.time(hour)),
+                "dimension": dimension,
+                "key_id": key,
+                "name": names[dimension].get(key, "Unknown"),
+                "plays": plays
+            } for (day, hour, dimension, key), plays in totals.items()
+        ]
+        rows.sort(key=lambda row: (row["period"], row["dimension"], -row["plays"]))
+        return rows
+
+    except mysql.connector.Error as e:
+        print(f"Error computing listening analytics: {e}")
+        return []
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
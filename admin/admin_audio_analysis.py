@@ -0,0 +1,277 @@
+"""
+Audio analysis for the Admin section of the Online Music Player application.
+Each uploaded song is decoded once by ffmpeg in a background worker; while
+the samples stream past, ffmpeg's ebur128 filter measures integrated
+loudness and NumPy collects per-hop peaks and energies. From those the
+worker derives the exact duration, a uint8 waveform for seek bars,
+ReplayGain and an estimated BPM, stored in Song_Analysis so the player never
+has to touch the audio blob for them.
+"""
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import APP_CONFIG
+from db_utils import connect_db
+from blob_store import iter_blob_chunks
+from active_catalog import refresh_active_songs
+from db_cache import invalidate_songs
+from playlist_store import set_song_duration
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SAMPLE_RATE = 22050
+HOP_SIZE = 512
+READ_HOPS = 256
+WAVEFORM_POINTS = 400
+
+# ReplayGain 2.0 reference level
+REPLAYGAIN_REFERENCE_LUFS = -18.0
+
+MIN_BPM = 60
+MAX_BPM = 200
+
+_executor = None
+
+# ------------------- Decoding -------------------
+def _ffmpeg_path():
+    """Configured ffmpeg binary"""
+    return APP_CONFIG.get("ffmpeg_path", "ffmpeg")
+
+def _decode_hops(source_path):
+    """Decode to mono float32 once, returning (sample count, per-hop peaks, per-hop energies, LUFS)
+
+    Only one READ_HOPS block of samples is held at a time.
+    """
+    command = [
+        _ffmpeg_path(), "-hide_banner", "-nostats",
+        "-i", source_path, "-vn",
+        "-af", f"ebur128=framelog=quiet,aresample={SAMPLE_RATE}",
+        "-ac", "1", "-f", "f32le", "-"
+    ]
+    block_bytes = HOP_SIZE * READ_HOPS * 4
+    peaks, energies = [], []
+    sample_count = 0
+    remainder = b''
+
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log)
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                data = remainder + data
+                usable = len(data) - len(data) % (HOP_SIZE * 4)
+                remainder = data[usable:]
+                if not usable:
+                    continue
+
+                samples = np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, HOP_SIZE)
+                sample_count += samples.size
+                peaks.append(np.abs(samples).max(axis=1))
+                energies.append(np.square(samples, dtype=np.float64).mean(axis=1))
+        finally:
+            process.stdout.close()
+            return_code = process.wait()
+
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, command)
+
+        # A final partial hop still counts towards duration and peak
+        if len(remainder) >= 4:
+            tail = np.frombuffer(remainder[:len(remainder) - len(remainder) % 4], dtype=np.float32)
+            sample_count += tail.size
+            peaks.append(np.abs(tail).max(keepdims=True))
+            energies.append(np.square(tail, dtype=np.float64).mean(keepdims=True))
+
+        log.seek(0)
+        match = re.search(r"I:\s+(-?\d+(?:\.\d+)?) LUFS", log.read().decode("utf-8", "replace"))
+
+    empty = np.zeros(0, dtype=np.float32)
+    return (
+        sample_count,
+        np.concatenate(peaks) if peaks else empty,
+        np.concatenate(energies) if energies else empty,
+        float(match.group(1)) if match else None
+    )
+
+# ------------------- Feature Extraction -------------------
+def _waveform(peaks, points=WAVEFORM_POINTS):
+    """Downsample per-hop peaks to at most points values packed as uint8"""
+    if peaks.size > points:
+        edges = np.linspace(0, peaks.size, points + 1).astype(np.int64)[:-1]
+        peaks = np.maximum.reduceat(peaks, edges)
+    return np.clip(np.round(peaks * 255), 0, 255).astype(np.uint8).tobytes()
+
+def _estimate_bpm(energies):
+    """Tempo from the autocorrelation of the onset-strength envelope, or None"""
+    frame_rate = SAMPLE_RATE / HOP_SIZE
+    min_lag = int(frame_rate * 60 / MAX_BPM)
+    max_lag = int(frame_rate * 60 / MIN_BPM) + 1
+    if energies.size < max_lag * 4:
+        return None
+
+    envelope = np.log(energies + 1e-10)
+    onset = np.maximum(np.diff(envelope), 0)
+    onset -= onset.mean()
+
+    size = 1 << int(2 * onset.size - 1).bit_length()
+    spectrum = np.fft.rfft(onset, size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:max_lag + 2]
+    if autocorrelation[0] <= 0:
+        return None
+    # Beats rarely land on whole hops, so their energy is split across neighbouring lags
+    autocorrelation = np.convolve(autocorrelation, np.ones(3), mode="same")
+
+    lag = min_lag + int(np.argmax(autocorrelation[min_lag:max_lag]))
+    # A beat period also correlates at twice its lag; prefer the faster tempo when it is nearly as strong
+    while lag // 2 >= min_lag:
+        half = lag // 2 - 1 + int(np.argmax(autocorrelation[lag // 2 - 1:lag // 2 + 2]))
+        if autocorrelation[half] < 0.8 * autocorrelation[lag]:
+            break
+        lag = half
+    # Parabolic interpolation around the peak for sub-frame precision
+    if min_lag < lag < max_lag:
+        left, centre, right = autocorrelation[lag - 1:lag + 2]
+        denominator = left - 2 * centre + right
+        if denominator:
+            lag += 0.5 * (left - right) / denominator
+    return round(60 * frame_rate / lag, 1)
+
+def analyze_audio_file(source_path):
+    """Decode one file and return its duration, loudness, peak, BPM and waveform"""
+    sample_count, peaks, energies, lufs = _decode_hops(source_path)
+
+    if lufs is None:
+        # Unweighted fallback when ffmpeg printed no ebur128 summary
+        mean_energy = float(energies.mean()) if energies.size else 0.0
+        lufs = -0.691 + 10 * np.log10(mean_energy) if mean_energy > 0 else -70.0
+
+    return {
+        "duration_ms": int(round(sample_count * 1000 / SAMPLE_RATE)),
+        "loudness_lufs": round(float(lufs), 2),
+        "replay_gain_db": round(REPLAYGAIN_REFERENCE_LUFS - float(lufs), 2),
+        "sample_peak": round(float(peaks.max()), 4) if peaks.size else 0.0,
+        "bpm": _estimate_bpm(energies),
+        "waveform": _waveform(peaks)
+    }
+
+# ------------------- Storage -------------------
+def analyze_song(song_id, source_path):
+    """Analyze a song and store the result; returns the analysis dict or None"""
+    try:
+        analysis = analyze_audio_file(source_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error analyzing song {song_id}: {e}")
+        return None
+
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            REPLACE INTO Song_Analysis
+                (song_id, duration_ms, loudness_lufs, replay_gain_db, sample_peak, bpm, waveform)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            (song_id, analysis["duration_ms"], analysis["loudness_lufs"], analysis["replay_gain_db"],
+             analysis["sample_peak"], analysis["bpm"], analysis["waveform"])
+        )
+        # Replace the mutagen estimate (or the 180 s default) with the decoded length;
+        # the playlists holding the song keep their total_duration in step
+        if analysis["duration_ms"]:
+            set_song_duration(connection, song_id, round(analysis["duration_ms"] / 1000))
+            refresh_active_songs(cursor, [song_id])
+        connection.commit()
+        invalidate_songs([song_id])
+        return analysis
+
+    except mysql.connector.Error as e:
+        print(f"Error storing analysis for song {song_id}: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# ------------------- Worker Pool -------------------
+def analysis_available():
+    """Whether both NumPy and ffmpeg are present"""
+    return np is not None and shutil.which(_ffmpeg_path()) is not None
+
+def _get_executor():
+    """Shared analysis pool, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=APP_CONFIG.get("analysis_workers", 1),
+            thread_name_prefix="analysis"
+        )
+    return _executor
+
+def queue_analysis(song_id, source_path):
+    """Analyze a freshly uploaded song in the background; returns a Future or None"""
+    if not analysis_available():
+        return None
+    return _get_executor().submit(analyze_song, song_id, source_path)
+
+def analyze_missing_songs(limit=None):
+    """Backfill analysis for songs uploaded before it existed; returns the number processed"""
+    if not analysis_available():
+        print("NumPy or ffmpeg not found; skipping audio analysis backfill")
+        return 0
+
+    try:
+        connection = connect_db()
+        if not connection:
+            return 0
+
+        cursor = connection.cursor()
+        query = """
+        SELECT s.song_id, s.file_type, s.content_hash
+        FROM Songs s
+        WHERE s.content_hash IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM Song_Analysis sa WHERE sa.song_id = s.song_id)
+        ORDER BY s.song_id
+        """
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        cursor.execute(query)
+        songs = cursor.fetchall()
+
+        os.makedirs(APP_CONFIG["temp_dir"], exist_ok=True)
+        for song_id, file_type, content_hash in songs:
+            fd, source_path = tempfile.mkstemp(suffix=f".{file_type}", dir=APP_CONFIG["temp_dir"])
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    for chunk in iter_blob_chunks(cursor, content_hash):
+                        file.write(chunk)
+                analyze_song(song_id, source_path)
+            finally:
+                os.remove(source_path)
+
+        return len(songs)
+
+    except mysql.connector.Error as e:
+        print(f"Error backfilling audio analysis: {e}")
+        return 0
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
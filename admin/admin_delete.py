@@ -0,0 +1,181 @@
+"""
+Bulk song deletion for the Admin section of the Online Music Player application.
+delete_songs only hides the songs, in one short transaction: they turn
+inactive, leave every playlist (and its summary) and the active catalog,
+and are queued in Song_Deletions. A single background worker then purges
+their listening history delete_batch_size rows per transaction, deletes the
+song rows (favorites, renditions, analysis and stats cascade through the
+foreign keys), releases their blobs and reclaims the unreferenced ones a
+few chunks at a time, so no statement holds locks long enough to stall
+concurrent plays. Deletions a closed session left queued are picked up by
+resume_song_deletions.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import APP_CONFIG
+from db_utils import connect_db
+from blob_store import release_blob, reclaim_blobs
+from db_cache import invalidate_songs
+from playlist_store import remove_song_from_all_playlists
+from active_catalog import refresh_active_songs
+from admin_analytics import forget_rollup_days
+
+# Songs hidden or deleted per transaction
+SONG_BATCH = 100
+
+_executor = None
+
+# ------------------- Queueing -------------------
+def delete_songs(song_ids):
+    """Hide songs at once and queue the rest of their deletion
+
+    Returns the Future of the background purge, or None when the songs
+    could not be queued.
+    """
+    song_ids = sorted({int(song_id) for song_id in song_ids})
+    if not song_ids:
+        return None
+
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor()
+        for i in range(0, len(song_ids), SONG_BATCH):
+            chunk = song_ids[i:i + SONG_BATCH]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"UPDATE Songs SET is_active = 0 WHERE song_id IN ({placeholders})", chunk)
+        for song_id in song_ids:
+            # Keeps the playlist summaries right as well
+            remove_song_from_all_playlists(connection, song_id)
+        refresh_active_songs(cursor, song_ids)
+        cursor.executemany(
+            "INSERT IGNORE INTO Song_Deletions (song_id) VALUES (%s)",
+            [(song_id,) for song_id in song_ids]
+        )
+        connection.commit()
+        invalidate_songs(song_ids)
+
+    except mysql.connector.Error as e:
+        print(f"Error deleting songs: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    return _get_executor().submit(purge_deleted_songs)
+
+def pending_deletions():
+    """Number of songs hidden but not yet purged"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return 0
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Song_Deletions")
+        return cursor.fetchone()[0]
+
+    except mysql.connector.Error as e:
+        print(f"Error counting pending deletions: {e}")
+        return 0
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# ------------------- Purging -------------------
+def _purge_history(connection, cursor, song_ids, batch_size, pause):
+    """Delete the songs' plays batch_size rows per transaction (idx_history_song_id)
+
+    Cached analytics rollups of the days those plays were on are dropped
+    with each batch, so reports stop counting them.
+    """
+    placeholders = ", ".join(["%s"] * len(song_ids))
+    while True:
+        cursor.execute(
+            f"SELECT history_id, played_at FROM Listening_History WHERE song_id IN ({placeholders}) LIMIT %s",
+            song_ids + [batch_size]
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        history_ids = [history_id for history_id, _ in rows]
+        cursor.execute(
+            f"DELETE FROM Listening_History WHERE history_id IN ({', '.join(['%s'] * len(history_ids))})",
+            history_ids
+        )
+        forget_rollup_days(cursor, [played_at.date() for _, played_at in rows])
+        connection.commit()
+        if pause:
+            time.sleep(pause)
+
+def purge_deleted_songs():
+    """Finish every queued deletion; returns the number of songs deleted"""
+    batch_size = APP_CONFIG.get("delete_batch_size", 1000)
+    pause = APP_CONFIG.get("delete_batch_pause", 0.05)
+    deleted = 0
+    try:
+        connection = connect_db()
+        if not connection:
+            return 0
+
+        cursor = connection.cursor()
+        while True:
+            cursor.execute("SELECT song_id FROM Song_Deletions ORDER BY song_id LIMIT %s", (SONG_BATCH,))
+            song_ids = [row[0] for row in cursor.fetchall()]
+            if not song_ids:
+                break
+
+            # History first, so deleting the songs has only a few plays left to cascade
+            _purge_history(connection, cursor, song_ids, batch_size, pause)
+
+            placeholders = ", ".join(["%s"] * len(song_ids))
+            cursor.execute(
+                f"SELECT content_hash FROM Songs WHERE song_id IN ({placeholders}) "
+                f"UNION ALL SELECT content_hash FROM Song_Renditions WHERE song_id IN ({placeholders})",
+                song_ids + song_ids
+            )
+            blob_hashes = [row[0] for row in cursor.fetchall()]
+
+            # Song_Deletions rows go with the songs via ON DELETE CASCADE
+            cursor.execute(f"DELETE FROM Songs WHERE song_id IN ({placeholders})", song_ids)
+            # The original upload and every rendition each hold one blob reference
+            for content_hash in blob_hashes:
+                release_blob(cursor, content_hash)
+            connection.commit()
+            invalidate_songs(song_ids)
+            deleted += len(song_ids)
+
+        reclaim_blobs(connection, pause=pause)
+        return deleted
+
+    except mysql.connector.Error as e:
+        print(f"Error purging deleted songs: {e}")
+        return deleted
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# ------------------- Worker -------------------
+def _get_executor():
+    """Single deletion worker, so purges never run side by side"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="song-delete")
+    return _executor
+
+def resume_song_deletions():
+    """Purge deletions queued by an earlier session (and unreclaimed blobs) in the background"""
+    return _get_executor().submit(purge_deleted_songs)
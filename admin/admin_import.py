@@ -0,0 +1,296 @@
+"""
+Bulk song import for the Admin section of the Online Music Player application.
+Imports a whole music folder: tags, durations and content hashes are
+computed in a process pool, duplicates are dropped by hash, artists/albums/
+genres are created in batches and the audio is written to the shared blob
+store by a bounded number of threads.
+"""
+
+import os
+import sys
+import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import mysql.connector
+import mutagen
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import APP_CONFIG
+from db_utils import connect_db
+from blob_store import hash_audio_file, store_blob
+from active_catalog import refresh_active_songs
+from db_cache import invalidate
+from admin_transcode import queue_transcode
+from admin_audio_analysis import queue_analysis
+
+AUDIO_EXTENSIONS = ('mp3', 'wav', 'flac')
+MAX_FILE_SIZE = 100 * 1024 * 1024
+DEFAULT_DURATION = 180
+
+# ------------------- Metadata Parsing -------------------
+def find_audio_files(root_dir):
+    """List every supported audio file below root_dir"""
+    audio_files = []
+    for dir_path, _, filenames in os.walk(root_dir):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(tuple(f".{ext}" for ext in AUDIO_EXTENSIONS)):
+                audio_files.append(os.path.join(dir_path, filename))
+    return audio_files
+
+def _first_tag(tags, name):
+    """First non-empty value of an easy tag, or None"""
+    if not tags or name not in tags:
+        return None
+    values = [str(v).strip() for v in tags[name] if str(v).strip()]
+    return values[0] if values else None
+
+def read_audio_metadata(file_path):
+    """Parse tags, duration and content hash of one file (runs in a worker process)"""
+    metadata = {
+        "file_path": file_path,
+        "file_type": os.path.splitext(file_path)[1][1:].lower(),
+        "file_size": os.path.getsize(file_path),
+        "title": os.path.splitext(os.path.basename(file_path))[0],
+        "artist": None,
+        "album": None,
+        "genre": None,
+        "duration": DEFAULT_DURATION,
+        "content_hash": None,
+        "audio_fingerprint": None,
+        "error": None
+    }
+
+    try:
+        audio = mutagen.File(file_path, easy=True)
+        if audio is not None:
+            if audio.info and audio.info.length:
+                metadata["duration"] = int(audio.info.length)
+            tags = audio.tags
+            metadata["title"] = _first_tag(tags, "title") or metadata["title"]
+            metadata["artist"] = _first_tag(tags, "artist")
+            metadata["album"] = _first_tag(tags, "album")
+            metadata["genre"] = _first_tag(tags, "genre")
+    except Exception as e:
+        metadata["error"] = str(e)
+
+    if metadata["file_size"] <= MAX_FILE_SIZE:
+        metadata["content_hash"], metadata["audio_fingerprint"] = hash_audio_file(
+            file_path, metadata["file_type"], metadata["duration"]
+        )
+
+    return metadata
+
+# ------------------- Batch Lookups -------------------
+def name_key(name):
+    """Key names are matched by; MySQL's default collation ignores case, so the import does too"""
+    return name.strip().casefold()
+
+def _ensure_names(cursor, table, id_column, names):
+    """Map name_key(name) to ids in Artists/Genres, inserting all missing names in one batch
+
+    Spellings differing only in case or surrounding spaces share one row:
+    an existing row is reused, otherwise the first spelling seen is stored.
+    """
+    spellings = {}
+    for name in names:
+        spellings.setdefault(name_key(name), name.strip())
+    if not spellings:
+        return {}
+
+    def lookup():
+        # Keys are compared in Python: SQLite's LOWER() only folds ASCII and
+        # neither database folds like casefold ("Straße" -> "strasse")
+        cursor.execute(f"SELECT {id_column}, name FROM {table} ORDER BY {id_column}")
+        ids = {}
+        for row_id, name in cursor.fetchall():
+            key = name_key(name)
+            if key in spellings:
+                ids.setdefault(key, row_id)
+        return ids
+
+    ids = lookup()
+    missing = [(spellings[key],) for key in sorted(spellings) if key not in ids]
+    if missing:
+        # A row another import added meanwhile (Genres.name is UNIQUE) is picked up by the re-lookup
+        cursor.executemany(f"INSERT IGNORE INTO {table} (name) VALUES (%s)", missing)
+        ids = lookup()
+    return ids
+
+def _ensure_albums(cursor, albums):
+    """Map (name_key(title), artist_id) pairs to album ids, inserting missing ones in one batch"""
+    spellings = {}
+    for title, artist_id in albums:
+        spellings.setdefault((name_key(title), artist_id), (title.strip(), artist_id))
+    if not spellings:
+        return {}
+
+    def lookup():
+        # The artists' albums, matched by name_key in Python as in _ensure_names
+        artist_ids = sorted({artist_id for _, artist_id in spellings})
+        placeholders = ", ".join(["%s"] * len(artist_ids))
+        cursor.execute(
+            f"SELECT album_id, title, artist_id FROM Albums WHERE artist_id IN ({placeholders}) ORDER BY album_id",
+            artist_ids
+        )
+        ids = {}
+        for album_id, title, artist_id in cursor.fetchall():
+            key = (name_key(title), artist_id)
+            if key in spellings:
+                ids.setdefault(key, album_id)
+        return ids
+
+    ids = lookup()
+    missing = [spellings[key] for key in sorted(spellings) if key not in ids]
+    if missing:
+        cursor.executemany("INSERT INTO Albums (title, artist_id) VALUES (%s, %s)", missing)
+        ids = lookup()
+    return ids
+
+def _existing_hashes(cursor, content_hashes):
+    """Content hashes among the given ones that are already stored"""
+    content_hashes = sorted(set(content_hashes))
+    existing = set()
+    for i in range(0, len(content_hashes), 1000):
+        chunk = content_hashes[i:i + 1000]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT content_hash FROM Songs WHERE content_hash IN ({placeholders})", chunk)
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+# ------------------- Song Insertion -------------------
+def _insert_song(song):
+    """Store one song on its own connection; returns the new song id"""
+    connection = connect_db()
+    if not connection:
+        raise RuntimeError("Could not connect to database")
+
+    try:
+        cursor = connection.cursor()
+        store_blob(cursor, song["content_hash"], song["file_path"], song["file_size"])
+
+        cursor.execute(
+            """
+            INSERT INTO Songs (title, artist_id, genre_id, album_id, duration, file_data, file_type, file_size,
+                               upload_date, content_hash, audio_fingerprint)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (song["title"], song["artist_id"], song["genre_id"], song["album_id"], song["duration"],
+             b'', song["file_type"], song["file_size"], datetime.datetime.now(),
+             song["content_hash"], song["audio_fingerprint"])
+        )
+        song_id = cursor.lastrowid
+        refresh_active_songs(cursor, [song_id])
+        connection.commit()
+        cursor.close()
+        return song_id
+    finally:
+        connection.close()
+
+# ------------------- Bulk Import -------------------
+def bulk_import_folder(root_dir, default_artist="Unknown Artist", default_genre=None, progress=None):
+    """Import every audio file under root_dir
+
+    progress(stage, done, total) is called as files are parsed ("parsing")
+    and stored ("uploading"); it runs on worker threads, so UI callers must
+    hand the values over to the Tk thread themselves.
+    Returns counts of found, imported, duplicate, skipped and failed files.
+    """
+    def report(stage, done, total):
+        if progress:
+            progress(stage, done, total)
+
+    summary = {"found": 0, "imported": 0, "duplicates": 0, "skipped": 0, "failed": 0, "song_ids": []}
+
+    audio_files = find_audio_files(root_dir)
+    summary["found"] = len(audio_files)
+    if not audio_files:
+        return summary
+
+    # Parse tags and durations in parallel processes
+    songs = []
+    workers = APP_CONFIG.get("import_parse_workers") or os.cpu_count() or 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(read_audio_metadata, path) for path in audio_files]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                metadata = future.result()
+                if metadata["file_size"] > MAX_FILE_SIZE or metadata["file_type"] not in AUDIO_EXTENSIONS:
+                    summary["skipped"] += 1
+                else:
+                    songs.append(metadata)
+            except Exception as e:
+                print(f"Error parsing audio file: {e}")
+                summary["failed"] += 1
+            report("parsing", done, len(audio_files))
+
+    for song in songs:
+        song["artist"] = song["artist"] or default_artist
+        song["genre"] = song["genre"] or default_genre
+
+    # Create artists, genres and albums in batches
+    try:
+        connection = connect_db()
+        if not connection:
+            summary["failed"] += len(songs)
+            return summary
+
+        cursor = connection.cursor()
+        artist_ids = _ensure_names(cursor, "Artists", "artist_id", [s["artist"] for s in songs])
+        genre_ids = _ensure_names(cursor, "Genres", "genre_id", [s["genre"] for s in songs if s["genre"]])
+        album_ids = _ensure_albums(
+            cursor,
+            [(s["album"], artist_ids[name_key(s["artist"])])
+             for s in songs if s["album"] and name_key(s["artist"]) in artist_ids]
+        )
+        connection.commit()
+        for namespace in ("artists", "genres", "albums"):
+            invalidate(namespace)
+
+        existing = _existing_hashes(cursor, [s["content_hash"] for s in songs])
+
+    except mysql.connector.Error as e:
+        print(f"Error preparing bulk import: {e}")
+        summary["failed"] += len(songs)
+        return summary
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    # Drop files whose exact bytes are already in the catalog or repeated within the folder
+    to_insert = []
+    for song in songs:
+        song["artist_id"] = artist_ids.get(name_key(song["artist"]))
+        if song["artist_id"] is None:
+            # The database's collation merged the name with an artist that folds differently
+            print(f"Error importing {song['file_path']}: no artist row for {song['artist']!r}")
+            summary["failed"] += 1
+            continue
+        song["genre_id"] = genre_ids.get(name_key(song["genre"])) if song["genre"] else None
+        song["album_id"] = album_ids.get((name_key(song["album"]), song["artist_id"])) if song["album"] else None
+
+        if song["content_hash"] in existing:
+            summary["duplicates"] += 1
+            continue
+        existing.add(song["content_hash"])
+        to_insert.append(song)
+
+    # Store audio with bounded concurrency: at most N uploads are in flight at once
+    max_uploads = APP_CONFIG.get("import_upload_workers", 4)
+    with ThreadPoolExecutor(max_workers=max_uploads) as executor:
+        futures = {executor.submit(_insert_song, song): song for song in to_insert}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                song = futures[future]
+                song_id = future.result()
+                summary["song_ids"].append(song_id)
+                summary["imported"] += 1
+                queue_transcode(song_id, song["file_path"], song["file_type"])
+                queue_analysis(song_id, song["file_path"])
+            except Exception as e:
+                print(f"Error importing {futures[future]['file_path']}: {e}")
+                summary["failed"] += 1
+            report("uploading", done, len(to_insert))
+
+    return summary
@@ -0,0 +1,213 @@
+"""
+Streaming renditions for the Admin section of the Online Music Player application.
+After upload every song is transcoded in a worker pool to the MP3 bitrates in
+APP_CONFIG["rendition_bitrates"]. Renditions are ordinary content-addressed
+blobs, recorded per song in Song_Renditions, so the player can fetch a small
+stream instead of the original WAV/FLAC.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+import mutagen
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import APP_CONFIG
+from db_utils import connect_db
+from blob_store import hash_audio_file, store_blob, iter_blob_chunks
+
+RENDITION_TYPE = "mp3"
+
+_executor = None
+
+# ------------------- Transcoding -------------------
+def ffmpeg_available():
+    """Whether the configured ffmpeg binary can be found"""
+    return shutil.which(APP_CONFIG.get("ffmpeg_path", "ffmpeg")) is not None
+
+def transcode_file(source_path, bitrate, output_path):
+    """Encode source_path as a constant-bitrate MP3 of bitrate kbps"""
+    command = [
+        APP_CONFIG.get("ffmpeg_path", "ffmpeg"), "-v", "error", "-y",
+        "-i", source_path,
+        "-vn", "-map_metadata", "-1", "-fflags", "+bitexact",
+        "-codec:a", "libmp3lame", "-b:a", f"{bitrate}k",
+        output_path
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+
+def _source_bitrate(source_path):
+    """Bitrate of an audio file in kbps, or None if mutagen cannot tell"""
+    try:
+        audio = mutagen.File(source_path)
+        if audio is not None and getattr(audio.info, "bitrate", 0):
+            return audio.info.bitrate // 1000
+    except Exception as e:
+        print(f"Warning: Could not read bitrate: {e}")
+    return None
+
+def _wanted_bitrates(file_type, source_path):
+    """Rendition bitrates worth producing; an MP3 is never re-encoded at or above its own bitrate"""
+    bitrates = APP_CONFIG.get("rendition_bitrates", ())
+    if file_type == RENDITION_TYPE:
+        source_bitrate = _source_bitrate(source_path)
+        if source_bitrate:
+            return [bitrate for bitrate in bitrates if bitrate < source_bitrate]
+    return list(bitrates)
+
+def _shared_rendition(cursor, song_id, bitrate):
+    """A rendition already made for another song with identical source bytes"""
+    cursor.execute(
+        """
+        SELECT r.content_hash, r.file_size
+        FROM Songs s
+        JOIN Songs other ON other.content_hash = s.content_hash AND other.song_id <> s.song_id
+        JOIN Song_Renditions r ON r.song_id = other.song_id AND r.bitrate = %s
+        WHERE s.song_id = %s
+        LIMIT 1
+        """,
+        (bitrate, song_id)
+    )
+    return cursor.fetchone()
+
+def _record_rendition(cursor, song_id, bitrate, content_hash, file_size):
+    """Store the song -> rendition row"""
+    cursor.execute(
+        """
+        INSERT INTO Song_Renditions (song_id, bitrate, file_type, file_size, content_hash)
+        VALUES (%s, %s, %s, %s, %s)
+        """,
+        (song_id, bitrate, RENDITION_TYPE, file_size, content_hash)
+    )
+
+def transcode_song(song_id, source_path, file_type):
+    """Produce and store every missing rendition of one song; returns the bitrates added"""
+    added = []
+    try:
+        connection = connect_db()
+        if not connection:
+            return added
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT bitrate FROM Song_Renditions WHERE song_id = %s", (song_id,))
+        existing = {row[0] for row in cursor.fetchall()}
+
+        for bitrate in _wanted_bitrates(file_type, source_path):
+            if bitrate in existing:
+                continue
+
+            # Identical uploads share their renditions instead of re-encoding
+            shared = _shared_rendition(cursor, song_id, bitrate)
+            if shared:
+                cursor.execute(
+                    "UPDATE Song_Blobs SET ref_count = ref_count + 1 WHERE content_hash = %s",
+                    (shared[0],)
+                )
+                _record_rendition(cursor, song_id, bitrate, shared[0], shared[1])
+                connection.commit()
+                added.append(bitrate)
+                continue
+
+            fd, output_path = tempfile.mkstemp(suffix=f".{RENDITION_TYPE}", dir=APP_CONFIG["temp_dir"])
+            os.close(fd)
+            try:
+                transcode_file(source_path, bitrate, output_path)
+                file_size = os.path.getsize(output_path)
+                content_hash, _ = hash_audio_file(output_path, RENDITION_TYPE, 0)
+                store_blob(cursor, content_hash, output_path, file_size)
+                _record_rendition(cursor, song_id, bitrate, content_hash, file_size)
+                connection.commit()
+                added.append(bitrate)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"Error transcoding song {song_id} to {bitrate} kbps: {e}")
+                connection.rollback()
+            finally:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+
+        return added
+
+    except mysql.connector.Error as e:
+        print(f"Error storing renditions for song {song_id}: {e}")
+        return added
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# ------------------- Worker Pool -------------------
+def _get_executor():
+    """Shared transcoding pool, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=APP_CONFIG.get("transcode_workers", 2),
+            thread_name_prefix="transcode"
+        )
+    return _executor
+
+def queue_transcode(song_id, source_path, file_type):
+    """Transcode a freshly uploaded song in the background
+
+    Returns a Future, or None when ffmpeg is not installed (songs then play
+    from their original upload).
+    """
+    if not APP_CONFIG.get("rendition_bitrates") or not ffmpeg_available():
+        return None
+    os.makedirs(APP_CONFIG["temp_dir"], exist_ok=True)
+    return _get_executor().submit(transcode_song, song_id, source_path, file_type)
+
+def transcode_missing_renditions(limit=None):
+    """Backfill renditions for songs uploaded before transcoding existed
+
+    Each source is copied out of the blob store into a temp file first.
+    Returns the number of songs processed.
+    """
+    if not ffmpeg_available():
+        print("ffmpeg not found; skipping rendition backfill")
+        return 0
+
+    try:
+        connection = connect_db()
+        if not connection:
+            return 0
+
+        cursor = connection.cursor()
+        query = """
+        SELECT s.song_id, s.file_type, s.content_hash
+        FROM Songs s
+        WHERE s.content_hash IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM Song_Renditions r WHERE r.song_id = s.song_id)
+        ORDER BY s.song_id
+        """
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        cursor.execute(query)
+        songs = cursor.fetchall()
+
+        os.makedirs(APP_CONFIG["temp_dir"], exist_ok=True)
+        for song_id, file_type, content_hash in songs:
+            fd, source_path = tempfile.mkstemp(suffix=f".{file_type}", dir=APP_CONFIG["temp_dir"])
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    for chunk in iter_blob_chunks(cursor, content_hash):
+                        file.write(chunk)
+                transcode_song(song_id, source_path, file_type)
+            finally:
+                os.remove(source_path)
+
+        return len(songs)
+
+    except mysql.connector.Error as e:
+        print(f"Error backfilling renditions: {e}")
+        return 0
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
@@ -13,11 +13,26 @@ from mutagen.flac import FLAC
 from mutagen.wave import WAVE
 import uuid
 import re
+import threading
+import queue
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_store import hash_audio_file, find_duplicate_song, store_blob
+from db_cache import get_cached_artists, get_cached_genres, find_cached_album, invalidate, invalidate_songs
+from active_catalog import refresh_active_songs
 
 # Import from other modules
 try:
     from db_config import UI_CONFIG, COLORS, APP_CONFIG
     from db_utils import connect_db, hash_password, ensure_directories_exist, generate_report, open_file, get_admin_info, format_file_size
+    from report_catalog import get_recent_reports, apply_retention_policy
+    from admin_analytics import get_listening_analytics
+    from admin_import import bulk_import_folder
+    from admin_transcode import queue_transcode
+    from admin_audio_analysis import queue_analysis
+    from admin_delete import delete_songs, resume_song_deletions
     USE_CONFIG = True
 except ImportError:
     USE_CONFIG = False
@@ -137,8 +152,11 @@ if not USE_CONFIG:
                 cursor.close()
                 connection.close()
                 
-    def generate_report(report_type, data, filename):
+    def generate_report(report_type, data, filename, report_format="csv", column_types=None):
         """Generate a CSV report"""
+        if report_format != "csv":
+            print(f"Report format '{report_format}' requires db_utils; only CSV is available")
+            return None
         try:
             os.makedirs("reports", exist_ok=True)
             report_path = os.path.join("reports", filename)
@@ -166,6 +184,28 @@ if not USE_CONFIG:
             print(f"Error generating report: {e}")
             return None
             
+    def get_recent_reports(limit=5):
+        """List the newest CSV reports by modification time"""
+        reports_dir = APP_CONFIG["reports_dir"]
+        report_files = sorted(
+            [f for f in os.listdir(reports_dir) if f.endswith('.csv')],
+            key=lambda x: os.path.getmtime(os.path.join(reports_dir, x)),
+            reverse=True
+        )[:limit]
+        return [{"filename": f} for f in report_files]
+        
+    def apply_retention_policy(max_reports=None, max_age_days=None, archive=None):
+        """Report retention needs the report catalog"""
+        return 0
+        
+    def queue_transcode(song_id, source_path, file_type):
+        """Renditions need the transcoding worker pool; songs play from the original"""
+        return None
+        
+    def queue_analysis(song_id, source_path):
+        """Waveform and loudness analysis needs the analysis worker pool"""
+        return None
+            
     def open_file(file_path):
         """Open a file with the default application"""
         try:
@@ -480,6 +520,7 @@ def get_all_songs():
         JOIN Artists a ON s.artist_id = a.artist_id
         LEFT JOIN Albums al ON s.album_id = al.album_id
         LEFT JOIN Genres g ON s.genre_id = g.genre_id
+        WHERE NOT EXISTS (SELECT 1 FROM Song_Deletions d WHERE d.song_id = s.song_id)  # Being deleted
         ORDER BY s.upload_date DESC
         """
         
@@ -502,35 +543,6 @@ def get_all_songs():
         if 'connection' in locals() and connection and connection.is_connected():
             cursor.close()
             connection.close()
-def delete_song(song_id):
-    """Delete a song from the database"""
-    try:
-        connection = connect_db()
-        if not connection:
-            return False
-            
-        cursor = connection.cursor()
-        
-        tables = [
-            "Playlist_Songs",
-            "User_Favorites",
-            "Listening_History"
-        ]
-        
-        for table in tables:
-            cursor.execute(f"DELETE FROM {table} WHERE song_id = %s", (song_id,))
-        
-        cursor.execute("DELETE FROM Songs WHERE song_id = %s", (song_id,))
-        connection.commit()
-        return True
-        
-    except mysql.connector.Error as e:
-        print(f"Error deleting song: {e}")
-        return False
-    finally:
-        if 'connection' in locals() and connection.is_connected():
-            cursor.close()
-            connection.close()
 
 # ------------------- Navigation Functions -------------------
 def open_admin_login_page():
@@ -1115,7 +1127,9 @@ def toggle_song_active_status(song_id, current_status):
             "UPDATE Songs SET is_active = %s WHERE song_id = %s",
             (new_status, song_id)
         )
+        refresh_active_songs(cursor, [song_id])
         connection.commit()
+        invalidate_songs([song_id])
         return True
         
     except mysql.connector.Error as e:
@@ -1412,6 +1426,17 @@ def create_songs_frame(parent_frame, admin):
         corner_radius=8
     ).pack(side="left", padx=(0, 10))
     
+    ctk.CTkButton(
+        actions_frame,
+        text="📁 Bulk Import",
+        font=("Inter", 14),
+        fg_color=COLORS["secondary"],
+        hover_color=COLORS["secondary_hover"],
+        command=handle_bulk_import,
+        height=40,
+        corner_radius=8
+    ).pack(side="left", padx=(0, 10))
+    
     ctk.CTkButton(
         actions_frame,
         text="🗑 Delete",
@@ -1562,26 +1587,30 @@ def refresh_song_list():
     song_stats_label.configure(text=f"Total Songs: {len(songs)} (Active: {active_count}, Inactive: {inactive_count})")
 
 def confirm_delete_song():
-    """Confirm and delete selected song"""
+    """Confirm and delete the selected songs"""
     selected = songs_tree.selection()
     if not selected:
         messagebox.showwarning("Warning", "Please select a song.")
         return
     
-    song_id = songs_tree.item(selected, 'values')[-1]
-    song_title = songs_tree.item(selected, 'values')[1]
+    song_ids = [songs_tree.item(item, 'values')[-1] for item in selected]
+    if len(selected) == 1:
+        description = f"song '{songs_tree.item(selected[0], 'values')[1]}'"
+    else:
+        description = f"{len(selected)} songs"
     
     confirm = messagebox.askyesno(
         "Confirm Delete",
-        f"Delete song '{song_title}'? This action is irreversible."
+        f"Delete {description}? This action is irreversible."
     )
     
     if confirm:
-        if delete_song(song_id):
-            messagebox.showinfo("Success", f"Song '{song_title}' deleted.")
+        # Listening history and audio are purged in the background
+        if delete_songs(song_ids):
+            messagebox.showinfo("Success", f"Deleted {description}.")
             refresh_song_list()
         else:
-            messagebox.showerror("Error", f"Failed to delete song '{song_title}'.")
+            messagebox.showerror("Error", f"Failed to delete {description}.")
 
 def handle_upload_song():
     """Handle the song upload process"""
@@ -1821,8 +1850,81 @@ def handle_upload_song():
         corner_radius=8
     ).pack(fill="x")
 
+def handle_bulk_import():
+    """Import every song in a folder, showing progress while it runs"""
+    folder = filedialog.askdirectory(title="Select Music Folder")
+    if not folder:
+        return
+    
+    dialog = ctk.CTkToplevel(root)
+    dialog.title("Bulk Import")
+    dialog.geometry("420x200")
+    dialog.transient(root)
+    dialog.grab_set()
+    
+    ctk.CTkLabel(
+        dialog,
+        text="Importing Songs",
+        font=("Inter", 20, "bold"),
+        text_color=COLORS["text"]
+    ).pack(pady=(20, 10))
+    
+    status_label = ctk.CTkLabel(
+        dialog,
+        text="Scanning folder...",
+        font=("Inter", 12),
+        text_color=COLORS["text_secondary"]
+    )
+    status_label.pack(pady=5)
+    
+    progress_bar = ctk.CTkProgressBar(dialog, width=340)
+    progress_bar.pack(pady=10)
+    progress_bar.set(0)
+    
+    # Worker threads post (stage, done, total) here; the Tk loop drains it
+    updates = queue.Queue()
+    
+    def run_import():
+        try:
+            summary = bulk_import_folder(folder, progress=lambda *update: updates.put(update))
+        except Exception as e:
+            print(f"Error during bulk import: {e}")
+            summary = None
+        updates.put(("finished", summary, None))
+    
+    def poll_progress():
+        try:
+            while True:
+                stage, done, total = updates.get_nowait()
+                if stage == "finished":
+                    dialog.destroy()
+                    if done is None:
+                        messagebox.showerror("Error", "Bulk import failed.")
+                    else:
+                        messagebox.showinfo(
+                            "Bulk Import",
+                            f"Found {done['found']} file(s): {done['imported']} imported, "
+                            f"{done['duplicates']} duplicate(s), {done['skipped']} skipped, "
+                            f"{done['failed']} failed."
+                        )
+                    refresh_song_list()
+                    return
+                # Tag parsing fills the first 30% of the bar, uploads the rest
+                if stage == "parsing":
+                    status_label.configure(text=f"Reading tags: {done}/{total}")
+                    progress_bar.set(0.3 * done / max(total, 1))
+                else:
+                    status_label.configure(text=f"Uploading: {done}/{total}")
+                    progress_bar.set(0.3 + 0.7 * done / max(total, 1))
+        except queue.Empty:
+            pass
+        dialog.after(200, poll_progress)
+    
+    threading.Thread(target=run_import, daemon=True).start()
+    poll_progress()
+
 def upload_song(file_path, title, artist_id, genre_id=None, album_id=None):
-    """Upload a song to the database with duplicate detection"""
+    """Upload a song to the database with content-hash duplicate detection"""
     try:
         if not os.path.exists(file_path):
             messagebox.showerror("Error", "File not found.")
@@ -1835,41 +1937,11 @@ def upload_song(file_path, title, artist_id, genre_id=None, album_id=None):
             messagebox.showerror("Error", f"Unsupported file type: {file_type}.")
             return None
         
-        # First database connection - just for checking duplicates
-        duplicate_exists = False
-        duplicate_title = ""
-        
-        # Use a separate try-except block for the duplicate check
-        try:
-            check_conn = connect_db()
-            if check_conn:
-                check_cursor = check_conn.cursor(dictionary=True)
-                check_cursor.execute(
-                    "SELECT song_id, title FROM Songs WHERE title = %s AND artist_id = %s",
-                    (title, artist_id)
-                )
-                existing_song = check_cursor.fetchone()
-                
-                if existing_song:
-                    duplicate_exists = True
-                    duplicate_title = existing_song["title"]
-                
-                check_cursor.close()
-                check_conn.close()
-        except mysql.connector.Error as e:
-            print(f"Error checking for duplicates: {e}")
-            # Continue with upload even if duplicate check fails
+        max_size = 100 * 1024 * 1024
+        if file_size > max_size:
+            messagebox.showerror("Error", f"File too large: {format_file_size(file_size)}.")
+            return None
         
-        # If duplicate found, ask for confirmation
-        if duplicate_exists:
-            confirm = messagebox.askyesno(
-                "Duplicate Song",
-                f"A song with title '{duplicate_title}' by this artist already exists. Upload anyway?",
-                icon='warning'
-            )
-            if not confirm:
-                return None
-                
         # Process audio file
         duration = 180
         try:
@@ -1885,39 +1957,67 @@ def upload_song(file_path, title, artist_id, genre_id=None, album_id=None):
         except Exception as e:
             print(f"Warning: Could not get duration: {e}")
         
-        # Read file data
-        with open(file_path, 'rb') as file:
-            file_data = file.read()
+        # One streaming pass gives both the exact hash and the audio fingerprint
+        content_hash, audio_fingerprint = hash_audio_file(file_path, file_type, duration)
         
-        max_size = 100 * 1024 * 1024
-        if file_size > max_size:
-            messagebox.showerror("Error", f"File too large: {format_file_size(file_size)}.")
-            return None
+        # First database connection - just for checking duplicates (indexed lookups)
+        duplicate = None
+        try:
+            check_conn = connect_db()
+            if check_conn:
+                check_cursor = check_conn.cursor()
+                duplicate = find_duplicate_song(check_cursor, content_hash, audio_fingerprint)
+                check_cursor.close()
+                check_conn.close()
+        except mysql.connector.Error as e:
+            print(f"Error checking for duplicates: {e}")
+            # Continue with upload even if duplicate check fails
         
-        # Second database connection - just for inserting the song
+        # If duplicate found, ask for confirmation
+        if duplicate:
+            _, duplicate_title, exact = duplicate
+            if exact:
+                message = f"This exact file is already stored as '{duplicate_title}'. Add it again? The audio will be shared, not stored twice."
+            else:
+                message = f"This recording matches '{duplicate_title}' (same audio, different tags). Upload anyway?"
+            confirm = messagebox.askyesno("Duplicate Song", message, icon='warning')
+            if not confirm:
+                return None
+        
+        # Second database connection - stores the blob reference and the song together
         insert_conn = connect_db()
         if not insert_conn:
             return None
             
         try:
             insert_cursor = insert_conn.cursor()
+            store_blob(insert_cursor, content_hash, file_path, file_size)
             
             query = """
-            INSERT INTO Songs (title, artist_id, genre_id, album_id, duration, file_data, file_type, file_size, upload_date)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO Songs (title, artist_id, genre_id, album_id, duration, file_data, file_type, file_size,
+                               upload_date, content_hash, audio_fingerprint)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             
-            values = (title, artist_id, genre_id, album_id, duration, file_data, file_type, file_size, datetime.datetime.now())
+            values = (title, artist_id, genre_id, album_id, duration, b'', file_type, file_size,
+                      datetime.datetime.now(), content_hash, audio_fingerprint)
             insert_cursor.execute(query, values)
+            new_song_id = insert_cursor.lastrowid
+            refresh_active_songs(insert_cursor, [new_song_id])
             insert_conn.commit()
             
-            new_song_id = insert_cursor.lastrowid
             insert_cursor.close()
             insert_conn.close()
+            invalidate_songs([new_song_id])
+            
+            # Streaming renditions and waveform/loudness analysis run in the background
+            queue_transcode(new_song_id, file_path, file_type)
+            queue_analysis(new_song_id, file_path)
             
             return new_song_id
         except mysql.connector.Error as e:
             if insert_conn:
+                insert_conn.rollback()
                 insert_conn.close()
             raise e
         
@@ -1933,24 +2033,42 @@ def upload_song(file_path, title, artist_id, genre_id=None, album_id=None):
 def generate_and_open_user_report():
     """Generate a user report and open it"""
     users = get_all_users()
-    
-    report_data = [
-        {
-            'User ID': user['user_id'],
-            'First Name': user['first_name'],
-            'Last Name': user['last_name'],
-            'Email': user['email'],
-            'Admin': 'Yes' if user['is_admin'] else 'No',
-            'Created At': user['created_at'].strftime('%Y-%m-%d %H:%M:%S'),
-            'Playlists': user['playlist_count'],
-            'Plays': user['listening_count']
-        } for user in users
-    ]
+    report_format = get_selected_report_format()
+    column_types = None
+    
+    if report_format == "csv":
+        report_data = [
+            {
+                'User ID': user['user_id'],
+                'First Name': user['first_name'],
+                'Last Name': user['last_name'],
+                'Email': user['email'],
+                'Admin': 'Yes' if user['is_admin'] else 'No',
+                'Created At': user['created_at'].strftime('%Y-%m-%d %H:%M:%S'),
+                'Playlists': user['playlist_count'],
+                'Plays': user['listening_count']
+            } for user in users
+        ]
+    else:
+        # Typed columns for compressed/columnar exports
+        report_data = [
+            {
+                'User ID': user['user_id'],
+                'First Name': user['first_name'],
+                'Last Name': user['last_name'],
+                'Email': user['email'],
+                'Admin': bool(user['is_admin']),
+                'Created At': user['created_at'],
+                'Playlists': user['playlist_count'],
+                'Plays': user['listening_count']
+            } for user in users
+        ]
+        column_types = USER_REPORT_COLUMNS
     
     # Updated filename format
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"report-{timestamp}-users.csv"
-    report_path = generate_report("users", report_data, filename)
+    report_path = generate_report("users", report_data, filename, report_format, column_types)
     
     if report_path:
         messagebox.showinfo("Success", f"Report saved to: {report_path}")
@@ -1961,25 +2079,44 @@ def generate_and_open_user_report():
 def generate_and_open_song_report():
     """Generate a song report and open it"""
     songs = get_all_songs()
-    
-    report_data = [
-        {
-            'Song ID': song['song_id'],
-            'Title': song['title'],
-            'Artist': song['artist_name'],
-            'Album': song.get('album_name', 'N/A'),
-            'Genre': song.get('genre_name', 'N/A'),
-            'Duration': song['duration_formatted'],
-            'File Type': song.get('file_type', 'N/A'),
-            'File Size': song['file_size_formatted'],
-            'Upload Date': song['upload_date'].strftime('%Y-%m-%d %H:%M:%S')
-        } for song in songs
-    ]
+    report_format = get_selected_report_format()
+    column_types = None
+    
+    if report_format == "csv":
+        report_data = [
+            {
+                'Song ID': song['song_id'],
+                'Title': song['title'],
+                'Artist': song['artist_name'],
+                'Album': song.get('album_name', 'N/A'),
+                'Genre': song.get('genre_name', 'N/A'),
+                'Duration': song['duration_formatted'],
+                'File Type': song.get('file_type', 'N/A'),
+                'File Size': song['file_size_formatted'],
+                'Upload Date': song['upload_date'].strftime('%Y-%m-%d %H:%M:%S')
+            } for song in songs
+        ]
+    else:
+        # Typed columns: raw seconds, bytes and timestamps instead of "4:03" / "9.35 MB"
+        report_data = [
+            {
+                'Song ID': song['song_id'],
+                'Title': song['title'],
+                'Artist': song['artist_name'],
+                'Album': song.get('album_name'),
+                'Genre': song.get('genre_name'),
+                'Duration (s)': song['duration'],
+                'File Type': song.get('file_type'),
+                'File Size (bytes)': song['file_size'],
+                'Upload Date': song['upload_date']
+            } for song in songs
+        ]
+        column_types = SONG_REPORT_COLUMNS
     
     # Updated filename format
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"admin-songs-{timestamp}.csv"
-    report_path = generate_report("songs", report_data, filename)
+    report_path = generate_report("songs", report_data, filename, report_format, column_types)
     
     if report_path:
         messagebox.showinfo("Success", f"Report saved to: {report_path}")
@@ -2011,23 +2148,8 @@ def generate_and_open_activity_report():
 
 # ------------------- Artist and Genre Functions -------------------
 def get_artists():
-    """Get list of artists from the database"""
-    try:
-        connection = connect_db()
-        if not connection:
-            return []
-            
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT artist_id, name FROM Artists ORDER BY name")
-        return cursor.fetchall()
-        
-    except mysql.connector.Error as e:
-        print(f"Error fetching artists: {e}")
-        return []
-    finally:
-        if 'connection' in locals() and connection.is_connected():
-            cursor.close()
-            connection.close()
+    """Get list of artists (cached)"""
+    return get_cached_artists()
 
 def add_new_artist(name):
     """Add a new artist to the database"""
@@ -2045,6 +2167,7 @@ def add_new_artist(name):
             
         cursor.execute("INSERT INTO Artists (name) VALUES (%s)", (name,))
         connection.commit()
+        invalidate("artists")
         return cursor.lastrowid
         
     except mysql.connector.Error as e:
@@ -2056,23 +2179,8 @@ def add_new_artist(name):
             connection.close()
 
 def get_genres():
-    """Get list of genres from the database"""
-    try:
-        connection = connect_db()
-        if not connection:
-            return []
-            
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT genre_id, name FROM Genres ORDER BY name")
-        return cursor.fetchall()
-        
-    except mysql.connector.Error as e:
-        print(f"Error fetching genres: {e}")
-        return []
-    finally:
-        if 'connection' in locals() and connection.is_connected():
-            cursor.close()
-            connection.close()
+    """Get list of genres (cached)"""
+    return get_cached_genres()
 
 def add_new_genre(name):
     """Add a new genre to the database"""
@@ -2090,6 +2198,7 @@ def add_new_genre(name):
             
         cursor.execute("INSERT INTO Genres (name) VALUES (%s)", (name,))
         connection.commit()
+        invalidate("genres")
         return cursor.lastrowid
         
     except mysql.connector.Error as e:
@@ -2102,6 +2211,10 @@ def add_new_genre(name):
 
 def get_or_create_album(album_name, artist_id):
     """Get album ID or create a new album"""
+    album_id = find_cached_album(album_name, artist_id)
+    if album_id:
+        return album_id
+
     try:
         connection = connect_db()
         if not connection:
@@ -2122,6 +2235,7 @@ def get_or_create_album(album_name, artist_id):
             (album_name, artist_id)
         )
         connection.commit()
+        invalidate("albums")
         return cursor.lastrowid
         
     except mysql.connector.Error as e:
@@ -2132,6 +2246,55 @@ def get_or_create_album(album_name, artist_id):
             cursor.close()
             connection.close()
 
+# ------------------- Report Format Functions -------------------
+# Display name -> generate_report format
+REPORT_FORMAT_CHOICES = {
+    "CSV": "csv",
+    "CSV (gzip)": "csv.gz",
+    "CSV (zstd)": "csv.zst",
+    "Parquet": "parquet",
+    "Arrow": "arrow"
+}
+
+USER_REPORT_COLUMNS = {
+    'User ID': "int",
+    'First Name': "str",
+    'Last Name': "str",
+    'Email': "str",
+    'Admin': "bool",
+    'Created At': "timestamp",
+    'Playlists': "int",
+    'Plays': "int"
+}
+
+ANALYTICS_REPORT_COLUMNS = {
+    'Period': "timestamp",
+    'Dimension': "str",
+    'Key ID': "int",
+    'Name': "str",
+    'Plays': "int"
+}
+
+SONG_REPORT_COLUMNS = {
+    'Song ID': "int",
+    'Title': "str",
+    'Artist': "str",
+    'Album': "str",
+    'Genre': "str",
+    'Duration (s)': "int",
+    'File Type': "str",
+    'File Size (bytes)': "int",
+    'Upload Date': "timestamp"
+}
+
+report_format_var = None
+
+def get_selected_report_format():
+    """Get the report format chosen on the reports page (CSV by default)"""
+    if report_format_var is None:
+        return "csv"
+    return REPORT_FORMAT_CHOICES.get(report_format_var.get(), "csv")
+
 # ------------------- Reports UI Functions -------------------
 # Continuation from Reports UI Functions
 
@@ -2181,6 +2344,27 @@ def create_reports_frame(parent_frame, admin):
         text_color=COLORS["primary"]
     ).pack(anchor="w", padx=20, pady=(20, 10))
     
+    # Report format selector
+    format_frame = ctk.CTkFrame(reports_frame, fg_color="transparent")
+    format_frame.pack(fill="x", padx=20, pady=(0, 10))
+    
+    ctk.CTkLabel(
+        format_frame,
+        text="Format:",
+        font=("Inter", 14),
+        text_color=COLORS["text"]
+    ).pack(side="left", padx=(10, 10))
+    
+    global report_format_var
+    report_format_var = ctk.StringVar(value="CSV")
+    ctk.CTkOptionMenu(
+        format_frame,
+        variable=report_format_var,
+        values=list(REPORT_FORMAT_CHOICES.keys()),
+        width=160,
+        font=("Inter", 12)
+    ).pack(side="left")
+    
     # Report buttons grid
     reports_grid = ctk.CTkFrame(reports_frame, fg_color="transparent")
     reports_grid.pack(fill="x", padx=20, pady=10)
@@ -2189,6 +2373,7 @@ def create_reports_frame(parent_frame, admin):
         ("Users Report", generate_and_open_user_report, COLORS["primary"]),
         ("Songs Report", generate_and_open_song_report, COLORS["secondary"]),
         #("Activity Report", generate_and_open_activity_report, COLORS["success"])
+        ("Listening Analytics", handle_analytics_report, COLORS["success"])
     ]
     
     for i, (text, command, color) in enumerate(report_buttons):
@@ -2209,22 +2394,38 @@ def create_reports_frame(parent_frame, admin):
     history_frame = ctk.CTkFrame(reports_frame, fg_color=COLORS["content"], corner_radius=8)
     history_frame.pack(fill="x", padx=20, pady=20)
     
+    history_header = ctk.CTkFrame(history_frame, fg_color="transparent")
+    history_header.pack(fill="x", padx=15, pady=(15, 5))
+    
     ctk.CTkLabel(
-        history_frame,
+        history_header,
         text="Recent Reports",
         font=("Inter", 16, "bold"),
         text_color=COLORS["text"]
-    ).pack(anchor="w", padx=15, pady=(15, 5))
+    ).pack(side="left")
+    
+    def clean_up_reports():
+        rotated = apply_retention_policy()
+        messagebox.showinfo("Reports", f"{rotated} old report(s) archived or removed.")
+        show_reports_view()
+    
+    ctk.CTkButton(
+        history_header,
+        text="🧹 Clean Up",
+        font=("Inter", 12),
+        fg_color=COLORS["warning"],
+        hover_color=COLORS["warning_hover"],
+        command=clean_up_reports,
+        width=100,
+        height=28,
+        corner_radius=8
+    ).pack(side="right")
     
     try:
         reports_dir = APP_CONFIG["reports_dir"]
-        report_files = sorted(
-            [f for f in os.listdir(reports_dir) if f.endswith('.csv')],
-            key=lambda x: os.path.getmtime(os.path.join(reports_dir, x)),
-            reverse=True
-        )[:5]
+        recent_reports = get_recent_reports(5)
         
-        if not report_files:
+        if not recent_reports:
             ctk.CTkLabel(
                 history_frame,
                 text="No reports generated yet",
@@ -2232,24 +2433,35 @@ def create_reports_frame(parent_frame, admin):
                 text_color=COLORS["text_secondary"]
             ).pack(pady=20)
         else:
-            for report in report_files:
+            for report in recent_reports:
                 report_item = ctk.CTkFrame(history_frame, fg_color=COLORS["card"], corner_radius=8)
                 report_item.pack(fill="x", pady=5)
                 
                 ctk.CTkLabel(
                     report_item,
-                    text=report,
+                    text=report["filename"],
                     font=("Inter", 14),
                     text_color=COLORS["text"]
                 ).pack(side="left", padx=15, pady=10)
                 
+                if report.get("size_bytes") is not None:
+                    details = format_file_size(report["size_bytes"])
+                    if report.get("row_count", -1) >= 0:
+                        details = f"{report['row_count']} rows | {details}"
+                    ctk.CTkLabel(
+                        report_item,
+                        text=details,
+                        font=("Inter", 12),
+                        text_color=COLORS["text_secondary"]
+                    ).pack(side="left", padx=5)
+                
                 ctk.CTkButton(
                     report_item,
                     text="Open",
                     font=("Inter", 12),
                     fg_color=COLORS["secondary"],
                     hover_color=COLORS["secondary_hover"],
-                    command=lambda r=report: open_file(os.path.join(reports_dir, r)),
+                    command=lambda r=report["filename"]: open_file(os.path.join(reports_dir, r)),
                     width=80,
                     height=28,
                     corner_radius=8
@@ -2277,13 +2489,120 @@ def generate_and_open_activity_report():
     ]
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"admin_activity_{timestamp}.csv"
-    report_path = generate_report("activity", report_data, filename)
+    report_path = generate_report("activity", report_data, filename, get_selected_report_format())
     
     if report_path:
         messagebox.showinfo("Success", f"Report saved to: {report_path}")
         open_file(report_path)
     else:
         messagebox.showerror("Error", "Failed to generate report.")
+def handle_analytics_report():
+    """Ask for a date range and generate a listening analytics report"""
+    dialog = ctk.CTkToplevel(root)
+    dialog.title("Listening Analytics")
+    dialog.geometry("400x420")
+    dialog.transient(root)
+    dialog.grab_set()
+    
+    ctk.CTkLabel(
+        dialog,
+        text="Listening Analytics",
+        font=("Inter", 20, "bold"),
+        text_color=COLORS["text"]
+    ).pack(pady=20)
+    
+    today = datetime.date.today()
+    start_var = ctk.StringVar(value=(today - datetime.timedelta(days=29)).isoformat())
+    end_var = ctk.StringVar(value=today.isoformat())
+    granularity_var = ctk.StringVar(value="Daily")
+    dimension_var = ctk.StringVar(value="All")
+    
+    dimension_choices = {
+        "All": ("song", "artist", "genre", "user"),
+        "Songs": ("song",),
+        "Artists": ("artist",),
+        "Genres": ("genre",),
+        "Users": ("user",)
+    }
+    
+    for label, var in [("Start (YYYY-MM-DD)", start_var), ("End (YYYY-MM-DD)", end_var)]:
+        frame = ctk.CTkFrame(dialog, fg_color="transparent")
+        frame.pack(fill="x", padx=20, pady=5)
+        ctk.CTkLabel(frame, text=label, font=("Inter", 12), width=140).pack(side="left")
+        ctk.CTkEntry(frame, textvariable=var, width=180, font=("Inter", 12)).pack(side="left")
+    
+    for label, var, values in [
+        ("Granularity", granularity_var, ["Daily", "Hourly"]),
+        ("Group by", dimension_var, list(dimension_choices.keys()))
+    ]:
+        frame = ctk.CTkFrame(dialog, fg_color="transparent")
+        frame.pack(fill="x", padx=20, pady=5)
+        ctk.CTkLabel(frame, text=label, font=("Inter", 12), width=140).pack(side="left")
+        ctk.CTkOptionMenu(frame, variable=var, values=values, width=180, font=("Inter", 12)).pack(side="left")
+    
+    def do_generate():
+        try:
+            start_date = datetime.date.fromisoformat(start_var.get().strip())
+            end_date = datetime.date.fromisoformat(end_var.get().strip())
+        except ValueError:
+            messagebox.showwarning("Warning", "Dates must be in YYYY-MM-DD format.")
+            return
+        
+        if start_date > end_date:
+            messagebox.showwarning("Warning", "Start date must be before end date.")
+            return
+        
+        hourly = granularity_var.get() == "Hourly"
+        dialog.config(cursor="wait")
+        dialog.update()
+        
+        rows = get_listening_analytics(
+            start_date,
+            end_date,
+            dimension_choices[dimension_var.get()],
+            "hourly" if hourly else "daily"
+        )
+        report_format = get_selected_report_format()
+        period_format = '%Y-%m-%d %H:00' if hourly else '%Y-%m-%d'
+        
+        report_data = [
+            {
+                'Period': row['period'] if report_format != "csv" else row['period'].strftime(period_format),
+                'Dimension': row['dimension'],
+                'Key ID': row['key_id'],
+                'Name': row['name'],
+                'Plays': row['plays']
+            } for row in rows
+        ]
+        
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"report-{timestamp}-analytics.csv"
+        report_path = generate_report(
+            "analytics",
+            report_data,
+            filename,
+            report_format,
+            ANALYTICS_REPORT_COLUMNS if report_format != "csv" else None
+        )
+        
+        dialog.destroy()
+        if report_path:
+            messagebox.showinfo("Success", f"Report saved to: {report_path}")
+            open_file(report_path)
+        else:
+            messagebox.showerror("Error", "Failed to generate report.")
+    
+    ctk.CTkButton(
+        dialog,
+        text="Generate",
+        font=("Inter", 14),
+        fg_color=COLORS["primary"],
+        hover_color=COLORS["primary_hover"],
+        command=do_generate,
+        height=40,
+        corner_radius=8
+    ).pack(pady=20)
+
 def toggle_active_status(user_id, current_status):
     """Toggle user's active status"""
     try:
@@ -2460,6 +2779,7 @@ def create_main_window():
     admin = get_admin_info()
     if admin:
         show_dashboard_view()
+        resume_song_deletions()
     else:
         root.destroy()
         return
@@ -0,0 +1,286 @@
+"""
+Headless load generator for the Online Music Player application.
+Simulates many listeners against a (benchmark) database by calling the
+users_view data functions from worker threads: searching, playing songs
+with history recording, editing playlists and asking for recommendations.
+Each worker repeatedly picks a listener, acts as them for a short session
+with think time between actions, and records per-operation latency.
+Reports throughput, p50/p99 latency per operation, connection counts
+(client side from db_metrics, server side from Threads_connected) and the
+prepared statement hit rate.
+
+    python benchmarks/load_generator.py --listeners 2000 --concurrency 64 --duration 60
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+
+# Audio and windows are never opened, but users_view initializes the mixer on import
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "users"))
+
+import mysql.connector
+
+from db_config import APP_CONFIG
+import db_metrics
+from db_backend import is_sqlite
+from synthetic_catalog import APP_DATABASE, WORDS, use_database
+
+# Relative frequency of each operation within a session
+DEFAULT_MIX = {"search": 3, "play": 5, "playlist": 2, "recommend": 1}
+
+# ------------------- Operations -------------------
+def _search(users_view, rng, catalog):
+    return users_view.search_songs(rng.choice(WORDS))
+
+def _play(users_view, rng, catalog):
+    song_id = rng.choice(catalog["song_ids"])
+    song_data = users_view.get_song_data(song_id, APP_CONFIG.get("playback_quality"))
+    if not song_data:
+        return False
+    users_view.record_listening_history(song_id)
+    return True
+
+def _playlist(users_view, rng, catalog):
+    playlists = users_view.get_user_playlists()
+    if not playlists:
+        return users_view.create_playlist(f"Load test {rng.randrange(10 ** 6)}")
+
+    playlist_id = rng.choice(playlists)["playlist_id"]
+    songs = users_view.get_playlist_songs(playlist_id)
+    if songs and rng.random() < 0.4:
+        return users_view.remove_song_from_playlist(playlist_id, rng.choice(songs)["song_id"])
+    in_playlist = {song["song_id"] for song in songs}
+    picks = rng.sample(catalog["song_ids"], min(5, len(catalog["song_ids"])))
+    candidates = [song_id for song_id in picks if song_id not in in_playlist]
+    return users_view.add_song_to_playlist(playlist_id, candidates[0]) if candidates else True
+
+def _recommend(users_view, rng, catalog):
+    return users_view.get_recommended_songs()
+
+OPERATIONS = {
+    "search": _search,
+    "play": _play,
+    "playlist": _playlist,
+    "recommend": _recommend
+}
+
+# ------------------- Simulation -------------------
+def load_catalog():
+    """Listener and song ids of the current database"""
+    from db_utils import connect_db
+    connection = connect_db()
+    if not connection:
+        return None
+    cursor = connection.cursor()
+    cursor.execute("SELECT user_id FROM Users WHERE is_active = 1")
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT song_id FROM Songs WHERE is_active = 1")
+    song_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    connection.close()
+    return {"user_ids": user_ids, "song_ids": song_ids}
+
+def _worker(worker_id, users_view, catalog, listeners, mix, deadline, think_ms, seed, samples, lock):
+    """Run sessions of random listeners until the deadline"""
+    from db_utils import set_current_user_id
+    rng = random.Random(seed * 100003 + worker_id)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    local = {name: {"latencies": [], "errors": 0} for name in names}
+
+    while time.monotonic() < deadline:
+        set_current_user_id(str(rng.choice(listeners)))
+        for name in rng.choices(names, weights, k=rng.randint(3, 10)):
+            if time.monotonic() >= deadline:
+                break
+            began = time.perf_counter()
+            try:
+                ok = OPERATIONS[name](users_view, rng, catalog)
+            except Exception as e:
+                print(f"Error in simulated {name}: {e}")
+                ok = False
+            local[name]["latencies"].append((time.perf_counter() - began) * 1000)
+            # The data functions swallow their errors and return False/None
+            if ok is False or ok is None:
+                local[name]["errors"] += 1
+            if think_ms:
+                time.sleep(rng.expovariate(1000.0 / think_ms))
+
+    with lock:
+        for name, result in local.items():
+            samples[name]["latencies"].extend(result["latencies"])
+            samples[name]["errors"] += result["errors"]
+
+def _server_connections():
+    """Threads_connected on the MySQL server, or None (SQLite has no server)"""
+    from db_config import DB_CONFIG
+    if is_sqlite():
+        return None
+    try:
+        # A plain connection so the sampler does not count itself in db_metrics
+        connection = mysql.connector.connect(**DB_CONFIG)
+        cursor = connection.cursor()
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Threads_connected'")
+        row = cursor.fetchone()
+        cursor.close()
+        connection.close()
+        return int(row[1]) if row else None
+    except mysql.connector.Error:
+        return None
+
+def _sample_server(stop, readings, interval=1.0):
+    while not stop.wait(interval):
+        value = _server_connections()
+        if value is not None:
+            readings.append(value)
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def run_load(listeners=1000, concurrency=32, duration=30, think_ms=200, mix=None, seed=42):
+    """Simulate listeners for duration seconds and return the report dict"""
+    import users_view
+
+    catalog = load_catalog()
+    if not catalog or not catalog["user_ids"] or not catalog["song_ids"]:
+        print("The database has no active users or songs; seed it with synthetic_catalog.py first")
+        return None
+
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    simulated = [rng.choice(catalog["user_ids"]) for _ in range(listeners)]
+    samples = {name: {"latencies": [], "errors": 0} for name in mix}
+    lock = threading.Lock()
+
+    db_metrics.reset_metrics()
+    stop_sampler = threading.Event()
+    server_readings = []
+    sampler = threading.Thread(target=_sample_server, args=(stop_sampler, server_readings), daemon=True)
+    sampler.start()
+
+    began = time.monotonic()
+    deadline = began + duration
+    workers = [
+        threading.Thread(
+            target=_worker,
+            args=(i, users_view, catalog, simulated, mix, deadline, think_ms, seed, samples, lock),
+            name=f"listener-{i}",
+            daemon=True
+        )
+        for i in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - began
+    stop_sampler.set()
+
+    operations = {}
+    for name, result in samples.items():
+        latencies = sorted(result["latencies"])
+        operations[name] = {
+            "count": len(latencies),
+            "errors": result["errors"],
+            "throughput_per_s": len(latencies) / elapsed,
+            "p50_ms": _percentile(latencies, 0.5),
+            "p99_ms": _percentile(latencies, 0.99),
+            "max_ms": latencies[-1] if latencies else 0.0
+        }
+
+    metrics = db_metrics.snapshot()
+    connects = metrics["connect"] or {"count": 0, "errors": 0, "sum": 0.0}
+    total = sum(op["count"] for op in operations.values())
+    return {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "backend": APP_CONFIG.get("db_backend", "mysql"),
+            "listeners": listeners,
+            "concurrency": concurrency,
+            "duration_s": elapsed,
+            "think_ms": think_ms,
+            "mix": mix,
+            "seed": seed
+        },
+        "throughput_per_s": total / elapsed,
+        "operations": operations,
+        "connections": {
+            "opened": connects["count"],
+            "failed": connects["errors"],
+            "mean_connect_ms": connects["sum"] / connects["count"] * 1000 if connects["count"] else 0.0,
+            "client_peak_open": metrics["connections"]["peak"],
+            "server_peak_threads_connected": max(server_readings) if server_readings else None,
+            "server_mean_threads_connected": sum(server_readings) / len(server_readings) if server_readings else None
+        },
+        "queries": sum(stats["count"] for stats in metrics["functions"].values()),
+        "prepared_hit_rate": db_metrics.prepared_hit_rate(metrics["statements"])
+    }
+
+def print_report(report):
+    """Human-readable summary of run_load's report"""
+    print(f"\n{report['meta']['concurrency']} workers, {report['meta']['listeners']} listeners, "
+          f"{report['meta']['duration_s']:.1f}s: {report['throughput_per_s']:.1f} ops/s, {report['queries']} queries")
+    print(f"{'operation':<12}{'count':>8}{'errors':>8}{'ops/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, op in report["operations"].items():
+        print(f"{name:<12}{op['count']:>8}{op['errors']:>8}{op['throughput_per_s']:>9.1f}"
+              f"{op['p50_ms']:>10.1f}{op['p99_ms']:>10.1f}{op['max_ms']:>10.1f}")
+    connections = report["connections"]
+    print(f"connections: {connections['opened']} opened ({connections['failed']} failed, "
+          f"{connections['mean_connect_ms']:.1f} ms mean), peak {connections['client_peak_open']} open here, "
+          f"server peak Threads_connected {connections['server_peak_threads_connected']}")
+    if report["prepared_hit_rate"] is not None:
+        print(f"prepared statements: {report['prepared_hit_rate']:.1%} of hot statement runs reused one")
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Simulate concurrent listeners against a benchmark database")
+    parser.add_argument("--database", default="online_music_bench")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"])
+    parser.add_argument("--listeners", type=int, default=1000, help="distinct simulated users")
+    parser.add_argument("--concurrency", type=int, default=32, help="worker threads (simultaneous sessions)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--think-ms", type=float, default=200, help="mean pause between a listener's actions")
+    parser.add_argument("--mix", type=_parse_mix, help="e.g. search=3,play=5,playlist=2,recommend=1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    if args.database == APP_DATABASE:
+        parser.error("refusing to write simulated plays into the application database")
+    use_database(args.database, args.backend)
+    # Simulated plays must not flood the slow-query log of the real app
+    APP_CONFIG["slow_query_log"] = None
+
+    report = run_load(args.listeners, args.concurrency, args.duration, args.think_ms, args.mix, args.seed)
+    if not report:
+        return 1
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
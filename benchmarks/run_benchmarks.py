@@ -0,0 +1,198 @@
+"""
+Benchmarks for the Online Music Player application.
+Seeds a synthetic catalog into a separate database, times the hot data
+functions of the admin and user pages, and writes the results (latency
+percentiles plus queries, rows and bytes per call and the prepared
+statement hit rate from db_metrics) as JSON so runs can be compared.
+
+    python benchmarks/run_benchmarks.py --songs 2000 --users 200 --output before.json
+    python benchmarks/run_benchmarks.py --reuse --output after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+# Audio and windows are never opened, but users_view initializes the mixer on import
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "admin"))
+sys.path.append(os.path.join(ROOT_DIR, "users"))
+
+from db_config import APP_CONFIG
+import db_metrics
+import db_cache
+from synthetic_catalog import (
+    APP_DATABASE, WORDS, add_catalog_arguments, catalog_options,
+    use_database, reset_database, seed_catalog
+)
+
+# ------------------- Cases -------------------
+def build_cases(rng, temp_dir):
+    """(name, function) pairs to time; each function runs one representative call"""
+    import users_view
+    import admin_view
+    from db_utils import connect_db, generate_report, set_current_user_id
+    from users_prefetch import write_song_file
+
+    connection = connect_db()
+    cursor = connection.cursor()
+    cursor.execute("SELECT song_id FROM Songs WHERE is_active = 1")
+    song_ids = [row[0] for row in cursor.fetchall()]
+    # The heaviest listener has the most history for recommendations to scan
+    cursor.execute("SELECT user_id FROM Listening_History GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1")
+    heavy_user = cursor.fetchone()
+    cursor.close()
+    connection.close()
+    set_current_user_id(str(heavy_user[0]) if heavy_user else "1")
+
+    def play_song_data():
+        song_id = rng.choice(song_ids)
+        song_data = users_view.get_song_data(song_id, APP_CONFIG.get("playback_quality"))
+        write_song_file(temp_dir, song_id, song_data)
+
+    def song_report():
+        generate_report("songs", admin_view.get_all_songs(), "bench-songs.csv", "csv")
+
+    return [
+        ("search_songs", lambda: users_view.search_songs(rng.choice(WORDS))),
+        ("get_popular_songs", lambda: users_view.get_popular_songs()),
+        ("get_recommended_songs", lambda: users_view.get_recommended_songs()),
+        ("get_all_users", lambda: admin_view.get_all_users()),
+        ("get_system_stats", lambda: admin_view.get_system_stats()),
+        ("play_song_data", play_song_data),
+        ("generate_report", song_report)
+    ]
+
+# ------------------- Timing -------------------
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def time_case(function, repeat, warmup, cold_cache=False):
+    """Latency statistics (ms) and per-call query counts of one case"""
+    for _ in range(warmup):
+        if cold_cache:
+            db_cache.clear_cache()
+        function()
+
+    db_metrics.reset_metrics()
+    timings = []
+    for _ in range(repeat):
+        if cold_cache:
+            db_cache.clear_cache()
+        began = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - began) * 1000)
+
+    metrics = db_metrics.snapshot()
+    functions = metrics["functions"].values()
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "p95_ms": _percentile(timings, 0.95),
+        "max_ms": timings[-1],
+        "queries_per_call": sum(stats["count"] for stats in functions) / repeat,
+        "rows_per_call": sum(stats["rows"] for stats in functions) / repeat,
+        "bytes_per_call": sum(stats["bytes"] for stats in functions) / repeat,
+        "prepared_hit_rate": db_metrics.prepared_hit_rate(metrics["statements"])
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(previous, current):
+    """Print median latency changes against an earlier results file"""
+    if previous.get("catalog") and current.get("catalog") and previous["catalog"] != current["catalog"]:
+        print("Warning: the catalogs differ, so the comparison is not like for like")
+    print(f"{'case':<24}{'before ms':>12}{'after ms':>12}{'change':>10}")
+    for name, result in current["results"].items():
+        before = previous["results"].get(name)
+        if not before:
+            print(f"{name:<24}{'-':>12}{result['median_ms']:>12.2f}{'new':>10}")
+            continue
+        change = (result["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0.0
+        print(f"{name:<24}{before['median_ms']:>12.2f}{result['median_ms']:>12.2f}{change:>+9.1f}%")
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the hot data functions on a synthetic catalog")
+    add_catalog_arguments(parser)
+    parser.add_argument("--reuse", action="store_true", help="benchmark the existing catalog instead of reseeding")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--cold-cache", action="store_true", help="clear the metadata cache before every call")
+    parser.add_argument("--only", nargs="*", help="case names to run")
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    if args.database == APP_DATABASE:
+        parser.error("refusing to benchmark against the application database")
+
+    use_database(args.database, args.backend)
+    catalog = None
+    if not args.reuse:
+        if not reset_database(args.database):
+            return 1
+        catalog = seed_catalog(**catalog_options(args))
+        if not catalog:
+            return 1
+
+    # Keep reports and song files of the run out of the real directories
+    temp_dir = tempfile.mkdtemp(prefix="music-bench-")
+    APP_CONFIG["reports_dir"] = os.path.join(temp_dir, "reports")
+    APP_CONFIG["temp_dir"] = os.path.join(temp_dir, "temp")
+    APP_CONFIG["slow_query_log"] = None
+
+    rng = random.Random(catalog["seed"] if catalog else 42)
+    results = {}
+    for name, function in build_cases(rng, APP_CONFIG["temp_dir"]):
+        if args.only and name not in args.only:
+            continue
+        results[name] = time_case(function, args.repeat, args.warmup, args.cold_cache)
+        print(f"{name:<24}median {results[name]['median_ms']:8.2f} ms  "
+              f"p95 {results[name]['p95_ms']:8.2f} ms  {results[name]['queries_per_call']:.1f} queries/call")
+
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": APP_CONFIG.get("db_backend", "mysql"),
+            "database": args.database,
+            "cold_cache": args.cold_cache,
+            "warmup": args.warmup
+        },
+        "catalog": catalog,
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(json.load(f), report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
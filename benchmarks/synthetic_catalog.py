@@ -0,0 +1,253 @@
+"""
+Synthetic catalog generator for the Online Music Player benchmarks.
+Seeds a database with users, artists, albums, genres, songs with small
+random audio blobs, playlists and a power-law (Zipf) listening history.
+The same seed and sizes always produce the same catalog, so benchmark runs
+against it are comparable.
+
+    python benchmarks/synthetic_catalog.py --database online_music_bench --songs 2000 --users 200
+"""
+
+import os
+import sys
+import random
+import hashlib
+import tempfile
+import argparse
+from datetime import datetime, timedelta
+import mysql.connector
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import DB_CONFIG, APP_CONFIG
+from db_utils import connect_db, connect_db_server, hash_password
+from blob_store import store_blob
+from playlist_store import append_songs
+from active_catalog import rebuild_active_catalog
+from db_backend import is_sqlite, remove_sqlite_database
+
+CATALOG_DEFAULTS = {
+    "users": 200,
+    "songs": 2000,
+    "artists": None,            # None = one per 10 songs
+    "playlists_per_user": 3,
+    "playlist_size": 20,
+    "plays": 50000,
+    "blob_kb": 16,
+    "zipf_exponent": 1.1,
+    "inactive_ratio": 0.02,
+    "seed": 42
+}
+
+WORDS = [
+    "love", "night", "fire", "heart", "dream", "summer", "rain", "gold", "light", "shadow",
+    "river", "city", "star", "wild", "blue", "road", "dance", "ocean", "storm", "echo",
+    "midnight", "sugar", "silver", "thunder", "paper", "glass", "ghost", "velvet", "neon", "winter"
+]
+
+GENRES = ["Pop", "Rock", "Hip Hop", "Jazz", "Classical", "Electronic", "R&B", "Country",
+          "Metal", "Folk", "Reggae", "Blues"]
+
+BATCH_SIZE = 1000
+PASSWORD = "benchmark"
+
+# The database the application itself uses; benchmarks must never reset it
+APP_DATABASE = DB_CONFIG["database"]
+
+# ------------------- Helpers -------------------
+def _phrase(rng, words):
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(words))
+
+def _zipf_weights(count, exponent):
+    """Weight of rank 1..count under a Zipf distribution"""
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+def _insert_batches(cursor, query, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(query, rows[i:i + BATCH_SIZE])
+
+def _ids(cursor, table, id_column):
+    cursor.execute(f"SELECT {id_column} FROM {table} ORDER BY {id_column}")
+    return [row[0] for row in cursor.fetchall()]
+
+# ------------------- Database -------------------
+def use_database(database, backend=None):
+    """Point every connect_db in this process at another database (and optionally backend)"""
+    if backend:
+        APP_CONFIG["db_backend"] = backend
+    DB_CONFIG["database"] = database
+    # SQLite then uses <database>.db
+    APP_CONFIG["sqlite_path"] = None
+
+def reset_database(database):
+    """Drop and recreate the schema in database using main.create_database"""
+    import main
+    if database == APP_DATABASE:
+        raise ValueError("refusing to reset the application database")
+    use_database(database)
+    if is_sqlite():
+        remove_sqlite_database()
+        return main.create_database()
+
+    connection = connect_db_server()
+    if not connection:
+        return False
+    cursor = connection.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.close()
+    connection.close()
+    return main.create_database()
+
+# ------------------- Seeding -------------------
+def seed_catalog(**options):
+    """Fill the (empty) current database with a synthetic catalog; returns its parameters and row counts"""
+    params = dict(CATALOG_DEFAULTS, **{k: v for k, v in options.items() if v is not None})
+    rng = random.Random(params["seed"])
+    artist_count = params["artists"] or max(params["songs"] // 10, 1)
+    now = datetime.now().replace(microsecond=0)
+
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+        cursor = connection.cursor()
+
+        print(f"Seeding {params['users']} users...")
+        password = hash_password(PASSWORD)
+        _insert_batches(cursor, """
+            INSERT INTO Users (first_name, last_name, email, password, is_admin, secret_key)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """, [
+                (rng.choice(WORDS).capitalize(), rng.choice(WORDS).capitalize(),
+                 f"bench{i}@example.com", password, 1 if i == 0 else 0, hash_password(f"secret{i}"))
+                for i in range(params["users"])
+            ])
+
+        print(f"Seeding {artist_count} artists, albums and {len(GENRES)} genres...")
+        _insert_batches(cursor, "INSERT INTO Genres (name) VALUES (%s)", [(name,) for name in GENRES])
+        _insert_batches(cursor, "INSERT INTO Artists (name) VALUES (%s)",
+                        [(f"{_phrase(rng, 2)} {i}",) for i in range(artist_count)])
+        artist_ids = _ids(cursor, "Artists", "artist_id")
+        genre_ids = _ids(cursor, "Genres", "genre_id")
+        _insert_batches(cursor, "INSERT INTO Albums (title, artist_id, release_year) VALUES (%s, %s, %s)", [
+            (_phrase(rng, 2), artist_id, rng.randint(1970, now.year))
+            for artist_id in artist_ids for _ in range(rng.randint(1, 3))
+        ])
+        cursor.execute("SELECT album_id, artist_id FROM Albums")
+        albums_by_artist = {}
+        for album_id, artist_id in cursor.fetchall():
+            albums_by_artist.setdefault(artist_id, []).append(album_id)
+
+        print(f"Seeding {params['songs']} songs with {params['blob_kb']} KB blobs...")
+        blob_size = params["blob_kb"] * 1024
+        songs = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            blob_path = os.path.join(temp_dir, "blob.mp3")
+            for i in range(params["songs"]):
+                data = rng.randbytes(blob_size)
+                with open(blob_path, "wb") as f:
+                    f.write(data)
+                content_hash = hashlib.sha256(data).hexdigest()
+                store_blob(cursor, content_hash, blob_path, blob_size)
+
+                artist_id = rng.choice(artist_ids)
+                songs.append((
+                    _phrase(rng, rng.randint(1, 3)), artist_id,
+                    rng.choice(albums_by_artist[artist_id]), rng.choice(genre_ids),
+                    rng.randint(120, 360), b'', "mp3", blob_size,
+                    now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399)),
+                    0 if rng.random() < params["inactive_ratio"] else 1,
+                    content_hash
+                ))
+                if len(songs) == BATCH_SIZE or i == params["songs"] - 1:
+                    cursor.executemany("""
+                        INSERT INTO Songs (title, artist_id, album_id, genre_id, duration, file_data,
+                                           file_type, file_size, upload_date, is_active, content_hash)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        """, songs)
+                    connection.commit()
+                    songs = []
+        rebuild_active_catalog(cursor)
+        connection.commit()
+
+        user_ids = _ids(cursor, "Users", "user_id")
+        song_ids = _ids(cursor, "Songs", "song_id")
+
+        print(f"Seeding {params['playlists_per_user']} playlists per user...")
+        for user_id in user_ids:
+            for _ in range(params["playlists_per_user"]):
+                cursor.execute(
+                    "INSERT INTO Playlists (user_id, name, description) VALUES (%s, %s, %s)",
+                    (user_id, _phrase(rng, 2), "Synthetic benchmark playlist")
+                )
+                playlist_id = cursor.lastrowid
+                picked = rng.sample(song_ids, min(params["playlist_size"], len(song_ids)))
+                append_songs(connection, playlist_id, picked)
+        connection.commit()
+
+        # A few heavy listeners and a few hit songs dominate, as in real play logs
+        print(f"Seeding {params['plays']} plays...")
+        listeners = rng.sample(user_ids, len(user_ids))
+        hits = rng.sample(song_ids, len(song_ids))
+        listener_weights = _zipf_weights(len(listeners), params["zipf_exponent"])
+        hit_weights = _zipf_weights(len(hits), params["zipf_exponent"])
+        remaining = params["plays"]
+        while remaining:
+            count = min(remaining, BATCH_SIZE * 10)
+            plays = list(zip(
+                rng.choices(listeners, listener_weights, k=count),
+                rng.choices(hits, hit_weights, k=count),
+                [now - timedelta(seconds=rng.randint(0, 90 * 86400)) for _ in range(count)]
+            ))
+            _insert_batches(cursor,
+                            "INSERT INTO Listening_History (user_id, song_id, played_at) VALUES (%s, %s, %s)",
+                            plays)
+            connection.commit()
+            remaining -= count
+
+        params["artists"] = artist_count
+        return params
+
+    except mysql.connector.Error as e:
+        print(f"Error seeding catalog: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def add_catalog_arguments(parser):
+    """Catalog size options shared by the benchmark scripts"""
+    parser.add_argument("--database", default="online_music_bench",
+                        help="database to (re)create; never use the real one")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"],
+                        help=f"storage backend (default {APP_CONFIG.get('db_backend', 'mysql')})")
+    for name, value in CATALOG_DEFAULTS.items():
+        option = "--" + name.replace("_", "-")
+        parser.add_argument(option, type=float if isinstance(value, float) else int, default=None,
+                            help=f"default {value}")
+
+def catalog_options(args):
+    """Catalog keyword arguments from parsed add_catalog_arguments options"""
+    return {name: getattr(args, name) for name in CATALOG_DEFAULTS}
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Seed a synthetic music catalog")
+    add_catalog_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.database == APP_DATABASE:
+        parser.error("refusing to reset the application database")
+    use_database(args.database, args.backend)
+    if not reset_database(args.database):
+        return 1
+    params = seed_catalog(**catalog_options(args))
+    if not params:
+        return 1
+    print(f"Seeded {args.database}: {params}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Song audio storage for the Online Music Player application.
+Audio bytes live once per distinct SHA-256 in Song_Blobs and are shared by
+every Songs row with that content_hash, with a reference count deciding
+when the bytes can be dropped; reclaim_blobs drops them later, a few chunks
+per transaction. New blobs are streamed into
+Song_Blob_Chunks in fixed-size pieces, so uploads use constant memory and
+no single statement comes near max_allowed_packet. Songs written before
+the blob store keep their audio inline in Songs.file_data until
+migrate_inline_blobs runs.
+"""
+
+import time
+import hashlib
+import struct
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Bytes per Song_Blob_Chunks row; well below the 4 MB max_allowed_packet of older servers.
+# Range reads locate chunks by this size, so changing it means re-chunking stored blobs.
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+# Chunks of an unreferenced blob deleted per reclaim_blobs transaction
+RECLAIM_CHUNKS = 16
+
+# ------------------- Content Hashing -------------------
+def _skip_id3v2(header):
+    """Length of a leading ID3v2 tag in header, or 0"""
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+def _audio_payload_range(file, file_type, file_size):
+    """Byte range holding the audio itself, excluding tags and metadata blocks"""
+    header = file.read(10)
+    start = _skip_id3v2(header)
+    end = file_size
+
+    if file_type == 'mp3':
+        if file_size >= 128:
+            file.seek(file_size - 128)
+            if file.read(3) == b'TAG':
+                end = file_size - 128
+
+    elif file_type == 'flac':
+        file.seek(start)
+        if file.read(4) == b'fLaC':
+            offset = start + 4
+            while True:
+                block_header = file.read(4)
+                if len(block_header) < 4:
+                    break
+                offset += 4 + int.from_bytes(block_header[1:4], 'big')
+                if block_header[0] & 0x80:
+                    break
+                file.seek(offset)
+            start = offset
+
+    elif file_type == 'wav':
+        file.seek(12)
+        offset = 12
+        while offset + 8 <= file_size:
+            file.seek(offset)
+            chunk_id, chunk_size = struct.unpack('<4sI', file.read(8))
+            if chunk_id == b'data':
+                start, end = offset + 8, min(offset + 8 + chunk_size, file_size)
+                break
+            offset += 8 + chunk_size + (chunk_size & 1)
+
+    file.seek(0)
+    return start, max(start, end)
+
+def hash_audio_file(file_path, file_type, duration):
+    """Stream a file once, returning (content_hash, audio_fingerprint)
+
+    content_hash is the SHA-256 of the exact bytes. audio_fingerprint is the
+    duration in seconds plus a SHA-1 of the audio payload only, so copies of
+    the same recording that differ just in their tags still match.
+    """
+    content_hash = hashlib.sha256()
+    payload_hash = hashlib.sha1()
+
+    with open(file_path, 'rb') as file:
+        file.seek(0, 2)
+        file_size = file.tell()
+        file.seek(0)
+        start, end = _audio_payload_range(file, file_type, file_size)
+
+        position = 0
+        while True:
+            chunk = file.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            content_hash.update(chunk)
+            chunk_end = position + len(chunk)
+            if chunk_end > start and position < end:
+                payload_hash.update(chunk[max(start - position, 0):min(end, chunk_end) - position])
+            position = chunk_end
+
+    return content_hash.hexdigest(), f"{int(duration)}:{payload_hash.hexdigest()}"
+
+# ------------------- Duplicate Lookup -------------------
+def find_duplicate_song(cursor, content_hash, audio_fingerprint):
+    """Find a song with identical bytes, else one with the same audio payload
+
+    Returns (song_id, title, exact) or None; both lookups hit an index.
+    """
+    cursor.execute(
+        "SELECT song_id, title FROM Songs WHERE content_hash = %s LIMIT 1",
+        (content_hash,)
+    )
+    row = cursor.fetchone()
+    if row:
+        return row[0], row[1], True
+
+    cursor.execute(
+        "SELECT song_id, title FROM Songs WHERE audio_fingerprint = %s LIMIT 1",
+        (audio_fingerprint,)
+    )
+    row = cursor.fetchone()
+    if row:
+        return row[0], row[1], False
+    return None
+
+# ------------------- Reference Counting -------------------
+def store_blob(cursor, content_hash, file_path, file_size):
+    """Take a reference on the blob for content_hash, uploading the bytes only if new
+
+    The file is streamed into Song_Blob_Chunks one BLOB_CHUNK_SIZE piece at a
+    time; everything happens in the caller's transaction.
+    """
+    cursor.execute(
+        "SELECT ref_count FROM Song_Blobs WHERE content_hash = %s FOR UPDATE",
+        (content_hash,)
+    )
+    row = cursor.fetchone()
+    if row and row[0] > 0:
+        cursor.execute(
+            "UPDATE Song_Blobs SET ref_count = ref_count + 1 WHERE content_hash = %s",
+            (content_hash,)
+        )
+        return False
+
+    if row:
+        # Released and possibly half reclaimed already: store the bytes afresh
+        cursor.execute("DELETE FROM Song_Blob_Chunks WHERE content_hash = %s", (content_hash,))
+        cursor.execute(
+            "UPDATE Song_Blobs SET file_data = '', file_size = %s, ref_count = 1, chunk_count = 0 "
+            "WHERE content_hash = %s",
+            (file_size, content_hash)
+        )
+    else:
+        cursor.execute(
+            "INSERT INTO Song_Blobs (content_hash, file_data, file_size, ref_count, chunk_count) "
+            "VALUES (%s, '', %s, 1, 0)",
+            (content_hash, file_size)
+        )
+
+    chunk_count = 0
+    with open(file_path, 'rb') as file:
+        while True:
+            chunk = file.read(BLOB_CHUNK_SIZE)
+            if not chunk:
+                break
+            cursor.execute(
+                "INSERT INTO Song_Blob_Chunks (content_hash, chunk_index, chunk_data) VALUES (%s, %s, %s)",
+                (content_hash, chunk_count, chunk)
+            )
+            chunk_count += 1
+
+    cursor.execute(
+        "UPDATE Song_Blobs SET chunk_count = %s WHERE content_hash = %s",
+        (chunk_count, content_hash)
+    )
+    return True
+
+def iter_blob_chunks(cursor, content_hash):
+    """Yield the bytes of a blob piece by piece, one chunk row per query"""
+    cursor.execute(
+        "SELECT file_data, chunk_count FROM Song_Blobs WHERE content_hash = %s",
+        (content_hash,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return
+
+    file_data, chunk_count = row
+    # Blobs migrated from inline storage keep their bytes in file_data
+    if not chunk_count:
+        yield file_data
+        return
+
+    for chunk_index in range(chunk_count):
+        cursor.execute(
+            "SELECT chunk_data FROM Song_Blob_Chunks WHERE content_hash = %s AND chunk_index = %s",
+            (content_hash, chunk_index)
+        )
+        yield cursor.fetchone()[0]
+
+def iter_blob_range(cursor, content_hash, start, end):
+    """Yield bytes start..end (inclusive) of a blob, reading only the chunks that cover them"""
+    cursor.execute(
+        "SELECT chunk_count FROM Song_Blobs WHERE content_hash = %s",
+        (content_hash,)
+    )
+    row = cursor.fetchone()
+    if not row or end < start:
+        return
+
+    if not row[0]:
+        # Inline blob: let the server slice it instead of shipping the whole value
+        position = start
+        while position <= end:
+            length = min(BLOB_CHUNK_SIZE, end - position + 1)
+            cursor.execute(
+                "SELECT SUBSTRING(file_data, %s, %s) FROM Song_Blobs WHERE content_hash = %s",
+                (position + 1, length, content_hash)
+            )
+            data = cursor.fetchone()[0]
+            if not data:
+                return
+            yield data
+            position += len(data)
+        return
+
+    for chunk_index in range(start // BLOB_CHUNK_SIZE, end // BLOB_CHUNK_SIZE + 1):
+        cursor.execute(
+            "SELECT chunk_data FROM Song_Blob_Chunks WHERE content_hash = %s AND chunk_index = %s",
+            (content_hash, chunk_index)
+        )
+        chunk = cursor.fetchone()
+        if not chunk:
+            return
+        chunk_start = chunk_index * BLOB_CHUNK_SIZE
+        yield chunk[0][max(start - chunk_start, 0):end - chunk_start + 1]
+
+def release_blob(cursor, content_hash):
+    """Drop one reference on a blob; reclaim_blobs deletes the bytes once none remain"""
+    if not content_hash:
+        return
+    cursor.execute(
+        "UPDATE Song_Blobs SET ref_count = ref_count - 1 WHERE content_hash = %s",
+        (content_hash,)
+    )
+
+def reclaim_blobs(connection, chunks_per_batch=RECLAIM_CHUNKS, pause=0):
+    """Delete the bytes of blobs no song references any more; returns the number of blobs deleted
+
+    A large blob is deleted chunks_per_batch chunks per committed
+    transaction, sleeping pause seconds in between, instead of in one
+    cascade that holds its locks for the whole blob. Every batch re-checks
+    the reference count under the row lock, so a blob that store_blob took
+    up again meanwhile is left alone.
+    """
+    cursor = connection.cursor()
+    reclaimed = 0
+    try:
+        cursor.execute("SELECT content_hash FROM Song_Blobs WHERE ref_count <= 0")
+        for (content_hash,) in cursor.fetchall():
+            while True:
+                cursor.execute(
+                    "SELECT ref_count FROM Song_Blobs WHERE content_hash = %s FOR UPDATE",
+                    (content_hash,)
+                )
+                row = cursor.fetchone()
+                if not row or row[0] > 0:
+                    connection.commit()
+                    break
+
+                cursor.execute(
+                    "SELECT MAX(chunk_index) FROM Song_Blob_Chunks WHERE content_hash = %s",
+                    (content_hash,)
+                )
+                last_chunk = cursor.fetchone()[0]
+                if last_chunk is None:
+                    cursor.execute("DELETE FROM Song_Blobs WHERE content_hash = %s", (content_hash,))
+                    connection.commit()
+                    reclaimed += 1
+                    break
+
+                cursor.execute(
+                    "DELETE FROM Song_Blob_Chunks WHERE content_hash = %s AND chunk_index > %s",
+                    (content_hash, last_chunk - chunks_per_batch)
+                )
+                connection.commit()
+                if pause:
+                    time.sleep(pause)
+        return reclaimed
+    finally:
+        cursor.close()
+
+def migrate_inline_blobs(cursor):
+    """Hash inline Songs.file_data and move it into shared, ref-counted Song_Blobs"""
+    cursor.execute(
+        "UPDATE Songs SET content_hash = SHA2(file_data, 256) "
+        "WHERE content_hash IS NULL AND LENGTH(file_data) > 0"
+    )
+    cursor.execute("""
+    INSERT IGNORE INTO Song_Blobs (content_hash, file_data, file_size, ref_count)
+    SELECT content_hash, file_data, file_size, 0
+    FROM Songs
+    WHERE LENGTH(file_data) > 0
+    """)
+    # Each inline song becomes one more reference, whether its blob is new or not
+    # (a correlated subquery rather than UPDATE ... JOIN, which SQLite lacks)
+    cursor.execute("""
+    UPDATE Song_Blobs
+    SET ref_count = ref_count + (
+        SELECT COUNT(*) FROM Songs s
+        WHERE s.content_hash = Song_Blobs.content_hash AND LENGTH(s.file_data) > 0
+    )
+    WHERE content_hash IN (SELECT content_hash FROM Songs WHERE LENGTH(file_data) > 0)
+    """)
+    cursor.execute("UPDATE Songs SET file_data = '' WHERE LENGTH(file_data) > 0")
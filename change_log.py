@@ -0,0 +1,173 @@
+"""
+Catalog change log for the Online Music Player application.
+Triggers on Songs, Artists, Albums, Genres and Playlists append one
+Change_Log row per inserted, updated or deleted row, so every writer (the
+admin and user apps, imports, migrations) is covered. Versions are the
+log's auto-increment ids. A client remembers the version it has seen and
+asks changes_since for the rows changed after it: the current rows of
+what was inserted or updated and the ids of what was deleted, instead of
+reloading whole tables. The caller owns the connection.
+"""
+
+from datetime import datetime, timedelta
+
+from db_config import APP_CONFIG
+from db_backend import is_sqlite, trigger_exists
+
+# Logged tables: (id column, owner column or None, columns returned for changed rows)
+CHANGE_TABLES = {
+    "Songs": ("song_id", None,
+              "song_id, title, artist_id, album_id, genre_id, duration, file_type, file_size, is_active"),
+    "Artists": ("artist_id", None, "artist_id, name"),
+    "Albums": ("album_id", None, "album_id, title, artist_id"),
+    "Genres": ("genre_id", None, "genre_id, name"),
+    "Playlists": ("playlist_id", "user_id",
+                  "playlist_id, user_id, name, description, created_at, "
+                  "song_count, total_duration, cover_song_ids, last_modified")
+}
+
+# Log entries read per changes_since call
+CHANGE_BATCH = 1000
+
+PRUNED_WATERMARK = "change_log_pruned"
+
+# ------------------- Triggers -------------------
+def _trigger_sql(name, event, table, id_column, owner_column):
+    row = "OLD" if event == "DELETE" else "NEW"
+    operation = "D" if event == "DELETE" else "U"
+    owner = f"{row}.{owner_column}" if owner_column else "NULL"
+    insert = (
+        "INSERT INTO Change_Log (table_name, row_id, owner_id, operation) "
+        f"VALUES ('{table}', {row}.{id_column}, {owner}, '{operation}')"
+    )
+    # SQLite wants the body as a BEGIN ... END block
+    body = f"BEGIN {insert}; END" if is_sqlite() else insert
+    return f"CREATE TRIGGER {name} AFTER {event} ON {table} FOR EACH ROW {body}"
+
+def create_change_triggers(cursor):
+    """Create the Change_Log triggers that are missing"""
+    for table, (id_column, owner_column, _) in CHANGE_TABLES.items():
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            name = f"trg_{table.lower()}_{event.lower()}_log"
+            if not trigger_exists(cursor, name):
+                cursor.execute(_trigger_sql(name, event, table, id_column, owner_column))
+
+# ------------------- Versions -------------------
+def _latest_version(cursor):
+    cursor.execute("SELECT MAX(version) FROM Change_Log")
+    return cursor.fetchone()[0] or 0
+
+def latest_version(connection):
+    """Newest version in the log; read it before a full load and sync from it afterwards"""
+    cursor = connection.cursor()
+    try:
+        return _latest_version(cursor)
+    finally:
+        cursor.close()
+
+def _pruned_version(cursor):
+    cursor.execute("SELECT last_id FROM Stats_Watermarks WHERE name = %s", (PRUNED_WATERMARK,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def database_now(cursor):
+    """The database server's current time, which row timestamps are compared against"""
+    cursor.execute("SELECT NOW()")
+    now = cursor.fetchone()[0]
+    return datetime.fromisoformat(now) if isinstance(now, str) else now
+
+def changes_since(connection, since, tables=None, user_id=None):
+    """Rows of the logged tables changed after version since
+
+    Returns {"version", "reset", "more", "upserts": {table: [row dicts]},
+    "deletes": {table: [ids]}}. Pass "version" back next time; "more"
+    means another call has further changes. "reset" means the entries
+    after since were pruned and the client must reload everything.
+    tables limits the tables looked at, and user_id limits playlists to the
+    user's own.
+
+    An auto-increment version can commit after a higher one, so the
+    returned version stops in front of a gap until the entry after it is
+    change_log_settle_seconds old; entries past the gap are still returned
+    and simply come again next time.
+    """
+    tables = list(tables or CHANGE_TABLES)
+    cursor = connection.cursor()
+    try:
+        result = {"version": since, "reset": False, "more": False, "upserts": {}, "deletes": {}}
+        if since < _pruned_version(cursor):
+            result.update(reset=True, version=_latest_version(cursor))
+            return result
+
+        cursor.execute(
+            """
+            SELECT version, table_name, row_id, owner_id, operation, changed_at
+            FROM Change_Log
+            WHERE version > %s
+            ORDER BY version
+            LIMIT %s
+            """,
+            (since, CHANGE_BATCH)
+        )
+        entries = cursor.fetchall()
+        result["more"] = len(entries) == CHANGE_BATCH
+        if not entries:
+            return result
+
+        settled_before = database_now(cursor) - timedelta(seconds=APP_CONFIG.get("change_log_settle_seconds", 10))
+        expected, blocked = since + 1, False
+        latest = {}
+        for version, table_name, row_id, owner_id, operation, changed_at in entries:
+            if not blocked:
+                if version != expected and changed_at > settled_before:
+                    blocked = True
+                else:
+                    result["version"] = version
+            expected = version + 1
+            if table_name in tables and (user_id is None or owner_id is None or str(owner_id) == str(user_id)):
+                # The last operation on a row wins
+                latest[(table_name, row_id)] = operation
+
+        changed = {}
+        for (table_name, row_id), operation in latest.items():
+            changed.setdefault(table_name, {"U": [], "D": []})[operation].append(row_id)
+
+        for table_name, operations in changed.items():
+            id_column, _, columns = CHANGE_TABLES[table_name]
+            rows = []
+            for i in range(0, len(operations["U"]), CHANGE_BATCH):
+                chunk = operations["U"][i:i + CHANGE_BATCH]
+                cursor.execute(
+                    f"SELECT {columns} FROM {table_name} WHERE {id_column} IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk
+                )
+                names = [description[0] for description in cursor.description]
+                rows += [dict(zip(names, row)) for row in cursor.fetchall()]
+            found = {row[id_column] for row in rows}
+            # Updated and then deleted by entries beyond this batch
+            deleted = operations["D"] + [row_id for row_id in operations["U"] if row_id not in found]
+            if rows:
+                result["upserts"][table_name] = rows
+            if deleted:
+                result["deletes"][table_name] = deleted
+        return result
+    finally:
+        cursor.close()
+
+# ------------------- Retention -------------------
+def prune_change_log(cursor, retention_days=None):
+    """Delete entries older than change_log_retention_days
+
+    Clients that last synced before the pruned versions get reset=True
+    from changes_since and reload everything.
+    """
+    retention_days = retention_days or APP_CONFIG.get("change_log_retention_days", 30)
+    cursor.execute(
+        "SELECT MAX(version) FROM Change_Log WHERE changed_at < %s",
+        (datetime.now().replace(microsecond=0) - timedelta(days=retention_days),)
+    )
+    pruned = cursor.fetchone()[0]
+    if pruned:
+        cursor.execute("DELETE FROM Change_Log WHERE version <= %s", (pruned,))
+        cursor.execute("REPLACE INTO Stats_Watermarks (name, last_id) VALUES (%s, %s)", (PRUNED_WATERMARK, pruned))
+    return pruned or 0
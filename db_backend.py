@@ -0,0 +1,342 @@
+"""
+Storage backends for the Online Music Player application.
+APP_CONFIG["db_backend"] selects MySQL (mysql.connector with DB_CONFIG,
+through a connection pool) or SQLite (a local file in WAL mode). Both are
+used through the same query functions: SQLite connections accept the
+cursor(dictionary=True) calls, %s placeholders and MySQL-flavoured SQL of
+the rest of the app, and raise mysql.connector errors so the existing
+error handling keeps working.
+"""
+
+import os
+import re
+import random
+import hashlib
+import sqlite3
+import threading
+import functools
+from decimal import Decimal
+from datetime import date, datetime
+import mysql.connector
+import mysql.connector.pooling
+
+from db_config import DB_CONFIG, APP_CONFIG
+
+# ------------------- Backend Selection -------------------
+def backend_name():
+    """"mysql" or "sqlite" """
+    return APP_CONFIG.get("db_backend", "mysql")
+
+def is_sqlite():
+    """True when the app runs on the SQLite backend"""
+    return backend_name() == "sqlite"
+
+def sqlite_path():
+    """SQLite database file: APP_CONFIG["sqlite_path"] or <DB_CONFIG database>.db"""
+    return APP_CONFIG.get("sqlite_path") or f"{DB_CONFIG['database']}.db"
+
+# ------------------- MySQL Connection Pool -------------------
+class PooledConnection:
+    """Connection borrowed from the pool; close() ends its transaction and hands it back
+
+    Sessions are not reset between borrowers so prepared statements
+    (db_statements.py) survive, hence the explicit rollback.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        """Roll back anything uncommitted and return the connection to the pool"""
+        try:
+            self._connection.rollback()
+        except mysql.connector.Error:
+            # Unread results or a dead socket: reconnect on the next checkout instead
+            self._connection.disconnect()
+        self._connection.close()
+
+_pool_lock = threading.Lock()
+_pool = None
+_pool_config = None
+_pool_count = 0
+
+def _get_pool():
+    """The pool for the current DB_CONFIG, (re)created when the config changes; None if disabled"""
+    global _pool, _pool_config, _pool_count
+    size = APP_CONFIG.get("db_pool_size")
+    if not size:
+        return None
+    config = dict(DB_CONFIG)
+    with _pool_lock:
+        if _pool is None or _pool_config != config:
+            _pool_count += 1
+            _pool = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name=f"musicplayer{_pool_count}",
+                # mysql.connector caps pools at 32 connections
+                pool_size=min(size, mysql.connector.pooling.CNX_POOL_MAXSIZE),
+                pool_reset_session=False,
+                **config
+            )
+            _pool_config = config
+        return _pool
+
+def connect_mysql():
+    """A pooled MySQL connection, or a new one when the pool is disabled or exhausted"""
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            return PooledConnection(pool.get_connection())
+        except mysql.connector.errors.PoolError:
+            pass
+    return mysql.connector.connect(**DB_CONFIG)
+
+# ------------------- SQL Translation -------------------
+# String literals and comments; everything between them is SQL to rewrite
+_TOKENS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|#[^\n]*|--[ \t][^\n]*")
+
+# A SQLite file is the database itself, so these have nothing to do
+_NO_OP = re.compile(r"\s*(CREATE DATABASE|DROP DATABASE|USE)\b", re.I)
+
+_REWRITES = [
+    (re.compile(r"\bINT AUTO_INCREMENT PRIMARY KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\b(?:LONG|MEDIUM|TINY)BLOB\b", re.I), "BLOB"),
+    (re.compile(r"\bTINYINT\(1\)", re.I), "INTEGER"),
+    (re.compile(r"\bDEFAULT CURRENT_TIMESTAMP\b", re.I), "DEFAULT (datetime('now', 'localtime'))"),
+    (re.compile(r"\bINSERT IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"\s+FOR UPDATE\b", re.I), ""),
+    (re.compile(r"\bSUBSTRING\(", re.I), "substr("),
+    (re.compile(r"%s"), "?")
+]
+
+@functools.lru_cache(maxsize=1024)
+def translate_sql(sql):
+    """MySQL-flavoured SQL as the app writes it -> SQLite SQL ("" for statements with no SQLite equivalent)"""
+    if _NO_OP.match(sql):
+        return ""
+    parts = []
+    position = 0
+    for match in _TOKENS.finditer(sql):
+        parts.append(_rewrite(sql[position:match.start()]))
+        token = match.group(0)
+        if token[0] in "'\"":
+            parts.append(token)
+        position = match.end()
+    parts.append(_rewrite(sql[position:]))
+    return "".join(parts).strip()
+
+def _rewrite(code):
+    for pattern, replacement in _REWRITES:
+        code = pattern.sub(replacement, code)
+    return code
+
+# ------------------- SQLite Connections -------------------
+_ERRORS = [
+    (sqlite3.IntegrityError, mysql.connector.IntegrityError),
+    (sqlite3.OperationalError, mysql.connector.OperationalError),
+    (sqlite3.ProgrammingError, mysql.connector.ProgrammingError),
+    (sqlite3.Error, mysql.connector.DatabaseError)
+]
+
+def _as_mysql_error(error):
+    """The mysql.connector error the query functions already catch"""
+    for sqlite_error, mysql_error in _ERRORS:
+        if isinstance(error, sqlite_error):
+            errno = 1062 if "UNIQUE constraint failed" in str(error) else None
+            return mysql_error(msg=str(error), errno=errno)
+    return mysql.connector.Error(msg=str(error))
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.decode())
+
+def _parse_date(value):
+    return date.fromisoformat(value.decode()[:10])
+
+# Columns declared TIMESTAMP/DATE come back as datetime/date like with MySQL
+sqlite3.register_converter("TIMESTAMP", _parse_timestamp)
+sqlite3.register_converter("DATETIME", _parse_timestamp)
+sqlite3.register_converter("DATE", _parse_date)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, float)
+
+def _concat(*values):
+    return None if any(value is None for value in values) else "".join(str(value) for value in values)
+
+def _sha2(data, bits):
+    if data is None:
+        return None
+    data = data.encode() if isinstance(data, str) else bytes(data)
+    return hashlib.new(f"sha{bits}", data).hexdigest()
+
+class SQLiteCursor:
+    """sqlite3 cursor with the mysql.connector surface the query functions use"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def execute(self, operation, params=None):
+        """Run one statement, translated to SQLite"""
+        sql = translate_sql(operation)
+        if not sql:
+            return None
+        try:
+            self._cursor.execute(sql, tuple(params) if params is not None else ())
+        except sqlite3.Error as e:
+            raise _as_mysql_error(e) from e
+
+    def executemany(self, operation, seq_params):
+        """Run one statement for every parameter tuple"""
+        sql = translate_sql(operation)
+        if not sql:
+            return None
+        try:
+            self._cursor.executemany(sql, [tuple(params) for params in seq_params])
+        except sqlite3.Error as e:
+            raise _as_mysql_error(e) from e
+
+    def fetchone(self):
+        """Next row (a dict for dictionary cursors) or None"""
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        """Up to size rows"""
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        """All remaining rows"""
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        """Close the cursor"""
+        self._cursor.close()
+
+class SQLiteConnection:
+    """sqlite3 connection with the mysql.connector surface the query functions use"""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._open = True
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, dictionary=False, **kwargs):
+        """A cursor; dictionary=True returns rows as dicts. Other mysql.connector options are ignored."""
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def is_connected(self):
+        """True until closed"""
+        return self._open
+
+    def commit(self):
+        """Commit the current transaction"""
+        try:
+            self._connection.commit()
+        except sqlite3.Error as e:
+            raise _as_mysql_error(e) from e
+
+    def rollback(self):
+        """Roll back the current transaction"""
+        self._connection.rollback()
+
+    def close(self):
+        """Close the connection"""
+        self._open = False
+        self._connection.close()
+
+_wal_enabled = set()
+
+def connect_sqlite(path=None):
+    """Open the SQLite database (WAL mode, foreign keys on) as a SQLiteConnection"""
+    path = path or sqlite_path()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = sqlite3.connect(
+            path,
+            timeout=APP_CONFIG.get("sqlite_busy_timeout", 5.0),
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False
+        )
+        if path not in _wal_enabled:
+            # WAL is persistent in the file; readers then never block the writer
+            connection.execute("PRAGMA journal_mode = WAL")
+            _wal_enabled.add(path)
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.create_function("RAND", 0, random.random)
+        connection.create_function("NOW", 0, lambda: datetime.now().isoformat(" ", "seconds"))
+        connection.create_function("CONCAT", -1, _concat)
+        connection.create_function("SHA2", 2, _sha2)
+        return SQLiteConnection(connection)
+    except sqlite3.Error as e:
+        raise _as_mysql_error(e) from e
+
+def remove_sqlite_database(path=None):
+    """Delete the SQLite database file and its WAL/shared-memory files"""
+    path = path or sqlite_path()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    _wal_enabled.discard(path)
+
+# ------------------- Schema Introspection -------------------
+def index_exists(cursor, table, index_name):
+    """Whether table already has index_name"""
+    if is_sqlite():
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+            (table, index_name)
+        )
+    else:
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            """,
+            (table, index_name)
+        )
+    return cursor.fetchone()[0] > 0
+
+def column_exists(cursor, table, column):
+    """Whether table already has column"""
+    if is_sqlite():
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_info(%s) WHERE name = %s", (table, column))
+    else:
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            """,
+            (table, column)
+        )
+    return cursor.fetchone()[0] > 0
+
+def trigger_exists(cursor, trigger_name):
+    """Whether the database already has trigger_name"""
+    if is_sqlite():
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name = %s", (trigger_name,))
+    else:
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.triggers WHERE trigger_schema = DATABASE() AND trigger_name = %s",
+            (trigger_name,)
+        )
+    return cursor.fetchone()[0] > 0
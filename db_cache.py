@@ -0,0 +1,348 @@
+"""
+Metadata cache for the Online Music Player application.
+Keeps small, rarely-changing rows (songs, artists, genres, albums) in
+process memory with a TTL. Admin write paths invalidate what they change
+explicitly. Changes made by other processes (the admin and user apps run
+separately) are picked up from Change_Log every change_sync_interval
+seconds: changed rows are patched into the cache and deleted ones dropped,
+and the TTL only bounds staleness when the log cannot be read. Listing
+queries can select bare song ids and call hydrate_songs to fill in titles
+and names from the cache.
+"""
+
+import time
+import threading
+import mysql.connector
+
+from db_config import APP_CONFIG
+from db_utils import connect_db
+from db_statements import fetch_prepared
+from change_log import changes_since, latest_version
+
+_lock = threading.Lock()
+_entries = {}
+_stats = {}
+_listeners = []
+
+# Lookup maps derived from each cached dimension list: {namespace: (list, maps)}
+_indexes = {}
+
+# Change_Log version the cache reflects (None = not synced yet) and when it was last checked
+_sync_lock = threading.Lock()
+_sync_state = {"version": None, "checked": 0.0}
+
+# Namespaces holding the "all" list of a dimension table, and the key the list is sorted by
+DIMENSIONS = {
+    "Artists": ("artists", "artist_id", "name"),
+    "Genres": ("genres", "genre_id", "name"),
+    "Albums": ("albums", "album_id", None)
+}
+
+# Query loading each dimension list, its id column and the name hydrate_songs copies from it
+DIMENSION_LISTS = {
+    "artists": ("SELECT artist_id, name FROM Artists ORDER BY name", "artist_id", "name"),
+    "genres": ("SELECT genre_id, name FROM Genres ORDER BY name", "genre_id", "name"),
+    "albums": ("SELECT album_id, title, artist_id FROM Albums", "album_id", "title")
+}
+
+# ------------------- Cache Core -------------------
+def _ttl(ttl):
+    """Seconds an entry lives; APP_CONFIG["metadata_cache_ttl"] by default"""
+    return APP_CONFIG.get("metadata_cache_ttl", 300) if ttl is None else ttl
+
+def _count(namespace, outcome, amount=1):
+    stats = _stats.setdefault(namespace, {"hits": 0, "misses": 0})
+    stats[outcome] += amount
+
+def cache_get(namespace, key):
+    """Cached value, or None if missing or expired"""
+    with _lock:
+        entry = _entries.get(namespace, {}).get(key)
+        if entry and entry[0] > time.monotonic():
+            _count(namespace, "hits")
+            return entry[1]
+        _count(namespace, "misses")
+        return None
+
+def cache_set(namespace, key, value, ttl=None):
+    """Store a value for ttl seconds"""
+    with _lock:
+        _entries.setdefault(namespace, {})[key] = (time.monotonic() + _ttl(ttl), value)
+
+def cached(namespace, key, loader, ttl=None):
+    """Read-through lookup: return the cached value or load, store and return it
+
+    None results are not cached so a failed load is retried next time.
+    """
+    value = cache_get(namespace, key)
+    if value is None:
+        value = loader()
+        if value is not None:
+            cache_set(namespace, key, value, ttl)
+    return value
+
+def invalidate(namespace, keys=None):
+    """Drop some keys of a namespace, or the whole namespace, and notify listeners"""
+    with _lock:
+        entries = _entries.get(namespace, {})
+        if keys is None:
+            entries.clear()
+        else:
+            for key in keys:
+                entries.pop(key, None)
+        _indexes.pop(namespace, None)
+    _notify(namespace, keys)
+
+def _notify(namespace, keys):
+    for listener in list(_listeners):
+        try:
+            listener(namespace, keys)
+        except Exception as e:
+            print(f"Error in cache invalidation listener: {e}")
+
+def add_invalidation_listener(listener):
+    """Call listener(namespace, keys) after every invalidation (keys None = everything)"""
+    _listeners.append(listener)
+
+def clear_cache():
+    """Forget every cached entry"""
+    with _lock:
+        _entries.clear()
+        _indexes.clear()
+
+def cache_stats():
+    """Hits, misses and live entries per namespace"""
+    with _lock:
+        return {
+            namespace: dict(stats, entries=len(_entries.get(namespace, {})))
+            for namespace, stats in _stats.items()
+        }
+
+# ------------------- Change Log Sync -------------------
+def _patch_songs(rows):
+    """Replace cached song rows with their new versions (songs not cached stay uncached)"""
+    with _lock:
+        entries = _entries.get("song", {})
+        expires = time.monotonic() + _ttl(None)
+        for row in rows:
+            if row["song_id"] in entries:
+                entries[row["song_id"]] = (expires, row)
+
+def _patch_dimension(table, rows, deleted_ids):
+    """Apply changed and deleted rows to a cached dimension list in place of reloading it"""
+    namespace, id_key, sort_key = DIMENSIONS[table]
+    changed = {row[id_key] for row in rows} | set(deleted_ids)
+    with _lock:
+        entry = _entries.get(namespace, {}).get("all")
+        if entry:
+            patched = [row for row in entry[1] if row[id_key] not in changed] + list(rows)
+            if sort_key:
+                patched.sort(key=lambda row: row[sort_key])
+            _entries[namespace]["all"] = (time.monotonic() + _ttl(None), patched)
+        _indexes.pop(namespace, None)
+
+    if deleted_ids:
+        # Songs.*_id is set to NULL by the foreign key, which logs nothing on MySQL
+        deleted = set(deleted_ids)
+        with _lock:
+            songs = _entries.get("song", {})
+            for song_id in [song_id for song_id, (_, row) in songs.items() if row.get(id_key) in deleted]:
+                del songs[song_id]
+
+def _apply_changes(result):
+    songs = result["upserts"].get("Songs", [])
+    if songs:
+        _patch_songs(songs)
+        _notify("song", [row["song_id"] for row in songs])
+    if result["deletes"].get("Songs"):
+        invalidate("song", result["deletes"]["Songs"])
+
+    for table in DIMENSIONS:
+        rows, deleted_ids = result["upserts"].get(table, []), result["deletes"].get(table, [])
+        if rows or deleted_ids:
+            _patch_dimension(table, rows, deleted_ids)
+            _notify(DIMENSIONS[table][0], None)
+
+def sync_changes(force=False):
+    """Bring the cache up to date with Change_Log, at most every change_sync_interval seconds
+
+    Called by the cached lookups; one query when nothing changed. Skipped
+    while another thread is syncing.
+    """
+    now = time.monotonic()
+    if not force and now - _sync_state["checked"] < APP_CONFIG.get("change_sync_interval", 5):
+        return
+    if not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        _sync_state["checked"] = now
+        connection = connect_db()
+        if not connection:
+            return
+
+        cursor = connection.cursor()
+        if _sync_state["version"] is None:
+            # Entries cached before the first sync may be older than any version
+            _sync_state["version"] = latest_version(connection)
+            clear_cache()
+            return
+
+        while True:
+            since = _sync_state["version"]
+            result = changes_since(connection, since, list(DIMENSIONS) + ["Songs"])
+            if result["reset"]:
+                clear_cache()
+            else:
+                _apply_changes(result)
+            _sync_state["version"] = result["version"]
+            # Stopped in front of an unsettled gap: the rest comes with the next sync
+            if not result["more"] or result["reset"] or result["version"] == since:
+                break
+
+    except mysql.connector.Error as e:
+        print(f"Error syncing cache with change log: {e}")
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+        _sync_lock.release()
+
+# ------------------- Dimension Tables -------------------
+def _load_rows(query, description):
+    """Run a small lookup query, returning None on failure so nothing is cached"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query)
+        return cursor.fetchall()
+
+    except mysql.connector.Error as e:
+        print(f"Error loading {description}: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def _dimension_rows(namespace):
+    """The cached list of a dimension namespace itself (callers copy before handing it out)"""
+    sync_changes()
+    query, _, _ = DIMENSION_LISTS[namespace]
+    return cached(namespace, "all", lambda: _load_rows(query, namespace)) or []
+
+def _dimension_index(namespace):
+    """{"names": {id: name}} for a dimension, plus {"albums": {(title, artist_id): album_id}} for albums
+
+    Built once per cached list: rebuilt only after the list is reloaded,
+    patched from the change log or invalidated.
+    """
+    rows = _dimension_rows(namespace)
+    with _lock:
+        index = _indexes.get(namespace)
+        if index and index[0] is rows:
+            return index[1]
+
+    _, id_key, name_key = DIMENSION_LISTS[namespace]
+    maps = {"names": {row[id_key]: row[name_key] for row in rows}}
+    if namespace == "albums":
+        maps["albums"] = {}
+        for row in rows:
+            maps["albums"].setdefault((row["title"], row["artist_id"]), row["album_id"])
+    with _lock:
+        _indexes[namespace] = (rows, maps)
+    return maps
+
+def get_cached_artists():
+    """All artists as {artist_id, name} dicts ordered by name (a copy of the cached list)"""
+    return list(_dimension_rows("artists"))
+
+def get_cached_genres():
+    """All genres as {genre_id, name} dicts ordered by name"""
+    return list(_dimension_rows("genres"))
+
+def get_cached_albums():
+    """All albums as {album_id, title, artist_id} dicts"""
+    return list(_dimension_rows("albums"))
+
+def find_cached_album(album_title, artist_id):
+    """Id of an album by title and artist, or None"""
+    return _dimension_index("albums")["albums"].get((album_title, artist_id))
+
+# ------------------- Song Hydration -------------------
+SONG_COLUMNS = """
+SELECT song_id, title, artist_id, album_id, genre_id, duration, file_type, file_size, is_active
+FROM Songs
+WHERE song_id IN ({})
+"""
+
+def _load_songs(song_ids):
+    """Fetch song rows for ids not in the cache, in one query per 1000 ids"""
+    rows = {}
+    try:
+        connection = connect_db()
+        if not connection:
+            return rows
+
+        cursor = connection.cursor(dictionary=True)
+        if len(song_ids) == 1:
+            # One song missing (get_song_info while playing) is the hot case
+            loaded = fetch_prepared(connection, SONG_COLUMNS.format("%s"), song_ids, dictionary=True)
+            return {row["song_id"]: row for row in loaded}
+
+        for i in range(0, len(song_ids), 1000):
+            chunk = song_ids[i:i + 1000]
+            cursor.execute(SONG_COLUMNS.format(", ".join(["%s"] * len(chunk))), chunk)
+            rows.update((row["song_id"], row) for row in cursor.fetchall())
+        return rows
+
+    except mysql.connector.Error as e:
+        print(f"Error loading songs: {e}")
+        return rows
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def hydrate_songs(song_ids):
+    """Song dicts for song_ids in the same order, with artist/genre/album names filled in
+
+    Only ids missing from the cache hit the database; unknown ids are skipped.
+    """
+    sync_changes()
+    songs = {}
+    missing = []
+    for song_id in dict.fromkeys(song_ids):
+        row = cache_get("song", song_id)
+        if row is None:
+            missing.append(song_id)
+        else:
+            songs[song_id] = row
+
+    if missing:
+        loaded = _load_songs(missing)
+        for song_id, row in loaded.items():
+            cache_set("song", song_id, row)
+        songs.update(loaded)
+
+    artist_names = _dimension_index("artists")["names"]
+    genre_names = _dimension_index("genres")["names"]
+    album_titles = _dimension_index("albums")["names"]
+
+    hydrated = []
+    for song_id in song_ids:
+        row = songs.get(song_id)
+        if row is None:
+            continue
+        song = dict(row)
+        song["artist_name"] = artist_names.get(row["artist_id"])
+        song["genre_name"] = genre_names.get(row["genre_id"])
+        song["album_title"] = album_titles.get(row["album_id"])
+        hydrated.append(song)
+    return hydrated
+
+def invalidate_songs(song_ids):
+    """Forget cached rows of songs that were changed or deleted"""
+    invalidate("song", list(song_ids))
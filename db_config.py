@@ -16,7 +16,80 @@ APP_CONFIG = {
     "name": "Online Music System",
     "version": "1.0",
     "temp_dir": "temp",
-    "reports_dir": "reports"
+    "reports_dir": "reports",
+    "report_batch_size": 10000,
+    # Reports beyond the newest max_reports or older than max_age_days are
+    # moved to reports/archive (or deleted when archive is False); reports
+    # that predate the catalog are left alone
+    "report_retention": {
+        "max_reports": 200,
+        "max_age_days": 90,
+        "archive": True
+    },
+    # Bulk import: tag-parsing processes (None = one per CPU) and
+    # concurrent song uploads (also the number of files held in memory)
+    "import_parse_workers": None,
+    "import_upload_workers": 4,
+    # Streaming renditions: MP3 bitrates (kbps) made after upload, encoder
+    # threads, and the minimum quality fetched for playback and download
+    # (None = the original upload)
+    "rendition_bitrates": (96, 160, 320),
+    "transcode_workers": 2,
+    "ffmpeg_path": "ffmpeg",
+    "playback_quality": 160,
+    "download_quality": None,
+    # Audio analysis workers, and the loudness (LUFS) playback is normalized to;
+    # pygame can only attenuate, so louder songs are turned down to this level
+    "analysis_workers": 1,
+    "normalize_lufs": -16.0,
+    # Upcoming queue tracks the player fetches in the background
+    "prefetch_depth": 2,
+    # Local HTTP streaming server (stream_server.py)
+    "stream_host": "127.0.0.1",
+    "stream_port": 8765,
+    # Connections in the aiomysql pool behind users_async
+    "async_pool_size": 8,
+    # Seconds before cached song/artist/genre/album rows (db_cache.py) are re-read
+    "metadata_cache_ttl": 300,
+    # Query instrumentation (db_metrics.py): statements slower than slow_query_ms
+    # go to slow_query_log; metrics are served on http://127.0.0.1:<metrics_port>/metrics
+    # and/or written to metrics_json_path every metrics_dump_interval seconds (None = off)
+    "query_metrics": True,
+    "slow_query_ms": 200,
+    "slow_query_log": "logs/slow_queries.log",
+    "metrics_port": None,
+    "metrics_json_path": None,
+    "metrics_dump_interval": 60,
+    # Storage backend (db_backend.py): "mysql" uses DB_CONFIG, "sqlite" a local
+    # WAL-mode file (None = "<DB_CONFIG database>.db")
+    "db_backend": "mysql",
+    "sqlite_path": None,
+    "sqlite_busy_timeout": 5.0,
+    # MySQL connection pool (0 = a new connection per query function, at most 32);
+    # hot statements are prepared once per pooled connection (db_statements.py),
+    # keeping up to prepared_statement_limit per connection
+    "db_pool_size": 16,
+    "prepared_statements": True,
+    "prepared_statement_limit": 64,
+    # Smart playlists (smart_playlists.py) are re-evaluated from scratch at least
+    # this often (seconds) so catalog edits show up; in between only new plays are applied
+    "smart_playlist_refresh_seconds": 900,
+    # A Listening_History id gap younger than this (seconds) may be a play still
+    # committing, so User_Song_Stats catch-up waits in front of it
+    "history_settle_seconds": 10,
+    # Offline playback (users/users_offline.py): pinned playlists are kept
+    # encrypted in offline_dir, using at most offline_budget_mb of disk
+    "offline_dir": "offline",
+    "offline_budget_mb": 2048,
+    # Catalog change log (change_log.py): clients check it for changes every
+    # change_sync_interval seconds; entries older than the retention are pruned
+    "change_sync_interval": 5,
+    "change_log_settle_seconds": 10,
+    "change_log_retention_days": 30,
+    # Bulk song deletion (admin/admin_delete.py): listening history rows purged
+    # per transaction, and seconds to pause between batches so plays get through
+    "delete_batch_size": 1000,
+    "delete_batch_pause": 0.05
 }
 
 # UI Configuration
@@ -0,0 +1,475 @@
+"""
+Query instrumentation for the Online Music Player application.
+connect_db wraps every connection so each statement records its latency
+(execute plus fetching), rows and bytes fetched under the name of the
+function that ran it, and connection setup time is measured too. Slow
+statements are appended to a log with their SQL fingerprint, and the hot
+statements of db_statements count how often a prepared statement was
+reused. Metrics are served as Prometheus text on /metrics and/or dumped
+to a JSON file periodically, as configured in APP_CONFIG.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
+import functools
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from db_config import APP_CONFIG
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_functions = {}
+_connects = None
+_open_connections = {"current": 0, "peak": 0}
+_statements = {}
+_exporters_started = False
+
+# ------------------- SQL Fingerprints -------------------
+_COMMENTS = re.compile(r"(#|--\s)[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUE_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def fingerprint_sql(sql):
+    """SQL with comments, literals and placeholders normalized, so the same statement
+    with different values (or a different number of IN items) fingerprints the same"""
+    sql = _COMMENTS.sub(" ", sql)
+    sql = _STRINGS.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = _NUMBERS.sub("?", sql)
+    sql = _VALUE_LISTS.sub("(?+)", sql)
+    return " ".join(sql.split())
+
+def fingerprint_id(fingerprint):
+    """Short stable id of a fingerprint for grouping log lines"""
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:12]
+
+# ------------------- Recording -------------------
+def _new_histogram():
+    return {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0, "max": 0.0}
+
+def _observe(histogram, seconds):
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            histogram["buckets"][i] += 1
+            break
+    histogram["count"] += 1
+    histogram["sum"] += seconds
+    histogram["max"] = max(histogram["max"], seconds)
+
+# Wrappers that run statements on behalf of their callers
+_WRAPPER_MODULES = {__name__, "db_statements"}
+
+def _calling_function():
+    """module.function of the nearest caller outside this module and db_statements"""
+    frame = sys._getframe(1)
+    while frame and frame.f_globals.get("__name__") in _WRAPPER_MODULES:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{module}.{frame.f_code.co_name}"
+
+def _value_bytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return 8
+
+def _row_bytes(row):
+    """Rough size of a fetched row (tuple or dict)"""
+    if row is None:
+        return 0
+    values = row.values() if isinstance(row, dict) else row
+    return sum(_value_bytes(value) for value in values)
+
+def observe_query(function, sql, seconds, rows=0, bytes_fetched=0, error=False):
+    """Record one finished statement and log it if it was slow"""
+    with _lock:
+        stats = _functions.get(function)
+        if stats is None:
+            stats = _functions[function] = dict(_new_histogram(), rows=0, bytes=0, errors=0, slow=0)
+        _observe(stats, seconds)
+        stats["rows"] += rows
+        stats["bytes"] += bytes_fetched
+        if error:
+            stats["errors"] += 1
+
+    threshold = APP_CONFIG.get("slow_query_ms")
+    if threshold is not None and seconds * 1000 >= threshold:
+        with _lock:
+            stats["slow"] += 1
+        _log_slow_query(function, sql, seconds, rows, error)
+
+def observe_connect(seconds, error=False):
+    """Record how long opening a connection took"""
+    global _connects
+    with _lock:
+        if _connects is None:
+            _connects = dict(_new_histogram(), errors=0)
+        _observe(_connects, seconds)
+        if error:
+            _connects["errors"] += 1
+
+@functools.lru_cache(maxsize=1024)
+def _statement_key(sql):
+    fingerprint = fingerprint_sql(sql)
+    return fingerprint_id(fingerprint), fingerprint
+
+def observe_statement(sql, outcome):
+    """Count one run of a hot statement (db_statements.py) by outcome:
+    "hit" (already prepared on the connection), "prepare" or "text" (not prepared)"""
+    function = _calling_function()
+    statement_id, fingerprint = _statement_key(sql)
+    with _lock:
+        stats = _statements.get(statement_id)
+        if stats is None:
+            stats = _statements[statement_id] = {
+                "function": function, "fingerprint": fingerprint, "hit": 0, "prepare": 0, "text": 0
+            }
+        stats[outcome] += 1
+
+def prepared_hit_rate(statements=None):
+    """Share of hot statement runs that reused an already prepared statement (None before any run)"""
+    if statements is None:
+        statements = snapshot()["statements"]
+    runs = sum(stats["hit"] + stats["prepare"] + stats["text"] for stats in statements.values())
+    return sum(stats["hit"] for stats in statements.values()) / runs if runs else None
+
+def _log_slow_query(function, sql, seconds, rows, error):
+    """Append one line to the slow-query log"""
+    path = APP_CONFIG.get("slow_query_log")
+    if not path:
+        return
+    fingerprint = fingerprint_sql(sql)
+    line = (f"{datetime.now().isoformat(timespec='milliseconds')} {seconds * 1000:.1f}ms "
+            f"{function} rows={rows}{' error' if error else ''} "
+            f"[{fingerprint_id(fingerprint)}] {fingerprint}\n")
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _lock:
+            with open(path, "a") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Error writing slow query log: {e}")
+
+def reset_metrics():
+    """Forget everything recorded so far"""
+    global _connects
+    with _lock:
+        _functions.clear()
+        _statements.clear()
+        _connects = None
+        _open_connections["peak"] = _open_connections["current"]
+
+def _connection_opened():
+    with _lock:
+        _open_connections["current"] += 1
+        _open_connections["peak"] = max(_open_connections["peak"], _open_connections["current"])
+
+def _connection_closed():
+    with _lock:
+        _open_connections["current"] -= 1
+
+# ------------------- Connection and Cursor Wrappers -------------------
+class InstrumentedCursor:
+    """Cursor proxy timing each statement from execute until its results are fetched
+
+    A statement is finished when its results are exhausted, the next
+    statement starts or the cursor is closed; fetch time counts towards it.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def _finish(self, error=False):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        observe_query(statement["function"], statement["sql"], statement["seconds"],
+                      statement["rows"], statement["bytes"], error)
+
+    def _run(self, method, sql, params):
+        self._finish()
+        self._statement = {"function": _calling_function(), "sql": sql, "rows": 0, "bytes": 0, "seconds": 0.0}
+        began = time.perf_counter()
+        try:
+            result = method(sql, params)
+        except Exception:
+            self._add_time(began)
+            self._finish(error=True)
+            raise
+        self._add_time(began)
+        if self._cursor.description is None:
+            # No result set (INSERT/UPDATE/DELETE): count affected rows instead
+            self._statement["rows"] = max(self._cursor.rowcount or 0, 0)
+            self._finish()
+        return result
+
+    def execute(self, operation, params=None):
+        """Timed cursor.execute"""
+        return self._run(self._cursor.execute, operation, params)
+
+    def executemany(self, operation, seq_params):
+        """Timed cursor.executemany"""
+        return self._run(self._cursor.executemany, operation, seq_params)
+
+    def _add_time(self, began):
+        if self._statement:
+            self._statement["seconds"] += time.perf_counter() - began
+
+    def _fetch(self, method, *args):
+        began = time.perf_counter()
+        try:
+            result = method(*args)
+        except Exception:
+            self._add_time(began)
+            self._finish(error=True)
+            raise
+        self._add_time(began)
+        return result
+
+    def fetchone(self):
+        """Timed cursor.fetchone"""
+        row = self._fetch(self._cursor.fetchone)
+        if self._statement:
+            if row is None:
+                self._finish()
+            else:
+                self._statement["rows"] += 1
+                self._statement["bytes"] += _row_bytes(row)
+        return row
+
+    def fetchmany(self, size=None):
+        """Timed cursor.fetchmany"""
+        rows = self._fetch(self._cursor.fetchmany, *(() if size is None else (size,)))
+        if self._statement:
+            self._statement["rows"] += len(rows)
+            self._statement["bytes"] += sum(_row_bytes(row) for row in rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        """Timed cursor.fetchall"""
+        rows = self._fetch(self._cursor.fetchall)
+        if self._statement:
+            self._statement["rows"] += len(rows)
+            self._statement["bytes"] += sum(_row_bytes(row) for row in rows)
+            self._finish()
+        return rows
+
+    def close(self):
+        """Finish the pending statement and close the cursor"""
+        self._finish()
+        return self._cursor.close()
+
+class InstrumentedConnection:
+    """Connection proxy handing out instrumented cursors"""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._closed = False
+        _connection_opened()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._connection, name, value)
+
+    def cursor(self, *args, **kwargs):
+        """An InstrumentedCursor over the real cursor"""
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def close(self):
+        """Close the connection and count it as no longer open"""
+        if not self._closed:
+            self._closed = True
+            _connection_closed()
+        return self._connection.close()
+
+def instrument_connection(connection):
+    """Wrap a connection if query metrics are enabled, starting the exporters on first use"""
+    if not APP_CONFIG.get("query_metrics", True) or connection is None:
+        return connection
+    start_exporters()
+    return InstrumentedConnection(connection)
+
+# ------------------- Export -------------------
+def snapshot():
+    """Copy of all metrics as plain dicts"""
+    with _lock:
+        functions = {name: dict(stats, buckets=list(stats["buckets"])) for name, stats in _functions.items()}
+        connects = dict(_connects, buckets=list(_connects["buckets"])) if _connects else None
+        connections = dict(_open_connections)
+        statements = {statement_id: dict(stats) for statement_id, stats in _statements.items()}
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "bucket_bounds": list(LATENCY_BUCKETS),
+        "functions": functions,
+        "connect": connects,
+        "connections": connections,
+        "statements": statements
+    }
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def _histogram_lines(name, histogram, labels=""):
+    lines = []
+    cumulative = 0
+    separator = "," if labels else ""
+    for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram["count"]}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram['sum']:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram['count']}")
+    return lines
+
+def metrics_text():
+    """All metrics in the Prometheus text exposition format"""
+    data = snapshot()
+    functions = sorted(data["functions"].items())
+    lines = [
+        "# HELP musicplayer_query_duration_seconds Statement latency including fetching, by calling function.",
+        "# TYPE musicplayer_query_duration_seconds histogram"
+    ]
+    for function, stats in functions:
+        lines += _histogram_lines("musicplayer_query_duration_seconds", stats, f'function="{_label(function)}"')
+
+    counters = [
+        ("rows", "musicplayer_query_rows_total", "Rows fetched or affected."),
+        ("bytes", "musicplayer_query_bytes_total", "Approximate bytes fetched."),
+        ("errors", "musicplayer_query_errors_total", "Statements that raised."),
+        ("slow", "musicplayer_slow_queries_total", "Statements over the slow-query threshold.")
+    ]
+    for key, name, help_text in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{function="{_label(function)}"}} {stats[key]}' for function, stats in functions]
+
+    if data["connect"]:
+        lines += [
+            "# HELP musicplayer_connect_duration_seconds Time to open a database connection.",
+            "# TYPE musicplayer_connect_duration_seconds histogram"
+        ]
+        lines += _histogram_lines("musicplayer_connect_duration_seconds", data["connect"])
+        lines += [
+            "# HELP musicplayer_connect_errors_total Failed connection attempts.",
+            "# TYPE musicplayer_connect_errors_total counter",
+            f"musicplayer_connect_errors_total {data['connect']['errors']}"
+        ]
+    lines += [
+        "# HELP musicplayer_connections_open Database connections currently open.",
+        "# TYPE musicplayer_connections_open gauge",
+        f"musicplayer_connections_open {data['connections']['current']}",
+        "# HELP musicplayer_connections_open_peak Most connections open at once since the last reset.",
+        "# TYPE musicplayer_connections_open_peak gauge",
+        f"musicplayer_connections_open_peak {data['connections']['peak']}",
+        "# HELP musicplayer_statement_runs_total Hot statement runs by outcome (hit = reused a prepared statement).",
+        "# TYPE musicplayer_statement_runs_total counter"
+    ]
+    for statement_id, stats in sorted(data["statements"].items()):
+        labels = f'function="{_label(stats["function"])}",statement="{statement_id}"'
+        lines += [f'musicplayer_statement_runs_total{{{labels},outcome="{outcome}"}} {stats[outcome]}'
+                  for outcome in ("hit", "prepare", "text")]
+    hit_rate = prepared_hit_rate(data["statements"])
+    if hit_rate is not None:
+        lines += [
+            "# HELP musicplayer_prepared_statement_hit_ratio Share of hot statement runs that reused a prepared statement.",
+            "# TYPE musicplayer_prepared_statement_hit_ratio gauge",
+            f"musicplayer_prepared_statement_hit_ratio {hit_rate:.6f}"
+        ]
+    return "\n".join(lines) + "\n"
+
+def dump_metrics_json(path):
+    """Write a snapshot of all metrics to a JSON file (atomically)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(snapshot(), f, indent=2)
+    os.replace(temp_path, path)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics in the Prometheus text format"""
+
+    def do_GET(self):
+        """Serve the current metrics"""
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = metrics_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Scrapes are not worth logging"""
+
+def start_metrics_server(host="127.0.0.1", port=None):
+    """Serve /metrics on a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port or APP_CONFIG.get("metrics_port")), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+def _dump_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            dump_metrics_json(path)
+        except OSError as e:
+            print(f"Error dumping query metrics: {e}")
+
+def start_exporters():
+    """Start the configured /metrics endpoint and JSON dump thread (once per process)"""
+    global _exporters_started
+    with _lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if APP_CONFIG.get("metrics_port"):
+        try:
+            start_metrics_server(port=APP_CONFIG["metrics_port"])
+        except OSError as e:
+            # Another app (admin or user) already serves metrics on this port
+            print(f"Metrics endpoint not started: {e}")
+
+    if APP_CONFIG.get("metrics_json_path"):
+        threading.Thread(
+            target=_dump_loop,
+            args=(APP_CONFIG["metrics_json_path"], APP_CONFIG.get("metrics_dump_interval", 60)),
+            name="metrics-dump",
+            daemon=True
+        ).start()
+
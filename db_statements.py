@@ -0,0 +1,115 @@
+"""
+Prepared statements for the Online Music Player application.
+The hot parameterized queries (song lookups, play history, search and
+playlist appends) run through fetch_prepared and execute_prepared. On a
+pooled MySQL connection each statement is prepared once and afterwards only
+executed with new parameters over the binary protocol, instead of being sent
+as text and parsed again on every call. Connections outside the pool and
+SQLite run the statement as text. How often a prepared statement was reused
+is recorded in db_metrics.
+"""
+
+import weakref
+import threading
+from collections import OrderedDict
+import mysql.connector
+
+from db_config import APP_CONFIG
+from db_backend import is_sqlite, PooledConnection
+from db_metrics import observe_statement
+
+# ER_UNKNOWN_STMT_HANDLER: the pool reconnected the connection, dropping its statements
+_UNKNOWN_STATEMENT = 1243
+
+_lock = threading.Lock()
+# Real (pooled) mysql.connector connection -> {sql: prepared cursor}, least recently used first
+_registries = weakref.WeakKeyDictionary()
+
+# ------------------- Registry -------------------
+def _pooled_connection(connection):
+    """The mysql.connector connection behind a pooled connection (under the metrics wrapper), else None"""
+    if is_sqlite() or not APP_CONFIG.get("prepared_statements", True):
+        return None
+    while connection is not None and not isinstance(connection, PooledConnection):
+        connection = getattr(connection, "__dict__", {}).get("_connection")
+    if connection is None:
+        return None
+    # PooledMySQLConnection keeps the real connection in _cnx while checked out
+    return vars(connection._connection).get("_cnx")
+
+def _registry(raw_connection):
+    with _lock:
+        registry = _registries.get(raw_connection)
+        if registry is None:
+            registry = _registries[raw_connection] = OrderedDict()
+        return registry
+
+def _close_quietly(cursor):
+    try:
+        cursor.close()
+    except mysql.connector.Error:
+        pass
+
+def _prepared_cursor(connection, registry, sql):
+    """(cursor, prepared_before) for sql on this connection"""
+    cursor = registry.get(sql)
+    if cursor is not None:
+        registry.move_to_end(sql)
+        return cursor, True
+
+    cursor = connection.cursor(prepared=True)
+    registry[sql] = cursor
+    # Closing a prepared cursor deallocates its statement on the server
+    while len(registry) > APP_CONFIG.get("prepared_statement_limit", 64):
+        _close_quietly(registry.popitem(last=False)[1])
+    return cursor, False
+
+def _result(cursor, fetch, dictionary):
+    if not fetch:
+        return cursor.rowcount
+    rows = cursor.fetchall()
+    if dictionary and rows and not isinstance(rows[0], dict):
+        # Prepared cursors return tuples
+        names = cursor.column_names
+        rows = [dict(zip(names, row)) for row in rows]
+    return rows
+
+def _run(connection, sql, params, fetch, dictionary):
+    raw_connection = _pooled_connection(connection)
+    if raw_connection is None:
+        cursor = connection.cursor(dictionary=dictionary)
+        try:
+            cursor.execute(sql, params)
+            result = _result(cursor, fetch, dictionary)
+        finally:
+            cursor.close()
+        observe_statement(sql, "text")
+        return result
+
+    registry = _registry(raw_connection)
+    for attempt in range(2):
+        cursor, prepared_before = _prepared_cursor(connection, registry, sql)
+        try:
+            cursor.execute(sql, params)
+            result = _result(cursor, fetch, dictionary)
+        except mysql.connector.Error as e:
+            if e.errno == _UNKNOWN_STATEMENT and attempt == 0:
+                # Every statement of the old session is gone; prepare again
+                registry.clear()
+                continue
+            if not prepared_before:
+                # The statement may not even have been prepared
+                registry.pop(sql, None)
+                _close_quietly(cursor)
+            raise
+        observe_statement(sql, "hit" if prepared_before else "prepare")
+        return result
+
+# ------------------- Hot Statements -------------------
+def fetch_prepared(connection, sql, params=(), dictionary=False):
+    """All rows of a hot SELECT, as tuples or (dictionary=True) dicts"""
+    return _run(connection, sql, tuple(params), True, dictionary)
+
+def execute_prepared(connection, sql, params=()):
+    """Run a hot INSERT/UPDATE/DELETE; returns the affected row count (the caller commits)"""
+    return _run(connection, sql, tuple(params), False, False)
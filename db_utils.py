@@ -3,7 +3,10 @@ Utility functions for the Online Music Player application.
 """
 
 import os
+import io
+import gzip
 import hashlib
+import itertools
 import mysql.connector
 import time
 import random
@@ -12,7 +15,23 @@ import customtkinter as ctk
 from tkinter import messagebox
 import csv
 import subprocess
+import threading
 from db_config import DB_CONFIG, APP_CONFIG
+from report_catalog import register_report
+from db_metrics import instrument_connection, observe_connect
+from db_backend import is_sqlite, connect_sqlite, connect_mysql
+
+# Optional report backends: columnar formats need pyarrow, zstd CSV needs zstandard
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # ------------------- Directory Management -------------------
 def ensure_directories_exist():
@@ -26,19 +45,32 @@ def ensure_directories_exist():
         os.makedirs(directory, exist_ok=True)
 
 # ------------------- Database Utilities -------------------
-def connect_db():
-    """Connect to the MySQL database"""
+def connect_db(quiet=False):
+    """Connect to the database (MySQL or SQLite, see db_backend; instrumented, see db_metrics)
+
+    quiet prints a failure instead of showing a dialog, for paths that carry
+    on without the database (offline playback).
+    """
+    began = time.perf_counter()
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        connection = connect_sqlite() if is_sqlite() else connect_mysql()
+        observe_connect(time.perf_counter() - began)
+        return instrument_connection(connection)
     except mysql.connector.Error as err:
-        messagebox.showerror("Database Connection Error", 
-                            f"Failed to connect to database: {err}")
+        observe_connect(time.perf_counter() - began, error=True)
+        if not quiet and threading.current_thread() is threading.main_thread():
+            messagebox.showerror("Database Connection Error", 
+                                f"Failed to connect to database: {err}")
+        else:
+            # Tk may only be used from the main thread (background loaders, load tests)
+            print(f"Failed to connect to database: {err}")
         return None
 
 def connect_db_server():
-    """Connect to MySQL server without specifying a database"""
+    """Connect to MySQL server without specifying a database (the database file on SQLite)"""
     try:
+        if is_sqlite():
+            return connect_sqlite()
         config = DB_CONFIG.copy()
         if "database" in config:
             del config["database"]
@@ -53,6 +85,20 @@ def hash_password(password):
     """Hash a password or secret key using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+_session = threading.local()
+
+def get_current_user_id():
+    """Id of the logged-in user: this thread's override if set, else current_user.txt"""
+    user_id = getattr(_session, "user_id", None)
+    if user_id is not None:
+        return user_id
+    with open("current_user.txt", "r") as f:
+        return f.read().strip()
+
+def set_current_user_id(user_id):
+    """Act as user_id on this thread (benchmarks, load tests); None goes back to current_user.txt"""
+    _session.user_id = user_id
+
 def get_current_user():
     """Get the current logged-in user information"""
     try:
@@ -198,32 +244,144 @@ def format_file_size(size_bytes):
     return f"{size:.2f} {units[unit_index]}"
 
 # ------------------- Report Utilities -------------------
-def generate_report(report_type, data, filename=None):
-    """Generate a report and save it to the reports directory"""
+# Report format -> file extension
+REPORT_FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "parquet": ".parquet",
+    "arrow": ".arrow"
+}
+
+def _report_filename(filename, report_format):
+    """Give a report filename the extension matching its format"""
+    extension = REPORT_FORMATS[report_format]
+    for known in sorted(REPORT_FORMATS.values(), key=len, reverse=True):
+        if filename.endswith(known):
+            filename = filename[:-len(known)]
+            break
+    return filename + extension
+
+def _iter_report_batches(rows, batch_size):
+    """Yield lists of at most batch_size rows from any iterable"""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _open_csv_report(file_path, report_format):
+    """Open a text stream for a plain or compressed CSV report"""
+    if report_format == "csv.gz":
+        return gzip.open(file_path, 'wt', newline='')
+    if report_format == "csv.zst":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required for .csv.zst reports")
+        raw = open(file_path, 'wb')
+        compressed = zstandard.ZstdCompressor(level=3).stream_writer(raw)
+        return io.TextIOWrapper(compressed, newline='')
+    return open(file_path, 'w', newline='')
+
+def _write_csv_report(file_path, report_format, data, batch_size):
+    """Write rows to a (possibly compressed) CSV file, returning the row count"""
+    rows = iter(data)
+    first_row = next(rows, None)
+    row_count = 0
+    
+    with _open_csv_report(file_path, report_format) as csvfile:
+        if first_row is None:
+            csvfile.write("No data available for this report")
+            return 0
+        
+        # Get field names from the first row
+        writer = csv.DictWriter(csvfile, fieldnames=first_row.keys())
+        writer.writeheader()
+        
+        for batch in _iter_report_batches(itertools.chain([first_row], rows), batch_size):
+            writer.writerows(batch)
+            row_count += len(batch)
+    
+    return row_count
+
+def _report_schema(column_types):
+    """Build an Arrow schema from a {column: type name} mapping"""
+    arrow_types = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "str": pa.string(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("s")
+    }
+    return pa.schema([(name, arrow_types[type_name]) for name, type_name in column_types.items()])
+
+def _open_columnar_writer(file_path, report_format, schema):
+    """Open a Parquet or Arrow IPC writer for the given schema"""
+    if report_format == "parquet":
+        return pq.ParquetWriter(file_path, schema, compression="zstd")
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    return pa.ipc.new_file(file_path, schema, options=options)
+
+def _write_columnar_report(file_path, report_format, data, batch_size, column_types=None):
+    """Write rows to Parquet/Arrow one record batch at a time, returning the row count"""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet and Arrow reports")
+    
+    schema = _report_schema(column_types) if column_types else None
+    writer = None
+    row_count = 0
+    
+    try:
+        for batch_rows in _iter_report_batches(data, batch_size):
+            if schema is None:
+                # Infer column types from the first batch
+                schema = pa.RecordBatch.from_pylist(batch_rows).schema
+            
+            batch = pa.RecordBatch.from_pylist(batch_rows, schema=schema)
+            if writer is None:
+                writer = _open_columnar_writer(file_path, report_format, schema)
+            writer.write_batch(batch)
+            row_count += batch.num_rows
+        
+        if writer is None:
+            # No rows: still produce a valid (empty) file
+            writer = _open_columnar_writer(file_path, report_format, schema or pa.schema([]))
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    return row_count
+
+def generate_report(report_type, data, filename=None, report_format="csv", column_types=None):
+    """Generate a report and save it to the reports directory
+    
+    data may be a list or any iterable of dicts; rows are written in batches of
+    APP_CONFIG["report_batch_size"] so large exports never sit in memory twice.
+    column_types ({column: "int" | "float" | "str" | "bool" | "timestamp"}) fixes
+    the column types of Parquet/Arrow reports instead of inferring them.
+    """
     ensure_directories_exist()
     
+    if report_format not in REPORT_FORMATS:
+        print(f"Unsupported report format: {report_format}")
+        return None
+    
     if filename is None:
         # Generate default filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{report_type}_{timestamp}.csv"
+        filename = f"{report_type}_{timestamp}"
+    filename = _report_filename(filename, report_format)
     
     file_path = os.path.join(APP_CONFIG["reports_dir"], filename)
+    batch_size = APP_CONFIG.get("report_batch_size", 10000)
     
     try:
-        with open(file_path, 'w', newline='') as csvfile:
-            if data and len(data) > 0:
-                # Get field names from the first row
-                fieldnames = data[0].keys()
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                # Write header and data
-                writer.writeheader()
-                writer.writerows(data)
-                
-                return file_path
-            else:
-                csvfile.write("No data available for this report")
-                return file_path
+        if report_format in ("parquet", "arrow"):
+            row_count = _write_columnar_report(file_path, report_format, data or [], batch_size, column_types)
+        else:
+            row_count = _write_csv_report(file_path, report_format, data or [], batch_size)
+        register_report(file_path, report_type, report_format, row_count)
+        return file_path
     except Exception as e:
         print(f"Error generating report: {e}")
         return None
@@ -14,8 +14,23 @@ import time
 # Import from other modules
 from db_config import UI_CONFIG, COLORS, DB_CONFIG, APP_CONFIG
 from db_utils import ensure_directories_exist, connect_db_server, connect_db
+from blob_store import migrate_inline_blobs
+from playlist_store import migrate_playlist_positions, rebuild_summaries
+from change_log import create_change_triggers, prune_change_log
+from active_catalog import active_catalog_stale, rebuild_active_catalog
+from db_backend import index_exists, column_exists, is_sqlite
 
 # ------------------- Database Setup Functions -------------------
+def create_index_if_missing(cursor, table, index_name, columns):
+    """Add an index to an existing table unless it is already there"""
+    if not index_exists(cursor, table, index_name):
+        cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+
+def add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table unless it is already there"""
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 def create_database():
     """Create the database and tables if they don't exist"""
     try:
@@ -28,8 +43,8 @@ def create_database():
         
         # Create database
         print("Creating database...")
-        cursor.execute("CREATE DATABASE IF NOT EXISTS online_music_system")
-        cursor.execute("USE online_music_system")
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{DB_CONFIG['database']}`")
+        cursor.execute(f"USE `{DB_CONFIG['database']}`")
         
         # Create Users table
         print("Creating Users table...")
@@ -95,11 +110,109 @@ def create_database():
             file_size INT NOT NULL,
             upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             is_active TINYINT(1) NOT NULL DEFAULT 1,
+            content_hash CHAR(64),
+            audio_fingerprint VARCHAR(64),
             FOREIGN KEY (artist_id) REFERENCES Artists(artist_id) ON DELETE SET NULL,
             FOREIGN KEY (album_id) REFERENCES Albums(album_id) ON DELETE SET NULL,
             FOREIGN KEY (genre_id) REFERENCES Genres(genre_id) ON DELETE SET NULL
         )
         """)
+        add_column_if_missing(cursor, "Songs", "content_hash", "CHAR(64)")
+        add_column_if_missing(cursor, "Songs", "audio_fingerprint", "VARCHAR(64)")
+        create_index_if_missing(cursor, "Songs", "idx_songs_content_hash", "content_hash")
+        create_index_if_missing(cursor, "Songs", "idx_songs_audio_fingerprint", "audio_fingerprint")
+        create_index_if_missing(cursor, "Songs", "idx_songs_genre_id", "genre_id")
+        create_index_if_missing(cursor, "Songs", "idx_songs_artist_id", "artist_id")
+        
+        # Create Song_Blobs table (audio bytes shared by songs with the same content hash)
+        print("Creating Song_Blobs table...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Song_Blobs (
+            content_hash CHAR(64) PRIMARY KEY,
+            file_data LONGBLOB NOT NULL,
+            file_size INT NOT NULL,
+            ref_count INT NOT NULL DEFAULT 0,
+            chunk_count INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        add_column_if_missing(cursor, "Song_Blobs", "chunk_count", "INT NOT NULL DEFAULT 0")
+        create_index_if_missing(cursor, "Song_Blobs", "idx_song_blobs_ref_count", "ref_count")
+        
+        # Create Song_Blob_Chunks table (uploads are streamed in fixed-size pieces)
+        print("Creating Song_Blob_Chunks table...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Song_Blob_Chunks (
+            content_hash CHAR(64) NOT NULL,
+            chunk_index INT NOT NULL,
+            chunk_data MEDIUMBLOB NOT NULL,
+            PRIMARY KEY (content_hash, chunk_index),
+            FOREIGN KEY (content_hash) REFERENCES Song_Blobs(content_hash) ON DELETE CASCADE
+        )
+        """)
+        
+        # Create Song_Renditions table (transcoded streaming copies, stored as blobs)
+        print("Creating Song_Renditions table...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Song_Renditions (
+            song_id INT NOT NULL,
+            bitrate INT NOT NULL,
+            file_type VARCHAR(10) NOT NULL,
+            file_size INT NOT NULL,
+            content_hash CHAR(64) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (song_id, bitrate),
+            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+        )
+        """)
+        
+        # Create Song_Analysis table (decoded once after upload; waveform is packed uint8 peaks)
+        print("Creating Song_Analysis table...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Song_Analysis (
+            song_id INT PRIMARY KEY,
+            duration_ms INT NOT NULL,
+            loudness_lufs FLOAT NOT NULL,
+            replay_gain_db FLOAT NOT NULL,
+            sample_peak FLOAT NOT NULL,
+            bpm FLOAT,
+            waveform BLOB NOT NULL,
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+        )
+        """)
+
+        # Create Active_Songs_Catalog table (active songs with their names copied in; active_catalog.py)
+        print("Creating Active_Songs_Catalog table...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Active_Songs_Catalog (
+            song_id INT PRIMARY KEY,
+            title VARCHAR(100) NOT NULL,
+            artist_id INT,
+            artist_name VARCHAR(100),
+            album_id INT,
+            album_name VARCHAR(100),
+            genre_id INT,
+            genre_name VARCHAR(50),
+            duration INT,
+            file_type VARCHAR(10) NOT NULL,
+            file_size INT NOT NULL,
+            upload_date TIMESTAMP NULL,
+            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+        )
+        """)
+        create_index_if_missing(cursor, "Active_Songs_Catalog", "idx_active_songs_upload_date", "upload_date")
+        create_index_if_missing(cursor, "Active_Songs_Catalog", "idx_active_songs_title", "title")
+        create_index_if_missing(cursor, "Active_Songs_Catalog", "idx_active_songs_artist", "artist_name, title")
+        create_index_if_missing(cursor, "Active_Songs_Catalog", "idx_active_songs_album", "album_name, title")
+        create_index_if_missing(cursor, "Active_Songs_Catalog", "idx_active_songs_artist_id", "artist_id")
+        create_index_if_missing(cursor, "Active_Songs_Catalog", "idx_active_songs_genre_id", "genre_id")
+        if active_catalog_stale(cursor):
+            print("Rebuilding Active_Songs_Catalog...")
+            rebuild_active_catalog(cursor)
+
+        print("Moving inline song audio into Song_Blobs...")
+        migrate_inline_blobs(cursor)
         
         # Create Playlists table
         print("Creating Playlists table...")
@@ -110,6 +223,11 @@ def create_database():
             name VARCHAR(100) NOT NULL,
             description TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            next_position INT NOT NULL DEFAULT 1024,  # Position of the next appended song (playlist_store.py)
+            song_count INT NOT NULL DEFAULT 0,  # Summary kept current by playlist_store.py
+            total_duration INT NOT NULL DEFAULT 0,
+            cover_song_ids VARCHAR(64),  # First songs, comma-separated; NULL = recompute
+            last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
         )
         """)
@@ -127,6 +245,18 @@ def create_database():
             FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
         )
         """)
+        create_index_if_missing(cursor, "Playlist_Songs", "idx_playlist_songs_position", "playlist_id, position")
+        if not column_exists(cursor, "Playlists", "next_position"):
+            print("Spacing out playlist positions...")
+            add_column_if_missing(cursor, "Playlists", "next_position", "INT NOT NULL DEFAULT 1024")
+            migrate_playlist_positions(cursor)
+        if not column_exists(cursor, "Playlists", "song_count"):
+            print("Summarizing playlists...")
+            add_column_if_missing(cursor, "Playlists", "song_count", "INT NOT NULL DEFAULT 0")
+            add_column_if_missing(cursor, "Playlists", "total_duration", "INT NOT NULL DEFAULT 0")
+            add_column_if_missing(cursor, "Playlists", "cover_song_ids", "VARCHAR(64)")
+            add_column_if_missing(cursor, "Playlists", "last_modified", "TIMESTAMP NULL")
+            rebuild_summaries(cursor)
         
         # Create User_Favorites table
         print("Creating User_Favorites table...")
@@ -149,10 +279,121 @@ def create_database():
             user_id INT NOT NULL,
             song_id INT NOT NULL,
             played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            recorded_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,  # When the row was written; offline plays backdate played_at
+            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+        )
+        """)
+        if is_sqlite() and not column_exists(cursor, "Listening_History", "recorded_at"):
+            # SQLite cannot add a column with a non-constant default, so a trigger stamps new rows
+            add_column_if_missing(cursor, "Listening_History", "recorded_at", "TIMESTAMP NULL")
+            cursor.execute("""
+            CREATE TRIGGER trg_listening_history_recorded_at AFTER INSERT ON Listening_History
+            FOR EACH ROW WHEN NEW.recorded_at IS NULL
+            BEGIN UPDATE Listening_History SET recorded_at = datetime('now', 'localtime') WHERE history_id = NEW.history_id; END
+            """)
+        add_column_if_missing(cursor, "Listening_History", "recorded_at", "TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP")
+        create_index_if_missing(cursor, "Listening_History", "idx_history_played_at", "played_at")
+        create_index_if_missing(cursor, "Listening_History", "idx_history_user_id", "user_id, history_id")
+        create_index_if_missing(cursor, "Listening_History", "idx_history_song_id", "song_id, history_id")
+        
+        # Create Song_Deletions table (songs hidden and waiting for the purge in admin_delete.py)
+        print("Creating Song_Deletions table...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Song_Deletions (
+            song_id INT PRIMARY KEY,
+            requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+        )
+        """)
+        
+        # Create analytics rollup tables (per-hour play counts of completed days)
+        print("Creating Listening_Stats tables...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Listening_Stats_Hourly (
+            stat_date DATE NOT NULL,
+            stat_hour TINYINT NOT NULL,
+            dimension VARCHAR(10) NOT NULL,
+            key_id INT NOT NULL,
+            play_count INT NOT NULL,
+            PRIMARY KEY (stat_date, dimension, key_id, stat_hour)
+        )
+        """)
+        
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Listening_Stats_Days (
+            stat_date DATE PRIMARY KEY,
+            play_count INT NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        
+        # Create smart playlist tables (smart_playlists.py)
+        print("Creating Smart_Playlists tables...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS User_Song_Stats (
+            user_id INT NOT NULL,
+            song_id INT NOT NULL,
+            play_count INT NOT NULL DEFAULT 0,
+            last_played_at TIMESTAMP NULL,
+            PRIMARY KEY (user_id, song_id),
             FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
             FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
         )
         """)
+        create_index_if_missing(cursor, "User_Song_Stats", "idx_user_song_stats_played", "user_id, last_played_at")
+        create_index_if_missing(cursor, "User_Song_Stats", "idx_user_song_stats_count", "user_id, play_count")
+        
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Stats_Watermarks (
+            name VARCHAR(50) PRIMARY KEY,
+            last_id INT NOT NULL DEFAULT 0  # Last Listening_History.history_id folded in
+        )
+        """)
+        
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Smart_Playlists (
+            smart_playlist_id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            rules TEXT NOT NULL,  # JSON list of [field, operator, value]
+            sort_by VARCHAR(20) NOT NULL DEFAULT 'play_count',
+            max_songs INT,  # NULL = no limit
+            history_watermark INT NOT NULL DEFAULT 0,  # Last history_id reflected in its songs
+            materialized_at TIMESTAMP NULL,  # NULL = evaluate from scratch on the next open
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        )
+        """)
+        
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Smart_Playlist_Songs (
+            smart_playlist_id INT NOT NULL,
+            song_id INT NOT NULL,
+            position INT NOT NULL,
+            PRIMARY KEY (smart_playlist_id, song_id),
+            FOREIGN KEY (smart_playlist_id) REFERENCES Smart_Playlists(smart_playlist_id) ON DELETE CASCADE,
+            FOREIGN KEY (song_id) REFERENCES Songs(song_id) ON DELETE CASCADE
+        )
+        """)
+        create_index_if_missing(cursor, "Smart_Playlist_Songs", "idx_smart_playlist_songs_position",
+                                "smart_playlist_id, position")
+        
+        # Create the catalog change log and the triggers that fill it (change_log.py)
+        print("Creating Change_Log table...")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Change_Log (
+            version INT AUTO_INCREMENT PRIMARY KEY,
+            table_name VARCHAR(20) NOT NULL,
+            row_id INT NOT NULL,
+            owner_id INT,  # Playlists.user_id, so clients only sync their own playlists
+            operation CHAR(1) NOT NULL,  # U = inserted or updated, D = deleted
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        create_index_if_missing(cursor, "Change_Log", "idx_change_log_changed_at", "changed_at")
+        create_change_triggers(cursor)
+        prune_change_log(cursor)
         
         connection.commit()
         cursor.close()
@@ -0,0 +1,517 @@
+"""
+Playlist storage for the Online Music Player application.
+Songs in a playlist are ordered by Playlist_Songs.position, spaced
+POSITION_GAP apart. Playlists.next_position is the position of the next
+appended song: an append bumps the counter and inserts at the old value, so
+it never scans the playlist, and concurrent appends cannot be given the same
+position because the counter row stays locked until commit. A move takes the
+midpoint between its new neighbours and touches one row; only when two
+neighbours run out of room is the playlist renumbered. apply_operations
+runs a whole batch of edits with multi-row statements. Every write also
+keeps the playlist summary in Playlists (song_count, total_duration,
+cover_song_ids, last_modified) current, so listing playlists needs no scan
+of their songs. The caller owns the connection and commits.
+"""
+
+from db_statements import execute_prepared
+
+# Room for ten moves between the same two songs before a renumber
+POSITION_GAP = 1024
+
+# Songs per multi-row UPDATE/DELETE
+RENUMBER_BATCH = 500
+
+# Songs whose artwork makes up a playlist's cover (its first songs)
+COVER_SONGS = 4
+
+# ------------------- Appending -------------------
+def append_songs(connection, playlist_id, song_ids, ignore_duplicates=False):
+    """Append songs to the end of a playlist in order; returns how many were added
+
+    Two statements whatever the number of songs. Songs already in the
+    playlist raise IntegrityError unless ignore_duplicates is set, in which
+    case they are looked up first and keep their place. Returns None if the
+    playlist does not exist.
+    """
+    song_ids = list(dict.fromkeys(song_ids))
+    if ignore_duplicates and song_ids:
+        _lock_playlist(connection, playlist_id)
+        present = set(_present_songs(connection, playlist_id, song_ids))
+        song_ids = [song_id for song_id in song_ids if song_id not in present]
+    if not song_ids:
+        return 0
+
+    placeholders = ", ".join(["%s"] * len(song_ids))
+    # Reserve positions for every song at once and update the summary; the row
+    # lock serializes concurrent appends. Covers only change while the playlist
+    # is short, and are recomputed on the next listing (refresh_covers).
+    reserved = _execute(
+        connection,
+        f"""
+        UPDATE Playlists
+        SET cover_song_ids = CASE WHEN song_count < %s THEN NULL ELSE cover_song_ids END,
+            next_position = next_position + %s,
+            song_count = song_count + %s,
+            total_duration = total_duration + (
+                SELECT COALESCE(SUM(duration), 0) FROM Songs WHERE song_id IN ({placeholders})
+            ),
+            last_modified = NOW()
+        WHERE playlist_id = %s
+        """,
+        [COVER_SONGS, POSITION_GAP * len(song_ids), len(song_ids)] + song_ids + [playlist_id],
+        len(song_ids) == 1
+    )
+    if not reserved:
+        return None
+
+    # Each song's position counts back from the bumped counter
+    offsets = " UNION ALL ".join(["SELECT %s AS song_id, %s AS back"] * len(song_ids))
+    params = []
+    for i, song_id in enumerate(song_ids):
+        params += [song_id, POSITION_GAP * (len(song_ids) - i)]
+    return _execute(
+        connection,
+        f"""
+        INSERT INTO Playlist_Songs (playlist_id, song_id, position)
+        SELECT p.playlist_id, v.song_id, p.next_position - v.back
+        FROM Playlists p CROSS JOIN ({offsets}) v
+        WHERE p.playlist_id = %s
+        """,
+        params + [playlist_id],
+        len(song_ids) == 1
+    )
+
+def _execute(connection, query, params, prepared):
+    """Run a write as a prepared statement, or as text when its length varies with the song list
+    (preparing those would only evict the hot statements); returns the affected row count"""
+    if prepared:
+        return execute_prepared(connection, query, params)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+def _lock_playlist(connection, playlist_id):
+    """Lock the playlist row until commit; False if there is no such playlist"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT playlist_id FROM Playlists WHERE playlist_id = %s FOR UPDATE", (playlist_id,))
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+
+def _present_songs(connection, playlist_id, song_ids):
+    """Those of song_ids that are in the playlist"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT song_id FROM Playlist_Songs WHERE playlist_id = %s AND song_id IN ("
+            + ", ".join(["%s"] * len(song_ids)) + ")",
+            [playlist_id] + list(song_ids)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def _touch(cursor, playlist_id):
+    """Mark the order as changed: covers are recomputed on the next listing"""
+    cursor.execute(
+        "UPDATE Playlists SET cover_song_ids = NULL, last_modified = NOW() WHERE playlist_id = %s",
+        (playlist_id,)
+    )
+
+# ------------------- Reordering -------------------
+def _song_position(cursor, playlist_id, song_id):
+    cursor.execute(
+        "SELECT position FROM Playlist_Songs WHERE playlist_id = %s AND song_id = %s",
+        (playlist_id, song_id)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def move_song(connection, playlist_id, song_id, after_song_id=None):
+    """Move a song right after after_song_id (None = to the top); returns its new position
+
+    Returns None if the playlist or either song is not found.
+    """
+    cursor = connection.cursor()
+    try:
+        # Lock the playlist so concurrent moves and appends see settled neighbours
+        cursor.execute("SELECT next_position FROM Playlists WHERE playlist_id = %s FOR UPDATE", (playlist_id,))
+        if not cursor.fetchone():
+            return None
+        current = _song_position(cursor, playlist_id, song_id)
+        if current is None or after_song_id == song_id:
+            return current
+
+        if after_song_id is None:
+            low = None
+            cursor.execute(
+                "SELECT MIN(position) FROM Playlist_Songs WHERE playlist_id = %s AND song_id <> %s",
+                (playlist_id, song_id)
+            )
+        else:
+            low = _song_position(cursor, playlist_id, after_song_id)
+            if low is None:
+                return None
+            cursor.execute(
+                """
+                SELECT MIN(position) FROM Playlist_Songs
+                WHERE playlist_id = %s AND position > %s AND song_id <> %s
+                """,
+                (playlist_id, low, song_id)
+            )
+        high = cursor.fetchone()[0]
+
+        if high is None:
+            if low is None:
+                # The only song in the playlist
+                return current
+            # To the end: take the next position like an append
+            cursor.execute(
+                "UPDATE Playlists SET next_position = next_position + %s WHERE playlist_id = %s",
+                (POSITION_GAP, playlist_id)
+            )
+            cursor.execute("SELECT next_position FROM Playlists WHERE playlist_id = %s", (playlist_id,))
+            position = cursor.fetchone()[0] - POSITION_GAP
+        elif low is None:
+            position = high - POSITION_GAP
+        elif high - low > 1:
+            position = (low + high) // 2
+        else:
+            order = [row_id for row_id in playlist_order(connection, playlist_id) if row_id != song_id]
+            order.insert(order.index(after_song_id) + 1, song_id)
+            return renumber_playlist(connection, playlist_id, order)[song_id]
+
+        cursor.execute(
+            "UPDATE Playlist_Songs SET position = %s WHERE playlist_id = %s AND song_id = %s",
+            (position, playlist_id, song_id)
+        )
+        _touch(cursor, playlist_id)
+        return position
+    finally:
+        cursor.close()
+
+def playlist_order(connection, playlist_id):
+    """Song ids of a playlist in order"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT song_id FROM Playlist_Songs WHERE playlist_id = %s ORDER BY position, song_id",
+            (playlist_id,)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def move_songs_to_end(connection, playlist_id, song_ids):
+    """Move songs to the bottom of a playlist, keeping their order; returns {song_id: position}
+
+    Like append_songs, one counter bump reserves positions for every song,
+    and one UPDATE per RENUMBER_BATCH songs moves them there.
+    """
+    song_ids = _present_in_order(connection, playlist_id, song_ids)
+    if not song_ids:
+        return {}
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "UPDATE Playlists SET next_position = next_position + %s WHERE playlist_id = %s",
+            (POSITION_GAP * len(song_ids), playlist_id)
+        )
+        cursor.execute("SELECT next_position FROM Playlists WHERE playlist_id = %s", (playlist_id,))
+        end = cursor.fetchone()[0]
+        positions = {song_id: end - POSITION_GAP * (len(song_ids) - i) for i, song_id in enumerate(song_ids)}
+        _set_positions(cursor, playlist_id, positions)
+        _touch(cursor, playlist_id)
+    finally:
+        cursor.close()
+    return positions
+
+def move_songs_to_top(connection, playlist_id, song_ids):
+    """Move songs to the top of a playlist, keeping their order; returns {song_id: position}
+
+    The songs count back from the first of the others, so no other row moves.
+    """
+    song_ids = _present_in_order(connection, playlist_id, song_ids)
+    if not song_ids:
+        return {}
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT MIN(position) FROM Playlist_Songs WHERE playlist_id = %s AND song_id NOT IN ("
+            + ", ".join(["%s"] * len(song_ids)) + ")",
+            [playlist_id] + song_ids
+        )
+        first = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    if first is None:
+        # Nothing else in the playlist: the top is the end
+        return move_songs_to_end(connection, playlist_id, song_ids)
+
+    positions = {song_id: first - POSITION_GAP * (len(song_ids) - i) for i, song_id in enumerate(song_ids)}
+    cursor = connection.cursor()
+    try:
+        _set_positions(cursor, playlist_id, positions)
+        _touch(cursor, playlist_id)
+    finally:
+        cursor.close()
+    return positions
+
+def _present_in_order(connection, playlist_id, song_ids):
+    """Those of song_ids that are in the playlist, once each and in the given order"""
+    song_ids = list(dict.fromkeys(song_ids))
+    if not song_ids:
+        return []
+    present = set(_present_songs(connection, playlist_id, song_ids))
+    return [song_id for song_id in song_ids if song_id in present]
+
+def _set_positions(cursor, playlist_id, positions):
+    """Write {song_id: position} with one UPDATE per RENUMBER_BATCH songs rather than one per song"""
+    items = list(positions.items())
+    for i in range(0, len(items), RENUMBER_BATCH):
+        batch = items[i:i + RENUMBER_BATCH]
+        params = [value for item in batch for value in item]
+        params += [playlist_id] + [song_id for song_id, _ in batch]
+        cursor.execute(
+            "UPDATE Playlist_Songs SET position = CASE song_id "
+            + " ".join(["WHEN %s THEN %s"] * len(batch))
+            + " END WHERE playlist_id = %s AND song_id IN (" + ", ".join(["%s"] * len(batch)) + ")",
+            params
+        )
+
+def renumber_playlist(connection, playlist_id, order=None):
+    """Respace a playlist POSITION_GAP apart in order (default: the current one); returns {song_id: position}"""
+    order = playlist_order(connection, playlist_id) if order is None else order
+    positions = {song_id: POSITION_GAP * (i + 1) for i, song_id in enumerate(order)}
+    cursor = connection.cursor()
+    try:
+        _set_positions(cursor, playlist_id, positions)
+        cursor.execute(
+            "UPDATE Playlists SET next_position = %s WHERE playlist_id = %s",
+            (POSITION_GAP * (len(order) + 1), playlist_id)
+        )
+        _touch(cursor, playlist_id)
+    finally:
+        cursor.close()
+    return positions
+
+# ------------------- Batch Operations -------------------
+def remove_songs(connection, playlist_id, song_ids):
+    """Remove songs from a playlist with multi-row DELETEs; returns how many were removed"""
+    song_ids = list(dict.fromkeys(song_ids))
+    removed = 0
+    cursor = connection.cursor()
+    try:
+        for i in range(0, len(song_ids), RENUMBER_BATCH):
+            batch = song_ids[i:i + RENUMBER_BATCH]
+            placeholders = ", ".join(["%s"] * len(batch))
+            # Take the songs still in the playlist out of the summary, then delete them
+            cursor.execute(
+                f"""
+                UPDATE Playlists
+                SET song_count = song_count - (
+                        SELECT COUNT(*) FROM Playlist_Songs
+                        WHERE playlist_id = %s AND song_id IN ({placeholders})
+                    ),
+                    total_duration = total_duration - (
+                        SELECT COALESCE(SUM(s.duration), 0)
+                        FROM Playlist_Songs ps JOIN Songs s ON ps.song_id = s.song_id
+                        WHERE ps.playlist_id = %s AND ps.song_id IN ({placeholders})
+                    ),
+                    cover_song_ids = NULL,
+                    last_modified = NOW()
+                WHERE playlist_id = %s
+                """,
+                [playlist_id] + batch + [playlist_id] + batch + [playlist_id]
+            )
+            cursor.execute(
+                f"DELETE FROM Playlist_Songs WHERE playlist_id = %s AND song_id IN ({placeholders})",
+                [playlist_id] + batch
+            )
+            removed += cursor.rowcount
+    finally:
+        cursor.close()
+    return removed
+
+def remove_song_from_all_playlists(connection, song_id):
+    """Take a song out of every playlist and its summary (before the song itself is deleted)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            UPDATE Playlists
+            SET song_count = song_count - 1,
+                total_duration = total_duration - COALESCE((SELECT duration FROM Songs WHERE song_id = %s), 0),
+                cover_song_ids = NULL,
+                last_modified = NOW()
+            WHERE playlist_id IN (SELECT playlist_id FROM Playlist_Songs WHERE song_id = %s)
+            """,
+            (song_id, song_id)
+        )
+        cursor.execute("DELETE FROM Playlist_Songs WHERE song_id = %s", (song_id,))
+    finally:
+        cursor.close()
+
+def set_song_duration(connection, song_id, duration):
+    """Change a song's duration, moving the total_duration of every playlist holding it by the difference"""
+    cursor = connection.cursor()
+    try:
+        # Before the song row changes, while the subquery still reads the old duration
+        cursor.execute(
+            """
+            UPDATE Playlists
+            SET total_duration = total_duration + %s - COALESCE((SELECT duration FROM Songs WHERE song_id = %s), 0)
+            WHERE playlist_id IN (SELECT playlist_id FROM Playlist_Songs WHERE song_id = %s)
+            """,
+            (duration, song_id, song_id)
+        )
+        cursor.execute("UPDATE Songs SET duration = %s WHERE song_id = %s", (duration, song_id))
+    finally:
+        cursor.close()
+
+def remove_duplicates(connection, playlist_id):
+    """Remove songs whose audio (content_hash or audio_fingerprint) is already earlier in the playlist
+
+    Returns the removed song ids.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT ps.song_id, s.content_hash, s.audio_fingerprint
+            FROM Playlist_Songs ps
+            JOIN Songs s ON ps.song_id = s.song_id
+            WHERE ps.playlist_id = %s
+            ORDER BY ps.position, ps.song_id
+            """,
+            (playlist_id,)
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    seen = set()
+    duplicates = []
+    for song_id, content_hash, audio_fingerprint in rows:
+        keys = {key for key in (content_hash and ("hash", content_hash),
+                                audio_fingerprint and ("audio", audio_fingerprint)) if key}
+        if keys & seen:
+            duplicates.append(song_id)
+        seen |= keys
+    remove_songs(connection, playlist_id, duplicates)
+    return duplicates
+
+def apply_operations(connection, playlist_id, operations):
+    """Apply a list of playlist edits in order and return the resulting song order
+
+    Operations are tuples:
+        ("add", song_ids)              append, skipping songs already present
+        ("remove", song_ids)
+        ("move", song_id, after_song_id)   after_song_id None = to the top
+        ("to_top", song_ids)           move to the top, keeping their order
+        ("to_end", song_ids)           move to the bottom, keeping their order
+        ("reorder", song_ids)          the complete new order
+        ("dedupe",)                    drop repeated audio, keeping the first copy
+    Everything runs on the caller's connection, so one commit (or rollback)
+    covers the whole batch. Returns None if the playlist does not exist.
+    """
+    # Lock the playlist first so concurrent batches apply one after the other
+    if not _lock_playlist(connection, playlist_id):
+        return None
+
+    for operation in operations:
+        kind = operation[0]
+        if kind == "add":
+            append_songs(connection, playlist_id, operation[1], ignore_duplicates=True)
+        elif kind == "remove":
+            remove_songs(connection, playlist_id, operation[1])
+        elif kind == "move":
+            move_song(connection, playlist_id, operation[1], operation[2])
+        elif kind == "to_top":
+            move_songs_to_top(connection, playlist_id, operation[1])
+        elif kind == "to_end":
+            move_songs_to_end(connection, playlist_id, operation[1])
+        elif kind == "reorder":
+            current = playlist_order(connection, playlist_id)
+            present = set(current)
+            order = [song_id for song_id in dict.fromkeys(operation[1]) if song_id in present]
+            # Songs left out of the new order keep their relative order at the end
+            listed = set(order)
+            renumber_playlist(connection, playlist_id, order + [song_id for song_id in current if song_id not in listed])
+        elif kind == "dedupe":
+            remove_duplicates(connection, playlist_id)
+        else:
+            raise ValueError(f"Unknown playlist operation: {kind}")
+
+    return playlist_order(connection, playlist_id)
+
+# ------------------- Summaries -------------------
+def parse_cover_song_ids(value):
+    """Playlists.cover_song_ids ("12,7,31") as a list of ints"""
+    return [int(song_id) for song_id in value.split(",") if song_id] if value else []
+
+def refresh_covers(connection, playlist_ids):
+    """Recompute and store the cover songs of playlists whose covers were invalidated
+
+    Returns {playlist_id: [song_id, ...]}. Each playlist is one index range
+    read of its first COVER_SONGS songs.
+    """
+    covers = {}
+    cursor = connection.cursor()
+    try:
+        for playlist_id in playlist_ids:
+            cursor.execute(
+                "SELECT song_id FROM Playlist_Songs WHERE playlist_id = %s ORDER BY position, song_id LIMIT %s",
+                (playlist_id, COVER_SONGS)
+            )
+            covers[playlist_id] = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "UPDATE Playlists SET cover_song_ids = %s WHERE playlist_id = %s",
+                (",".join(str(song_id) for song_id in covers[playlist_id]), playlist_id)
+            )
+    finally:
+        cursor.close()
+    return covers
+
+def rebuild_summaries(cursor):
+    """Recompute song_count, total_duration and last_modified of every playlist from its songs
+
+    For filling in the summary columns of an existing database; afterwards
+    the write paths keep them up to date. Covers are recomputed lazily.
+    """
+    cursor.execute(
+        """
+        UPDATE Playlists
+        SET song_count = (SELECT COUNT(*) FROM Playlist_Songs ps WHERE ps.playlist_id = Playlists.playlist_id),
+            total_duration = (
+                SELECT COALESCE(SUM(s.duration), 0)
+                FROM Playlist_Songs ps JOIN Songs s ON ps.song_id = s.song_id
+                WHERE ps.playlist_id = Playlists.playlist_id
+            ),
+            cover_song_ids = NULL,
+            last_modified = COALESCE(
+                (SELECT MAX(ps.added_at) FROM Playlist_Songs ps WHERE ps.playlist_id = Playlists.playlist_id),
+                created_at
+            )
+        """
+    )
+
+# ------------------- Migration -------------------
+def migrate_playlist_positions(cursor):
+    """Spread positions numbered 1, 2, 3... POSITION_GAP apart and fill in next_position
+
+    Run once, when Playlists.next_position is added to an existing database.
+    """
+    cursor.execute("UPDATE Playlist_Songs SET position = position * %s", (POSITION_GAP,))
+    cursor.execute(
+        """
+        UPDATE Playlists SET next_position = %s + COALESCE(
+            (SELECT MAX(ps.position) FROM Playlist_Songs ps WHERE ps.playlist_id = Playlists.playlist_id), 0
+        )
+        """,
+        (POSITION_GAP,)
+    )
@@ -0,0 +1,212 @@
+"""
+Report catalog for the Online Music Player application.
+Keeps an indexed SQLite record of every generated report so the admin
+reports page never has to scan and stat the reports directory, and applies
+the retention policy that archives or prunes old reports. Reports found on
+disk when the catalog was created are listed but never rotated: retention
+only touches reports the catalog registered itself.
+"""
+
+import os
+import time
+import sqlite3
+from db_config import APP_CONFIG
+
+CATALOG_FILENAME = "catalog.db"
+
+# ------------------- Catalog Storage -------------------
+def _catalog_path():
+    """Path of the catalog database inside the reports directory"""
+    return os.path.join(APP_CONFIG["reports_dir"], CATALOG_FILENAME)
+
+def connect_catalog():
+    """Open the report catalog, creating and backfilling it on first use"""
+    os.makedirs(APP_CONFIG["reports_dir"], exist_ok=True)
+    is_new = not os.path.exists(_catalog_path())
+
+    connection = sqlite3.connect(_catalog_path(), timeout=10)
+    connection.row_factory = sqlite3.Row
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS reports (
+        filename TEXT PRIMARY KEY,
+        report_type TEXT NOT NULL,
+        report_format TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        size_bytes INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        archived INTEGER NOT NULL DEFAULT 0,
+        backfilled INTEGER NOT NULL DEFAULT 0  -- found on disk, not registered; exempt from retention
+    )
+    """)
+    columns = [row["name"] for row in connection.execute("PRAGMA table_info(reports)")]
+    if "backfilled" not in columns:
+        # Catalogs from before the column: backfilled rows are the ones with unknown row counts
+        connection.execute("ALTER TABLE reports ADD COLUMN backfilled INTEGER NOT NULL DEFAULT 0")
+        connection.execute("UPDATE reports SET backfilled = 1 WHERE row_count = -1")
+        connection.commit()
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reports_archived_created ON reports (archived, created_at)"
+    )
+
+    if is_new:
+        _backfill_catalog(connection)
+
+    return connection
+
+def _guess_report_format(filename):
+    """Infer the report format from a filename extension"""
+    for report_format, extension in (
+        ("csv.gz", ".csv.gz"),
+        ("csv.zst", ".csv.zst"),
+        ("parquet", ".parquet"),
+        ("arrow", ".arrow"),
+        ("csv", ".csv")
+    ):
+        if filename.endswith(extension):
+            return report_format
+    return None
+
+def _backfill_catalog(connection):
+    """One-time import of reports written before the catalog existed"""
+    reports_dir = APP_CONFIG["reports_dir"]
+    rows = []
+
+    for filename in os.listdir(reports_dir):
+        report_format = _guess_report_format(filename)
+        if not report_format:
+            continue
+
+        file_path = os.path.join(reports_dir, filename)
+        stat = os.stat(file_path)
+        report_type = "activity" if "activity" in filename else \
+                      "songs" if "song" in filename else \
+                      "users" if "user" in filename else "other"
+        # Row counts of old reports are unknown; -1 marks them as such
+        rows.append((filename, report_type, report_format, -1, stat.st_size, stat.st_mtime))
+
+    connection.executemany(
+        "INSERT OR IGNORE INTO reports "
+        "(filename, report_type, report_format, row_count, size_bytes, created_at, backfilled) "
+        "VALUES (?, ?, ?, ?, ?, ?, 1)",
+        rows
+    )
+    connection.commit()
+
+# ------------------- Catalog Functions -------------------
+def register_report(file_path, report_type, report_format, row_count):
+    """Record a freshly written report and apply the retention policy"""
+    try:
+        connection = connect_catalog()
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO reports "
+                "(filename, report_type, report_format, row_count, size_bytes, created_at, archived) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (os.path.basename(file_path), report_type, report_format,
+                 row_count, os.path.getsize(file_path), time.time())
+            )
+            connection.commit()
+            _apply_retention(connection)
+        finally:
+            connection.close()
+        return True
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error registering report: {e}")
+        return False
+
+def get_recent_reports(limit=5):
+    """Get the newest live (non-archived) reports from the catalog"""
+    try:
+        connection = connect_catalog()
+        try:
+            cursor = connection.execute(
+                "SELECT filename, report_type, report_format, row_count, size_bytes, created_at "
+                "FROM reports WHERE archived = 0 ORDER BY created_at DESC LIMIT ?",
+                (limit,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Error reading report catalog: {e}")
+        return []
+
+# ------------------- Retention Policy -------------------
+def _expired_reports(connection, max_reports, max_age_days):
+    """Registered live reports beyond the newest max_reports or older than max_age_days"""
+    expired = set()
+
+    if max_reports is not None:
+        cursor = connection.execute(
+            "SELECT filename FROM reports WHERE archived = 0 AND backfilled = 0 "
+            "ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+            (max_reports,)
+        )
+        expired.update(row["filename"] for row in cursor.fetchall())
+
+    if max_age_days is not None:
+        cutoff = time.time() - max_age_days * 86400
+        cursor = connection.execute(
+            "SELECT filename FROM reports WHERE archived = 0 AND backfilled = 0 AND created_at < ?",
+            (cutoff,)
+        )
+        expired.update(row["filename"] for row in cursor.fetchall())
+
+    return expired
+
+def _archive_path(archive_dir, filename):
+    """Path in the archive for a report, numbered so an archived file of the same name is kept"""
+    report_format = _guess_report_format(filename)
+    extension = f".{report_format}" if report_format else os.path.splitext(filename)[1]
+    stem = filename[:len(filename) - len(extension)]
+    archive_path = os.path.join(archive_dir, filename)
+    number = 1
+    while os.path.exists(archive_path):
+        archive_path = os.path.join(archive_dir, f"{stem}-{number}{extension}")
+        number += 1
+    return archive_path
+
+def _apply_retention(connection, max_reports=None, max_age_days=None, archive=None):
+    """Archive or delete expired reports; returns how many were rotated"""
+    policy = APP_CONFIG.get("report_retention", {})
+    if max_reports is None:
+        max_reports = policy.get("max_reports")
+    if max_age_days is None:
+        max_age_days = policy.get("max_age_days")
+    if archive is None:
+        archive = policy.get("archive", True)
+
+    reports_dir = APP_CONFIG["reports_dir"]
+    archive_dir = os.path.join(reports_dir, "archive")
+    rotated = 0
+
+    for filename in _expired_reports(connection, max_reports, max_age_days):
+        file_path = os.path.join(reports_dir, filename)
+        try:
+            if archive:
+                os.makedirs(archive_dir, exist_ok=True)
+                if os.path.exists(file_path):
+                    os.replace(file_path, _archive_path(archive_dir, filename))
+                connection.execute("UPDATE reports SET archived = 1 WHERE filename = ?", (filename,))
+            else:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                connection.execute("DELETE FROM reports WHERE filename = ?", (filename,))
+            rotated += 1
+        except OSError as e:
+            print(f"Error rotating report {filename}: {e}")
+
+    connection.commit()
+    return rotated
+
+def apply_retention_policy(max_reports=None, max_age_days=None, archive=None):
+    """Rotate old reports now; unset arguments fall back to APP_CONFIG["report_retention"]"""
+    try:
+        connection = connect_catalog()
+        try:
+            return _apply_retention(connection, max_reports, max_age_days, archive)
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Error applying report retention: {e}")
+        return 0
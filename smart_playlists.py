@@ -0,0 +1,367 @@
+"""
+Smart playlists for the Online Music Player application.
+A smart playlist is a list of rules over the catalog and the owner's
+listening history, e.g. genre is Pop, played in the last 30 days but not in
+the last 7, or the top 50 by play count. Play counts and last-played times
+per user and song live in User_Song_Stats, which is caught up from
+Listening_History past a watermark instead of aggregating the history on
+every evaluation. The rules compile to one parameterized query over
+User_Song_Stats and Active_Songs_Catalog that their indexes answer, and the result is
+materialized in Smart_Playlist_Songs. Opening a smart playlist afterwards
+only re-evaluates the songs the owner played since it was materialized;
+it is evaluated from scratch once a day (day windows move at midnight),
+every smart_playlist_refresh_seconds (catalog edits) and after its rules
+change. The caller owns the connection and commits.
+"""
+
+import json
+from datetime import datetime, date, time, timedelta
+
+from db_config import APP_CONFIG
+from db_cache import get_cached_genres, get_cached_artists
+from change_log import database_now
+
+# Rules are [field, operator, value] lists, all of which must hold
+NAME_FIELDS = {
+    "genre": ("s.genre_id", get_cached_genres, "genre_id"),
+    "artist": ("s.artist_id", get_cached_artists, "artist_id")
+}
+NAME_OPERATORS = ("is", "is_not")
+
+NUMBER_FIELDS = {
+    "duration": "s.duration",
+    "play_count": "COALESCE(st.play_count, 0)"
+}
+NUMBER_OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+
+# Windows are whole days ending today, so a result only changes at midnight or with new plays
+DATE_FIELDS = {
+    "played": "st.last_played_at",
+    "added": "s.upload_date"
+}
+DATE_OPERATORS = ("within_days", "not_within_days")
+
+# Orders whose keys only change when the song is played or edited, so they can be merged incrementally
+SORT_ORDERS = {
+    "play_count": "COALESCE(st.play_count, 0) DESC, s.song_id",
+    "last_played": "st.last_played_at DESC, s.song_id",
+    "recently_added": "s.upload_date DESC, s.song_id DESC",
+    "title": "s.title, s.song_id"
+}
+
+# More new plays than this since the last open re-evaluate the playlist from scratch
+INCREMENTAL_LIMIT = 500
+
+STATS_WATERMARK = "user_song_stats"
+STATS_BATCH = 1000
+# Listening_History ids read per query while looking for the settled watermark
+SETTLE_SCAN = 10000
+
+# ------------------- Rules -------------------
+def validate_rules(rules, sort_by="play_count", max_songs=None):
+    """Rules as [field, operator, value] lists; raises ValueError on anything it cannot compile"""
+    if sort_by not in SORT_ORDERS:
+        raise ValueError(f"Unknown smart playlist order: {sort_by}")
+    if max_songs is not None and (not isinstance(max_songs, int) or max_songs < 1):
+        raise ValueError("max_songs must be a positive number")
+
+    validated = []
+    for rule in rules:
+        if len(rule) != 3:
+            raise ValueError(f"A rule is [field, operator, value]: {rule!r}")
+        field, operator, value = rule
+        if field in NAME_FIELDS:
+            if operator not in NAME_OPERATORS:
+                raise ValueError(f"Unknown operator for {field}: {operator}")
+            names = [value] if isinstance(value, str) else list(value)
+            if not names or not all(isinstance(name, str) for name in names):
+                raise ValueError(f"{field} needs one or more names")
+            value = names
+        elif field in NUMBER_FIELDS:
+            if operator not in NUMBER_OPERATORS:
+                raise ValueError(f"Unknown operator for {field}: {operator}")
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(f"{field} needs a number")
+        elif field in DATE_FIELDS:
+            if operator not in DATE_OPERATORS:
+                raise ValueError(f"Unknown operator for {field}: {operator}")
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                raise ValueError(f"{field} needs a number of days")
+        else:
+            raise ValueError(f"Unknown smart playlist field: {field}")
+        validated.append([field, operator, value])
+    return validated
+
+def _compare(operator, left, right):
+    return {
+        "=": left == right, "!=": left != right,
+        "<": left < right, "<=": left <= right,
+        ">": left > right, ">=": left >= right
+    }[operator]
+
+def _needs_plays(rules):
+    """Whether only songs the user has played can match, so the query can start from their stats"""
+    for field, operator, value in rules:
+        if field == "played" and operator == "within_days":
+            return True
+        if field == "play_count" and not _compare(operator, 0, value):
+            return True
+    return False
+
+def _day_cutoff(today, days):
+    """Start of the window of the last days days, today being the last of them"""
+    return datetime.combine(today - timedelta(days=days - 1), time())
+
+def compile_rules(user_id, rules, sort_by="play_count", max_songs=None, today=None, candidates=None):
+    """(sql, params) selecting the song ids of a smart playlist in order
+
+    candidates is an optional (subquery, params) pair yielding song_id: only
+    those songs are evaluated, for re-checking just the songs that changed.
+    """
+    today = today or date.today()
+    sql, params = "SELECT s.song_id FROM ", []
+    if candidates:
+        sql += f"({candidates[0]}) c JOIN Active_Songs_Catalog s ON s.song_id = c.song_id"
+        params += list(candidates[1])
+    else:
+        sql += "Active_Songs_Catalog s"
+    # Rules that only played songs can meet start from the user's stats
+    # (idx_user_song_stats_played/_count) instead of the whole catalog
+    sql += " JOIN" if _needs_plays(rules) else " LEFT JOIN"
+    sql += " User_Song_Stats st ON st.song_id = s.song_id AND st.user_id = %s"
+    params.append(user_id)
+    conditions = []
+
+    for field, operator, value in rules:
+        if field in NAME_FIELDS:
+            column, loader, id_key = NAME_FIELDS[field]
+            wanted = {name.lower() for name in value}
+            ids = [row[id_key] for row in loader() if row["name"].lower() in wanted]
+            if ids:
+                negation = "NOT " if operator == "is_not" else ""
+                conditions.append(f"{column} {negation}IN ({', '.join(['%s'] * len(ids))})")
+                params += ids
+            elif operator == "is":
+                conditions.append("1 = 0")
+        elif field in NUMBER_FIELDS:
+            conditions.append(f"{NUMBER_FIELDS[field]} {operator} %s")
+            params.append(value)
+        else:
+            column = DATE_FIELDS[field]
+            if operator == "within_days":
+                conditions.append(f"{column} >= %s")
+            elif field == "played":
+                conditions.append(f"({column} IS NULL OR {column} < %s)")
+            else:
+                conditions.append(f"{column} < %s")
+            params.append(_day_cutoff(today, value))
+
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {SORT_ORDERS[sort_by]}"
+    if max_songs:
+        sql += " LIMIT %s"
+        params.append(max_songs)
+    return sql, params
+
+def describe_rules(rules, sort_by="play_count", max_songs=None):
+    """One-line human-readable summary of a smart playlist's rules"""
+    parts = []
+    for field, operator, value in rules:
+        if field in NAME_FIELDS:
+            parts.append(f"{field} {'is' if operator == 'is' else 'is not'} {' or '.join(value)}")
+        elif field in NUMBER_FIELDS:
+            parts.append(f"{field.replace('_', ' ')} {operator} {value}")
+        else:
+            verb = "played" if field == "played" else "added"
+            negation = "not " if operator == "not_within_days" else ""
+            parts.append(f"{negation}{verb} in the last {value} days")
+    order = {"play_count": "most played", "last_played": "recently played",
+             "recently_added": "recently added", "title": "by title"}[sort_by]
+    parts.append(f"top {max_songs}, {order}" if max_songs else order)
+    return " • ".join(parts)
+
+# ------------------- Play Statistics -------------------
+def _settled_history_id(cursor, last_id):
+    """Highest history_id after last_id with no unsettled gap before it
+
+    Gaps are aged by recorded_at, which the database sets on insert:
+    played_at of a synced offline play is backdated. Rows from before
+    recorded_at existed (NULL) count as settled.
+    """
+    settled_before = database_now(cursor) - timedelta(seconds=APP_CONFIG.get("history_settle_seconds", 10))
+    newest = last_id
+    while True:
+        cursor.execute(
+            "SELECT history_id, recorded_at FROM Listening_History WHERE history_id > %s ORDER BY history_id LIMIT %s",
+            (newest, SETTLE_SCAN)
+        )
+        rows = cursor.fetchall()
+        for history_id, recorded_at in rows:
+            if history_id != newest + 1 and recorded_at is not None and recorded_at > settled_before:
+                return newest
+            newest = history_id
+        if len(rows) < SETTLE_SCAN:
+            return newest
+
+def catch_up_song_stats(connection):
+    """Fold plays recorded since the last catch-up into User_Song_Stats; returns the new watermark
+
+    The watermark is the last Listening_History.history_id included. It is
+    advanced with a compare-and-set first, so when two connections catch up
+    at once only the one that moved it folds the new plays in and every play
+    is counted once.
+
+    An auto-increment id can commit after a higher one, so the watermark
+    stops in front of an id gap until the play after it was recorded
+    history_settle_seconds ago, as changes_since does for the change log;
+    a late play is then folded in by a later catch-up instead of being
+    skipped for good.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT last_id FROM Stats_Watermarks WHERE name = %s", (STATS_WATERMARK,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("INSERT IGNORE INTO Stats_Watermarks (name, last_id) VALUES (%s, 0)", (STATS_WATERMARK,))
+        last_id = row[0] if row else 0
+
+        newest = _settled_history_id(cursor, last_id)
+        if newest <= last_id:
+            return last_id
+
+        cursor.execute(
+            "UPDATE Stats_Watermarks SET last_id = %s WHERE name = %s AND last_id = %s",
+            (newest, STATS_WATERMARK, last_id)
+        )
+        if cursor.rowcount != 1:
+            # Another connection is folding in these plays
+            return last_id
+
+        cursor.execute(
+            """
+            SELECT user_id, song_id, COUNT(*), MAX(played_at)
+            FROM Listening_History
+            WHERE history_id > %s AND history_id <= %s
+            GROUP BY user_id, song_id
+            """,
+            (last_id, newest)
+        )
+        plays = cursor.fetchall()
+        for i in range(0, len(plays), STATS_BATCH):
+            batch = plays[i:i + STATS_BATCH]
+            cursor.executemany(
+                "INSERT IGNORE INTO User_Song_Stats (user_id, song_id, play_count) VALUES (%s, %s, 0)",
+                [(user_id, song_id) for user_id, song_id, _, _ in batch]
+            )
+            cursor.executemany(
+                """
+                UPDATE User_Song_Stats
+                SET play_count = play_count + %s,
+                    last_played_at = CASE WHEN last_played_at IS NULL OR last_played_at < %s
+                                          THEN %s ELSE last_played_at END
+                WHERE user_id = %s AND song_id = %s
+                """,
+                [(count, played_at, played_at, user_id, song_id) for user_id, song_id, count, played_at in batch]
+            )
+        return newest
+    finally:
+        cursor.close()
+
+# ------------------- Materialization -------------------
+def _materialized_songs(cursor, smart_playlist_id):
+    cursor.execute(
+        "SELECT song_id FROM Smart_Playlist_Songs WHERE smart_playlist_id = %s ORDER BY position",
+        (smart_playlist_id,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def _played_since(cursor, user_id, after_id, upto_id):
+    """Songs the user played between two history ids (idx_history_user_id)"""
+    cursor.execute(
+        "SELECT DISTINCT song_id FROM Listening_History WHERE user_id = %s AND history_id > %s AND history_id <= %s",
+        (user_id, after_id, upto_id)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def _store_songs(cursor, smart_playlist_id, song_ids):
+    cursor.execute("DELETE FROM Smart_Playlist_Songs WHERE smart_playlist_id = %s", (smart_playlist_id,))
+    rows = [(smart_playlist_id, song_id, position) for position, song_id in enumerate(song_ids)]
+    for i in range(0, len(rows), STATS_BATCH):
+        cursor.executemany(
+            "INSERT INTO Smart_Playlist_Songs (smart_playlist_id, song_id, position) VALUES (%s, %s, %s)",
+            rows[i:i + STATS_BATCH]
+        )
+
+def refresh_smart_playlist(connection, smart_playlist_id):
+    """Bring a smart playlist up to date and return its song ids in order (None if it does not exist)"""
+    watermark = catch_up_song_stats(connection)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """
+            SELECT user_id, rules, sort_by, max_songs, history_watermark, materialized_at
+            FROM Smart_Playlists
+            WHERE smart_playlist_id = %s
+            """,
+            (smart_playlist_id,)
+        )
+        playlist = cursor.fetchone()
+        if not playlist:
+            return None
+
+        cursor.close()
+        cursor = connection.cursor()
+
+        rules = json.loads(playlist["rules"])
+        sort_by, max_songs = playlist["sort_by"], playlist["max_songs"]
+        now = datetime.now().replace(microsecond=0)
+        materialized_at = playlist["materialized_at"]
+        full = (
+            materialized_at is None
+            or materialized_at.date() != now.date()
+            or (now - materialized_at).total_seconds() > APP_CONFIG.get("smart_playlist_refresh_seconds", 900)
+        )
+
+        if not full:
+            members = _materialized_songs(cursor, smart_playlist_id)
+            played = _played_since(cursor, playlist["user_id"], playlist["history_watermark"], watermark)
+            if not played:
+                return members
+            if len(played) > INCREMENTAL_LIMIT:
+                full = True
+            else:
+                # Only the played songs' stats changed: they and the current members are the candidates
+                sql, params = compile_rules(
+                    playlist["user_id"], rules, sort_by, max_songs,
+                    candidates=(
+                        "SELECT song_id FROM Smart_Playlist_Songs WHERE smart_playlist_id = %s UNION "
+                        f"SELECT song_id FROM Songs WHERE song_id IN ({', '.join(['%s'] * len(played))})",
+                        [smart_playlist_id] + played
+                    )
+                )
+                cursor.execute(sql, params)
+                song_ids = [row[0] for row in cursor.fetchall()]
+                # A full top-N that lost a member: the song that moves up is not among the candidates
+                if max_songs and len(members) >= max_songs > len(song_ids):
+                    full = True
+
+        if full:
+            sql, params = compile_rules(playlist["user_id"], rules, sort_by, max_songs)
+            cursor.execute(sql, params)
+            song_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "UPDATE Smart_Playlists SET history_watermark = %s, materialized_at = %s WHERE smart_playlist_id = %s",
+                (watermark, now, smart_playlist_id)
+            )
+            _store_songs(cursor, smart_playlist_id, song_ids)
+        else:
+            cursor.execute(
+                "UPDATE Smart_Playlists SET history_watermark = %s WHERE smart_playlist_id = %s",
+                (watermark, smart_playlist_id)
+            )
+            if song_ids != members:
+                _store_songs(cursor, smart_playlist_id, song_ids)
+        return song_ids
+    finally:
+        cursor.close()
@@ -0,0 +1,301 @@
+"""
+Local streaming server for the Online Music Player application.
+Serves song audio over HTTP at /songs/<id> with Range requests and ETags,
+reading only the blob chunks a request covers, so several players or
+processes can stream and seek without each pulling the whole blob.
+
+    python stream_server.py serve [--host HOST] [--port PORT]
+    python stream_server.py bench SONG_ID [--clients N] [--requests N] [--range-size BYTES]
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import mysql.connector
+
+from db_config import APP_CONFIG
+from db_utils import connect_db
+from blob_store import iter_blob_range
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "flac": "audio/flac"
+}
+
+SONG_PATH = re.compile(r"^/songs/(\d+)$")
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# ------------------- Song Lookup -------------------
+def resolve_song_audio(cursor, song_id, quality=None):
+    """Blob hash, file type and size of the audio get_song_data would return, or None
+
+    quality picks the smallest rendition of at least that many kbps, falling
+    back to the original upload.
+    """
+    if quality:
+        cursor.execute(
+            """
+            SELECT r.content_hash, r.file_type, b.file_size
+            FROM Song_Renditions r
+            JOIN Song_Blobs b ON b.content_hash = r.content_hash
+            WHERE r.song_id = %s AND r.bitrate >= %s
+            ORDER BY r.bitrate
+            LIMIT 1
+            """,
+            (song_id, quality)
+        )
+        row = cursor.fetchone()
+        if row:
+            return row
+
+    cursor.execute(
+        """
+        SELECT s.content_hash, s.file_type, b.file_size
+        FROM Songs s
+        JOIN Song_Blobs b ON b.content_hash = s.content_hash
+        WHERE s.song_id = %s
+        """,
+        (song_id,)
+    )
+    return cursor.fetchone()
+
+def parse_range(header, size):
+    """(start, end) for a single bytes range header, None to send everything, or False if unsatisfiable"""
+    match = RANGE_HEADER.match(header.strip()) if header else None
+    if not match or not (match.group(1) or match.group(2)):
+        # Missing, malformed or multi-range requests get the whole file
+        return None
+
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        # Syntactically invalid (RFC 7233): ignored, like a malformed header
+        return None
+    if start >= size:
+        return False
+    return start, min(int(last), size - 1) if last else size - 1
+
+# ------------------- Request Handler -------------------
+class SongStreamHandler(BaseHTTPRequestHandler):
+    """GET/HEAD /songs/<id>[?quality=KBPS] with Range, If-Range and If-None-Match"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        """Headers only"""
+        self.send_song(head_only=True)
+
+    def do_GET(self):
+        """Headers and (partial) body"""
+        self.send_song(head_only=False)
+
+    def log_message(self, format, *args):
+        """Only log requests when the server runs with --verbose"""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_error_status(self, status, headers=None):
+        """Send an empty response with the given status"""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_song(self, head_only):
+        """Answer a song request, streaming only the requested byte range"""
+        url = urlparse(self.path)
+        match = SONG_PATH.match(url.path)
+        if not match:
+            self.send_error_status(404)
+            return
+
+        quality = parse_qs(url.query).get("quality", [None])[0]
+        if quality is not None and not quality.isdigit():
+            self.send_error_status(400)
+            return
+
+        headers_sent = False
+        try:
+            connection = connect_db()
+            if not connection:
+                self.send_error_status(503)
+                return
+
+            cursor = connection.cursor()
+            audio = resolve_song_audio(cursor, int(match.group(1)), int(quality) if quality else None)
+            if not audio:
+                self.send_error_status(404)
+                return
+
+            content_hash, file_type, size = audio
+            # Blobs are content-addressed, so the hash is a strong validator. The
+            # URL is not: ?quality= serves the original until its rendition is
+            # transcoded, so caches must revalidate (a 304 when nothing changed)
+            etag = f'"{content_hash}"'
+            common = {
+                "ETag": etag,
+                "Accept-Ranges": "bytes",
+                "Cache-Control": "no-cache"
+            }
+
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_error_status(304, common)
+                return
+
+            byte_range = None
+            if_range = self.headers.get("If-Range")
+            if not if_range or if_range.strip() == etag:
+                byte_range = parse_range(self.headers.get("Range"), size)
+            if byte_range is False:
+                self.send_error_status(416, dict(common, **{"Content-Range": f"bytes */{size}"}))
+                return
+
+            start, end = byte_range or (0, size - 1)
+            self.send_response(206 if byte_range else 200)
+            for name, value in common.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", CONTENT_TYPES.get(file_type, "application/octet-stream"))
+            self.send_header("Content-Length", str(end - start + 1 if size else 0))
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            headers_sent = True
+
+            if not head_only and size:
+                for data in iter_blob_range(cursor, content_hash, start, end):
+                    self.wfile.write(data)
+
+        except mysql.connector.Error as e:
+            print(f"Error streaming song: {e}")
+            if headers_sent:
+                # Too late for a status code; drop the connection so the client sees a short body
+                self.close_connection = True
+            else:
+                self.send_error_status(500)
+        except (BrokenPipeError, ConnectionResetError):
+            # Players routinely drop a connection when they seek
+            pass
+        finally:
+            if 'connection' in locals() and connection and connection.is_connected():
+                cursor.close()
+                connection.close()
+
+# ------------------- Server -------------------
+def create_stream_server(host=None, port=None, verbose=False):
+    """Build (but do not start) the threaded streaming server"""
+    server = ThreadingHTTPServer(
+        (host or APP_CONFIG.get("stream_host", "127.0.0.1"), port or APP_CONFIG.get("stream_port", 8765)),
+        SongStreamHandler
+    )
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+def start_stream_server_thread(host=None, port=None):
+    """Serve on a daemon thread inside the current process; returns the server"""
+    server = create_stream_server(host, port)
+    threading.Thread(target=server.serve_forever, name="stream-server", daemon=True).start()
+    return server
+
+def song_url(song_id, quality=None, host=None, port=None):
+    """URL of a song on the local streaming server"""
+    host = host or APP_CONFIG.get("stream_host", "127.0.0.1")
+    port = port or APP_CONFIG.get("stream_port", 8765)
+    query = f"?quality={quality}" if quality else ""
+    return f"http://{host}:{port}/songs/{song_id}{query}"
+
+# ------------------- Benchmark -------------------
+def run_benchmark(url, clients=8, requests_per_client=50, range_size=256 * 1024):
+    """Hit url with random Range requests from concurrent clients and print latency/throughput"""
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request) as response:
+        size = int(response.headers["Content-Length"])
+
+    latencies = []
+    totals = {"bytes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            start = random.randrange(max(size - range_size, 1))
+            request = urllib.request.Request(url, headers={"Range": f"bytes={start}-{start + range_size - 1}"})
+            began = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    received = len(response.read())
+                with lock:
+                    latencies.append(time.perf_counter() - began)
+                    totals["bytes"] += received
+            except (urllib.error.URLError, OSError):
+                with lock:
+                    totals["errors"] += 1
+
+    began = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+    print(f"{len(latencies)} requests ({totals['errors']} errors) in {elapsed:.2f}s "
+          f"from {clients} clients against a {size} byte song")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s, {totals['bytes'] / elapsed / 1048576:.1f} MiB/s")
+    print(f"latency ms: p50 {percentile(0.5):.1f}  p95 {percentile(0.95):.1f}  p99 {percentile(0.99):.1f}")
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Local song streaming server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the streaming server")
+    serve.add_argument("--host")
+    serve.add_argument("--port", type=int)
+    serve.add_argument("--verbose", action="store_true")
+
+    bench = commands.add_parser("bench", help="benchmark a running server with range requests")
+    bench.add_argument("song_id", type=int)
+    bench.add_argument("--quality", type=int)
+    bench.add_argument("--host")
+    bench.add_argument("--port", type=int)
+    bench.add_argument("--clients", type=int, default=8)
+    bench.add_argument("--requests", type=int, default=50)
+    bench.add_argument("--range-size", type=int, default=256 * 1024)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        server = create_stream_server(args.host, args.port, args.verbose)
+        print(f"Streaming songs on http://{server.server_address[0]}:{server.server_address[1]}/songs/<id>")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        run_benchmark(
+            song_url(args.song_id, args.quality, args.host, args.port),
+            args.clients, args.requests, args.range_size
+        )
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Async data access for the User section of the Online Music Player application.
+Coroutine versions of the user-facing queries run on an asyncio loop in a
+bridge thread, so the independent queries of a screen run concurrently and
+Tk never blocks on the database. With aiomysql installed they share a
+connection pool; otherwise each query runs in a worker thread on its own
+blocking connection. run_async hands results back to the Tk thread.
+"""
+
+import os
+import sys
+import queue
+import time
+import asyncio
+import threading
+
+# Add parent directory to path so we can import from root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import DB_CONFIG, APP_CONFIG
+from db_utils import connect_db, format_file_size, get_current_user_id
+from db_metrics import observe_query
+from db_backend import is_sqlite
+import users_queries
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+_loop = None
+_pool = None
+_pool_lock = None
+_results = queue.Queue()
+
+# ------------------- Query Execution -------------------
+async def _get_pool():
+    """aiomysql pool, created on first use inside the bridge loop"""
+    global _pool, _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await aiomysql.create_pool(
+                host=DB_CONFIG["host"],
+                user=DB_CONFIG["user"],
+                password=DB_CONFIG["password"],
+                db=DB_CONFIG["database"],
+                minsize=1,
+                maxsize=APP_CONFIG.get("async_pool_size", 8),
+                autocommit=True
+            )
+    return _pool
+
+def _fetch_all_blocking(query, params):
+    """Run one query on a blocking connection (used without aiomysql)"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return []
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+async def fetch_all(query, params=()):
+    """Rows of a query as dicts"""
+    if aiomysql is None or is_sqlite():
+        return await asyncio.to_thread(_fetch_all_blocking, query, params)
+
+    pool = await _get_pool()
+    began = time.perf_counter()
+    try:
+        async with pool.acquire() as connection:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                rows = list(await cursor.fetchall())
+    except Exception:
+        observe_query("users_async.fetch_all", query, time.perf_counter() - began, error=True)
+        raise
+    # Pool connections bypass connect_db, so record them here
+    observe_query("users_async.fetch_all", query, time.perf_counter() - began, len(rows))
+    return rows
+
+# ------------------- Async Data Functions -------------------
+async def get_featured_songs(limit=3):
+    """Get featured songs from the database"""
+    try:
+        songs = await fetch_all(users_queries.FEATURED_SONGS, (limit,))
+        if not songs:
+            songs = await fetch_all(users_queries.RECENT_SONGS, (limit,))
+        return songs
+    except Exception as e:
+        print(f"Error fetching featured songs: {e}")
+        return []
+
+async def get_user_favorite_songs(limit=8):
+    """Get the current user's favorite songs"""
+    try:
+        user_id = get_current_user_id()
+        songs = await fetch_all(users_queries.USER_FAVORITE_SONGS, (user_id, limit))
+        return users_queries.add_formatted_sizes(songs, format_file_size)
+    except Exception as e:
+        print(f"Error getting user favorite songs: {e}")
+        return []
+
+async def get_popular_songs(limit=8):
+    """Get most popular songs from the database"""
+    try:
+        songs = await fetch_all(users_queries.POPULAR_SONGS, (limit,))
+        if not songs:
+            songs = await fetch_all(users_queries.RECENT_SONGS_WITH_SIZE, (limit,))
+        return users_queries.add_formatted_sizes(songs, format_file_size)
+    except Exception as e:
+        print(f"Error fetching popular songs: {e}")
+        return []
+
+async def get_random_songs(limit=8, exclude_ids=None):
+    """Get random songs from the database"""
+    try:
+        query, params = users_queries.random_songs_query(limit, exclude_ids)
+        songs = await fetch_all(query, params)
+        return songs or users_queries.fallback_songs(limit)
+    except Exception as e:
+        print(f"Error getting random songs: {e}")
+        return []
+
+async def get_recommended_songs(limit=8):
+    """Get songs recommended based on user's listening history
+
+    Favorite genres, favorite artists and listened songs are independent, so
+    the three lookups run concurrently.
+    """
+    try:
+        user_id = get_current_user_id()
+        favorite_genres, favorite_artists, listened = await asyncio.gather(
+            fetch_all(users_queries.FAVORITE_GENRES, (user_id,)),
+            fetch_all(users_queries.FAVORITE_ARTISTS, (user_id,)),
+            fetch_all(users_queries.LISTENED_SONG_IDS, (user_id,))
+        )
+
+        if not favorite_genres and not favorite_artists:
+            return await get_random_songs(limit)
+
+        listened_songs = [row['song_id'] for row in listened]
+        query, params = users_queries.recommended_songs_query(
+            favorite_genres, favorite_artists, listened_songs, limit
+        )
+        recommendations = await fetch_all(query, params)
+
+        if len(recommendations) < limit:
+            remaining = limit - len(recommendations)
+            excluded_songs = [song['song_id'] for song in recommendations] + listened_songs
+            recommendations.extend(await get_random_songs(remaining, excluded_songs))
+
+        return recommendations
+    except Exception as e:
+        print(f"Error getting recommendations: {e}")
+        return await get_random_songs(limit)
+
+# ------------------- Tk Bridge -------------------
+def start_async_bridge():
+    """Start the asyncio loop on its own daemon thread (once)"""
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        threading.Thread(target=_loop.run_forever, name="async-db", daemon=True).start()
+    return _loop
+
+def run_async(coroutine, callback, widget=None):
+    """Run a coroutine on the bridge loop; callback(result) later runs on the Tk thread
+
+    The callback is skipped if widget has been destroyed in the meantime
+    (the user navigated to another page).
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, start_async_bridge())
+    future.add_done_callback(lambda done: _results.put((callback, widget, done)))
+    return future
+
+def gather_async(*coroutines):
+    """One coroutine running several others concurrently, for run_async"""
+    async def gather_all():
+        return await asyncio.gather(*coroutines)
+    return gather_all()
+
+def poll_async_results(widget, interval=50):
+    """Deliver finished results to their callbacks; call once from the Tk thread"""
+    while True:
+        try:
+            callback, owner, future = _results.get_nowait()
+        except queue.Empty:
+            break
+
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error in async query: {e}")
+            continue
+
+        if owner is not None and not owner.winfo_exists():
+            continue
+        try:
+            callback(result)
+        except Exception as e:
+            print(f"Error updating UI with async result: {e}")
+
+    widget.after(interval, poll_async_results, widget, interval)
@@ -0,0 +1,545 @@
+"""
+Offline playback for the User section of the Online Music Player application.
+Playlists pinned on this device are synced into a local store under
+offline_dir: song metadata and the pinned playlists in a small SQLite
+index, the audio as AES-GCM encrypted files, all within offline_budget_mb.
+The store key is kept in the OS keyring (keyring package), never next to
+the files it protects, so a copy of the store directory alone cannot be
+decrypted. Playback reads the
+store first, so pinned songs play while the database is slow or down; their
+waveform and loudness analysis is stored alongside.
+Plays that cannot be written to Listening_History are queued in the index
+and written on the next successful connection.
+"""
+
+import os
+import sys
+import base64
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+# Add parent directory to path so we can import from root (and the analytics rollups from admin)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "admin"))
+
+from db_config import APP_CONFIG
+from db_utils import connect_db
+from db_cache import hydrate_songs
+from admin_analytics import forget_rollup_days
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.exceptions import InvalidTag
+except ImportError:
+    AESGCM = None
+
+try:
+    import keyring
+    from keyring.errors import KeyringError
+except ImportError:
+    keyring = None
+    KeyringError = OSError
+
+NONCE_SIZE = 12
+KEYRING_SERVICE = "online-music-offline-store"
+# Where stores created before the keyring kept their key; moved into the keyring on first use
+LEGACY_KEY_FILE = "store.key"
+INDEX_FILE = "index.db"
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pins (
+    playlist_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    pinned_at TEXT NOT NULL,
+    synced_at TEXT
+);
+CREATE TABLE IF NOT EXISTS pin_songs (
+    playlist_id INTEGER NOT NULL,
+    song_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (playlist_id, song_id)
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    song_id INTEGER PRIMARY KEY,
+    version TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    title TEXT,
+    artist_name TEXT,
+    album_title TEXT,
+    genre_name TEXT,
+    duration INTEGER,
+    size INTEGER NOT NULL,
+    stored_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS track_analysis (
+    song_id INTEGER PRIMARY KEY,
+    duration_ms INTEGER NOT NULL,
+    loudness_lufs REAL NOT NULL,
+    replay_gain_db REAL NOT NULL,
+    sample_peak REAL NOT NULL,
+    bpm REAL,
+    waveform BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_plays (
+    play_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    song_id INTEGER NOT NULL,
+    played_at TEXT NOT NULL
+);
+"""
+
+# One sync at a time per process
+_sync_lock = threading.Lock()
+
+# Whether the OS keyring answered, checked once per process
+_keyring_usable = None
+
+# Song_Analysis columns copied into track_analysis, in order
+ANALYSIS_COLUMNS = ("duration_ms", "loudness_lufs", "replay_gain_db", "sample_peak", "bpm", "waveform")
+
+# ------------------- Local Store -------------------
+def offline_available():
+    """Whether the encryption library and a working OS keyring for its key are present"""
+    global _keyring_usable
+    if AESGCM is None or keyring is None:
+        return False
+    if _keyring_usable is None:
+        try:
+            keyring.get_password(KEYRING_SERVICE, "probe")
+            _keyring_usable = True
+        except KeyringError as e:
+            print(f"Offline playback disabled, no usable keyring: {e}")
+            _keyring_usable = False
+    return _keyring_usable
+
+def store_dir(user_id):
+    """Directory holding one user's offline index, key and audio"""
+    return os.path.join(APP_CONFIG.get("offline_dir", "offline"), f"user_{user_id}")
+
+def _has_store(user_id):
+    return os.path.exists(os.path.join(store_dir(user_id), INDEX_FILE))
+
+def _open_index(user_id):
+    directory = store_dir(user_id)
+    os.makedirs(directory, exist_ok=True)
+    index = sqlite3.connect(os.path.join(directory, INDEX_FILE), timeout=5.0)
+    index.executescript(INDEX_SCHEMA)
+    return index
+
+def _track_path(user_id, song_id):
+    return os.path.join(store_dir(user_id), f"{song_id}.enc")
+
+def _cipher(user_id):
+    """AES-GCM cipher with the store key from the OS keyring, created on first use
+
+    The keyring entry is per store directory, so two installs on one
+    machine do not share a key. Files encrypted under a lost key fail
+    their tag check and are simply downloaded again.
+    """
+    account = os.path.abspath(store_dir(user_id))
+    encoded = keyring.get_password(KEYRING_SERVICE, account)
+    if encoded is None:
+        legacy_path = os.path.join(store_dir(user_id), LEGACY_KEY_FILE)
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "rb") as f:
+                key = f.read()
+        else:
+            key = AESGCM.generate_key(bit_length=256)
+        keyring.set_password(KEYRING_SERVICE, account, base64.b64encode(key).decode())
+        encoded = keyring.get_password(KEYRING_SERVICE, account)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+    return AESGCM(base64.b64decode(encoded))
+
+def _associated_data(song_id, version):
+    # Binds each file to its song and version, so files cannot be swapped or replayed
+    return f"{song_id}:{version}".encode()
+
+def _write_track(user_id, cipher, song_id, version, data):
+    """Encrypt audio into the store atomically; returns the bytes used on disk"""
+    nonce = os.urandom(NONCE_SIZE)
+    path = _track_path(user_id, song_id)
+    temp_path = path + ".part"
+    with open(temp_path, "wb") as f:
+        f.write(nonce)
+        f.write(cipher.encrypt(nonce, data, _associated_data(song_id, version)))
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+def _remove_track_file(user_id, song_id):
+    try:
+        os.remove(_track_path(user_id, song_id))
+    except FileNotFoundError:
+        pass
+
+# ------------------- Pinning -------------------
+def pin_playlist(user_id, playlist_id, name):
+    """Keep a playlist on this device; its songs arrive with the next sync"""
+    with closing(_open_index(user_id)) as index, index:
+        index.execute(
+            "INSERT OR IGNORE INTO pins (playlist_id, name, pinned_at) VALUES (?, ?, ?)",
+            (playlist_id, name, datetime.now().isoformat(" ", "seconds"))
+        )
+
+def unpin_playlist(user_id, playlist_id):
+    """Stop keeping a playlist; songs no other pin needs are removed on the next sync"""
+    if not _has_store(user_id):
+        return
+    with closing(_open_index(user_id)) as index, index:
+        index.execute("DELETE FROM pin_songs WHERE playlist_id = ?", (playlist_id,))
+        index.execute("DELETE FROM pins WHERE playlist_id = ?", (playlist_id,))
+
+def pinned_playlist_ids(user_id):
+    """Ids of the playlists pinned on this device"""
+    if not _has_store(user_id):
+        return set()
+    with closing(_open_index(user_id)) as index:
+        return {row[0] for row in index.execute("SELECT playlist_id FROM pins")}
+
+def offline_playlists(user_id):
+    """Pinned playlists with summaries of their stored songs, shaped like get_user_playlists rows"""
+    if not _has_store(user_id):
+        return []
+    with closing(_open_index(user_id)) as index:
+        rows = index.execute(
+            """
+            SELECT p.playlist_id, p.name, p.synced_at, COUNT(t.song_id), COALESCE(SUM(t.duration), 0)
+            FROM pins p
+            LEFT JOIN pin_songs ps ON ps.playlist_id = p.playlist_id
+            LEFT JOIN tracks t ON t.song_id = ps.song_id
+            GROUP BY p.playlist_id, p.name, p.synced_at, p.pinned_at
+            ORDER BY p.pinned_at
+            """
+        ).fetchall()
+    return [
+        {
+            "playlist_id": playlist_id,
+            "name": name,
+            "description": "",
+            "created_at": None,
+            "song_count": song_count,
+            "total_duration": total_duration,
+            "cover_song_ids": [],
+            "last_modified": synced_at,
+            "offline": True
+        } for playlist_id, name, synced_at, song_count, total_duration in rows
+    ]
+
+def offline_playlist_songs(user_id, playlist_id, offset=0, limit=None):
+    """Stored songs of a pinned playlist in order, shaped like hydrate_songs rows"""
+    if not _has_store(user_id):
+        return []
+    with closing(_open_index(user_id)) as index:
+        rows = index.execute(
+            """
+            SELECT t.song_id, t.title, t.artist_name, t.album_title, t.genre_name, t.duration, t.file_type, t.size
+            FROM pin_songs ps JOIN tracks t ON t.song_id = ps.song_id
+            WHERE ps.playlist_id = ?
+            ORDER BY ps.position
+            LIMIT ? OFFSET ?
+            """,
+            (playlist_id, -1 if limit is None else limit, offset)
+        ).fetchall()
+    return [
+        {
+            "song_id": song_id, "title": title, "artist_name": artist_name, "album_title": album_title,
+            "genre_name": genre_name, "duration": duration, "file_type": file_type, "file_size": size,
+            "is_active": 1
+        } for song_id, title, artist_name, album_title, genre_name, duration, file_type, size in rows
+    ]
+
+def offline_usage(user_id):
+    """(stored songs, bytes used, plays waiting to be written) of the local store"""
+    if not _has_store(user_id):
+        return 0, 0, 0
+    with closing(_open_index(user_id)) as index:
+        songs, used = index.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tracks").fetchone()
+        pending = index.execute("SELECT COUNT(*) FROM pending_plays").fetchone()[0]
+    return songs, used, pending
+
+# ------------------- Playback -------------------
+def get_offline_song(user_id, song_id):
+    """Decrypted audio and metadata of a stored song (get_song_data's dict), or None
+
+    'analysis' holds the stored Song_Analysis row (None if the song had not
+    been analyzed when it was synced), so playback needs no database.
+    """
+    if not offline_available() or not _has_store(user_id):
+        return None
+    with closing(_open_index(user_id)) as index:
+        row = index.execute(
+            "SELECT version, file_type, title, artist_name, duration FROM tracks WHERE song_id = ?",
+            (song_id,)
+        ).fetchone()
+        analysis = index.execute(
+            f"SELECT {', '.join(ANALYSIS_COLUMNS)} FROM track_analysis WHERE song_id = ?",
+            (song_id,)
+        ).fetchone()
+    if not row:
+        return None
+
+    version, file_type, title, artist_name, duration = row
+    try:
+        with open(_track_path(user_id, song_id), "rb") as f:
+            nonce = f.read(NONCE_SIZE)
+            data = _cipher(user_id).decrypt(nonce, f.read(), _associated_data(song_id, version))
+    except (OSError, InvalidTag, KeyringError) as e:
+        # Missing or damaged: play from the database, the next sync stores it again
+        print(f"Error reading offline song {song_id}: {type(e).__name__} {e}")
+        with closing(_open_index(user_id)) as index, index:
+            index.execute("DELETE FROM tracks WHERE song_id = ?", (song_id,))
+        return None
+
+    return {
+        'data': data,
+        'type': file_type,
+        'title': title,
+        'artist': artist_name,
+        'duration': duration,
+        'analysis': dict(zip(ANALYSIS_COLUMNS, analysis)) if analysis else None
+    }
+
+# ------------------- Sync -------------------
+def _pinned_songs(cursor, user_id, playlist_ids):
+    """{playlist_id: [song_id, ...]} of pinned playlists still owned by the user; deleted ones are missing"""
+    songs = {}
+    for playlist_id in playlist_ids:
+        cursor.execute("SELECT playlist_id FROM Playlists WHERE playlist_id = %s AND user_id = %s", (playlist_id, user_id))
+        if not cursor.fetchone():
+            continue
+        cursor.execute(
+            """
+            SELECT ps.song_id
+            FROM Playlist_Songs ps
+            JOIN Active_Songs_Catalog s ON ps.song_id = s.song_id
+            WHERE ps.playlist_id = %s
+            ORDER BY ps.position
+            """,
+            (playlist_id,)
+        )
+        songs[playlist_id] = [row[0] for row in cursor.fetchall()]
+    return songs
+
+def _song_versions(cursor, song_ids, quality):
+    """{song_id: (version, estimated bytes)}; the version changes when the audio or quality does"""
+    versions = {}
+    for i in range(0, len(song_ids), 1000):
+        chunk = song_ids[i:i + 1000]
+        cursor.execute(
+            f"SELECT song_id, content_hash, file_size FROM Songs WHERE song_id IN ({', '.join(['%s'] * len(chunk))})",
+            chunk
+        )
+        for song_id, content_hash, file_size in cursor.fetchall():
+            versions[song_id] = (f"{content_hash or song_id}@{quality or 'original'}", file_size or 0)
+    return versions
+
+def sync_offline_store(user_id, fetch_song, quality=None):
+    """Bring the local store in line with the pinned playlists, within offline_budget_mb
+
+    fetch_song(song_id) returns get_song_data's dict. Songs are kept in pin
+    order (oldest pin first, then playlist order) until the budget is
+    spent; songs no pin needs any more are removed first, and only missing
+    or changed songs are downloaded. Queued plays are written first.
+    Returns {"stored", "downloaded", "removed", "skipped", "bytes"}, or None
+    if the database cannot be reached.
+    """
+    if not offline_available():
+        raise RuntimeError("Offline playback needs the cryptography and keyring packages and a working OS keyring")
+
+    with _sync_lock, closing(_open_index(user_id)) as index:
+        pins = [row[0] for row in index.execute("SELECT playlist_id FROM pins ORDER BY pinned_at")]
+
+        try:
+            connection = connect_db()
+            if not connection:
+                return None
+
+            cursor = connection.cursor()
+            flush_pending_plays(connection, user_id)
+            pinned_songs = _pinned_songs(cursor, user_id, pins)
+            wanted = list(dict.fromkeys(song_id for playlist_id in pins for song_id in pinned_songs.get(playlist_id, [])))
+            versions = _song_versions(cursor, wanted, quality)
+        finally:
+            if 'connection' in locals() and connection and connection.is_connected():
+                cursor.close()
+                connection.close()
+
+        with index:
+            for playlist_id in pins:
+                index.execute("DELETE FROM pin_songs WHERE playlist_id = ?", (playlist_id,))
+                if playlist_id not in pinned_songs:
+                    # Deleted on the server
+                    index.execute("DELETE FROM pins WHERE playlist_id = ?", (playlist_id,))
+                    continue
+                index.executemany(
+                    "INSERT INTO pin_songs (playlist_id, song_id, position) VALUES (?, ?, ?)",
+                    [(playlist_id, song_id, position) for position, song_id in enumerate(pinned_songs[playlist_id])]
+                )
+
+        stored = {song_id: (version, size) for song_id, version, size in index.execute("SELECT song_id, version, size FROM tracks")}
+        budget = APP_CONFIG.get("offline_budget_mb", 2048) * 1024 * 1024
+
+        # Plan with the stored size where the song is current, else the upload size (renditions are smaller)
+        keep, planned, skipped = [], 0, 0
+        for song_id in wanted:
+            if song_id not in versions:
+                continue
+            version, estimate = versions[song_id]
+            size = stored[song_id][1] if stored.get(song_id, (None,))[0] == version else estimate
+            if planned + size > budget:
+                skipped += 1
+                continue
+            keep.append(song_id)
+            planned += size
+
+        keep_set = set(keep)
+        removed = [song_id for song_id in stored if song_id not in keep_set or stored[song_id][0] != versions[song_id][0]]
+        with index:
+            for song_id in removed:
+                index.execute("DELETE FROM tracks WHERE song_id = ?", (song_id,))
+                index.execute("DELETE FROM track_analysis WHERE song_id = ?", (song_id,))
+                _remove_track_file(user_id, song_id)
+        used = sum(size for song_id, (version, size) in stored.items() if song_id not in removed)
+
+        cipher = _cipher(user_id)
+        metadata = {song["song_id"]: song for song in hydrate_songs(keep)}
+        downloaded = 0
+        for song_id in keep:
+            if song_id in stored and song_id not in removed:
+                continue
+            song_data = fetch_song(song_id)
+            if not song_data:
+                skipped += 1
+                continue
+            version = versions[song_id][0]
+            size = _write_track(user_id, cipher, song_id, version, song_data['data'])
+            if used + size > budget:
+                # The rendition came out larger than planned
+                _remove_track_file(user_id, song_id)
+                skipped += 1
+                continue
+            used += size
+            song = metadata.get(song_id, {})
+            # Committed per song, so an interrupted sync keeps what it stored
+            with index:
+                index.execute(
+                    """
+                    INSERT OR REPLACE INTO tracks
+                        (song_id, version, file_type, title, artist_name, album_title, genre_name, duration, size, stored_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (song_id, version, song_data['type'], song_data['title'], song_data['artist'],
+                     song.get("album_title"), song.get("genre_name"), song.get("duration"), size,
+                     datetime.now().isoformat(" ", "seconds"))
+                )
+            downloaded += 1
+
+        _sync_analysis(index, keep)
+        with index:
+            index.execute("UPDATE pins SET synced_at = ?", (datetime.now().isoformat(" ", "seconds"),))
+        stored_count = index.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    return {
+        "stored": stored_count,
+        "downloaded": downloaded,
+        "removed": len(removed),
+        "skipped": skipped,
+        "bytes": used
+    }
+
+def _sync_analysis(index, song_ids):
+    """Copy the Song_Analysis rows of stored songs that have none locally yet (analysis may finish after a sync)"""
+    have = {row[0] for row in index.execute("SELECT song_id FROM track_analysis")}
+    missing = [song_id for song_id in song_ids if song_id not in have]
+    if not missing:
+        return
+
+    rows = []
+    try:
+        connection = connect_db(quiet=True)
+        if not connection:
+            return
+
+        cursor = connection.cursor()
+        for i in range(0, len(missing), 1000):
+            chunk = missing[i:i + 1000]
+            cursor.execute(
+                f"SELECT song_id, {', '.join(ANALYSIS_COLUMNS)} FROM Song_Analysis "
+                f"WHERE song_id IN ({', '.join(['%s'] * len(chunk))})",
+                chunk
+            )
+            rows += [row[:-1] + (bytes(row[-1]),) for row in cursor.fetchall()]
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    with index:
+        index.executemany(
+            f"INSERT OR REPLACE INTO track_analysis (song_id, {', '.join(ANALYSIS_COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * (len(ANALYSIS_COLUMNS) + 1))})",
+            rows
+        )
+
+# ------------------- Listening History Queue -------------------
+def queue_play(user_id, song_id):
+    """Keep a play the database could not take, to be written by flush_pending_plays"""
+    with closing(_open_index(user_id)) as index, index:
+        index.execute(
+            "INSERT INTO pending_plays (song_id, played_at) VALUES (?, ?)",
+            (song_id, datetime.now().isoformat(" ", "seconds"))
+        )
+
+def has_pending_plays(user_id):
+    """Whether plays are waiting to be written to Listening_History"""
+    if not _has_store(user_id):
+        return False
+    with closing(_open_index(user_id)) as index:
+        return index.execute("SELECT 1 FROM pending_plays LIMIT 1").fetchone() is not None
+
+def flush_pending_plays(connection, user_id):
+    """Write queued plays to Listening_History with their original times; returns how many were written
+
+    Commits on the given connection before forgetting the plays locally.
+    Plays already present (same song and second, from a flush interrupted
+    after its commit) are not written twice. Cached analytics rollups of
+    the days the plays fall on are dropped in the same commit.
+    """
+    if not _has_store(user_id):
+        return 0
+    with closing(_open_index(user_id)) as index:
+        pending = index.execute("SELECT play_id, song_id, played_at FROM pending_plays ORDER BY play_id").fetchall()
+        if not pending:
+            return 0
+
+        cursor = connection.cursor()
+        try:
+            song_ids = sorted({song_id for _, song_id, _ in pending})
+            cursor.execute(
+                f"SELECT song_id FROM Songs WHERE song_id IN ({', '.join(['%s'] * len(song_ids))})",
+                song_ids
+            )
+            # Plays of songs deleted in the meantime are dropped
+            existing = {row[0] for row in cursor.fetchall()}
+            played_times = [played_at for _, _, played_at in pending]
+            cursor.execute(
+                "SELECT song_id, played_at FROM Listening_History WHERE user_id = %s AND played_at BETWEEN %s AND %s",
+                (user_id, min(played_times), max(played_times))
+            )
+            present = {(song_id, str(played_at)) for song_id, played_at in cursor.fetchall()}
+            rows = [(user_id, song_id, played_at) for _, song_id, played_at in pending
+                    if song_id in existing and (song_id, played_at) not in present]
+            if rows:
+                cursor.executemany(
+                    "INSERT INTO Listening_History (user_id, song_id, played_at) VALUES (%s, %s, %s)",
+                    rows
+                )
+                forget_rollup_days(cursor, [datetime.fromisoformat(str(played_at)).date() for _, _, played_at in rows])
+            connection.commit()
+        finally:
+            cursor.close()
+
+        with index:
+            index.execute("DELETE FROM pending_plays WHERE play_id <= ?", (pending[-1][0],))
+        return len(rows)
@@ -0,0 +1,172 @@
+"""
+Track prefetching for the User section of the Online Music Player application.
+While a song plays, the next tracks of the queue are fetched from the
+database on a background thread and written to the temp directory, so the
+player can hand them to mixer.music.queue for a gapless transition instead
+of blocking the UI on a blob download between songs. A song whose usual
+file the mixer is still playing gets a uniquely named copy instead, which
+is deleted once it is neither playing nor in the prefetch window.
+"""
+
+import glob
+import os
+import queue
+import tempfile
+import threading
+
+_requests = queue.Queue()
+_lock = threading.Lock()
+_ready = {}
+_pending = set()
+_worker = None
+_fetch_song = None
+_fetch_analysis = None
+_temp_dir = None
+# Files the mixer has loaded or queued, which must not be overwritten
+_in_use = set()
+# Uniquely named copies written because the usual file was in use
+_fallbacks = set()
+
+# ------------------- Song Files -------------------
+def song_file_path(temp_dir, song_id, file_type):
+    """Temp file a song is played from"""
+    return os.path.join(temp_dir, f"song_{song_id}.{file_type}")
+
+def set_files_in_use(*paths):
+    """Record the files the mixer now has loaded or queued (None entries are ignored)"""
+    with _lock:
+        _in_use.clear()
+        _in_use.update(os.path.abspath(path) for path in paths if path)
+        _release_fallbacks()
+
+def _release_fallbacks():
+    """Delete the unique copies nothing plays or prefetches any more (caller holds _lock)"""
+    kept = _in_use | {os.path.abspath(prefetched['path']) for prefetched in _ready.values()}
+    for path in list(_fallbacks - kept):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # Still open (Windows); tried again on the next release
+            continue
+        _fallbacks.discard(path)
+
+def _write_unique(temp_dir, song_id, song_data):
+    """Write song bytes to a new uniquely named file and return its path"""
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, written_path = tempfile.mkstemp(dir=temp_dir, prefix=f"song_{song_id}.", suffix=f".{song_data['type']}")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(song_data['data'])
+    return written_path
+
+def _place(temp_dir, song_id, file_type, written_path):
+    """Rename a written file onto the song's usual path unless that one is in use (caller holds _lock)
+
+    Returns the path to play: the usual one, or the unique one when the mixer
+    has the usual file loaded or queued or the rename is refused because the
+    file is open. Unique files are remembered so _release_fallbacks deletes them.
+    """
+    file_path = song_file_path(temp_dir, song_id, file_type)
+    if os.path.abspath(file_path) not in _in_use:
+        try:
+            os.replace(written_path, file_path)
+            return file_path
+        except PermissionError:
+            # Windows will not replace a file another handle has open
+            pass
+    _fallbacks.add(os.path.abspath(written_path))
+    return written_path
+
+def write_song_file(temp_dir, song_id, song_data):
+    """Write fetched song bytes to the temp directory and return the path to play
+
+    The caller marks the returned file with set_files_in_use when it loads it.
+    """
+    written_path = _write_unique(temp_dir, song_id, song_data)
+    with _lock:
+        return _place(temp_dir, song_id, song_data['type'], written_path)
+
+def _sweep_song_files(temp_dir):
+    """Delete song files left in the temp directory by earlier sessions"""
+    for path in glob.glob(os.path.join(temp_dir, "song_*.*")):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error removing stale song file {path}: {e}")
+
+# ------------------- Background Worker -------------------
+def _worker_loop():
+    """Fetch requested songs one at a time until the process exits"""
+    while True:
+        song_id = _requests.get()
+        with _lock:
+            if song_id not in _pending:
+                # Dropped from the window before we got to it
+                continue
+
+        try:
+            song_data = _fetch_song(song_id)
+            if song_data:
+                prefetched = {
+                    'type': song_data['type'],
+                    'title': song_data['title'],
+                    'artist': song_data['artist'],
+                    'duration': song_data.get('duration'),
+                    # Songs from the offline store bring their stored analysis
+                    'analysis': (song_data['analysis'] if 'analysis' in song_data
+                                 else _fetch_analysis(song_id) if _fetch_analysis else None)
+                }
+                written_path = _write_unique(_temp_dir, song_id, song_data)
+                # Placed and published under one lock, so no release can run in between
+                with _lock:
+                    if song_id in _pending:
+                        prefetched['path'] = _place(_temp_dir, song_id, song_data['type'], written_path)
+                        _ready[song_id] = prefetched
+                    else:
+                        os.remove(written_path)
+        except Exception as e:
+            print(f"Error prefetching song {song_id}: {e}")
+        finally:
+            with _lock:
+                _pending.discard(song_id)
+
+def start_prefetcher(fetch_song, fetch_analysis, temp_dir):
+    """Start the background fetch thread (once)
+
+    fetch_song(song_id) returns get_song_data's dict; fetch_analysis(song_id)
+    returns the stored waveform/loudness or None.
+    """
+    global _worker, _fetch_song, _fetch_analysis, _temp_dir
+    _fetch_song = fetch_song
+    _fetch_analysis = fetch_analysis
+    _temp_dir = temp_dir
+    if _worker is None:
+        # Nothing is playing yet, so every song file is left over
+        _sweep_song_files(temp_dir)
+        _worker = threading.Thread(target=_worker_loop, name="prefetch", daemon=True)
+        _worker.start()
+
+# ------------------- Prefetch Window -------------------
+def prefetch_songs(song_ids, keep=()):
+    """Make song_ids the prefetch window, forgetting everything else except keep"""
+    wanted = set(song_ids) | set(keep)
+    with _lock:
+        for song_id in list(_ready):
+            if song_id not in wanted:
+                del _ready[song_id]
+        _pending.intersection_update(wanted)
+        _release_fallbacks()
+
+        for song_id in song_ids:
+            if song_id not in _ready and song_id not in _pending:
+                _pending.add(song_id)
+                _requests.put(song_id)
+
+def get_prefetched(song_id):
+    """Prefetched file and metadata for a song, or None if it is not ready yet"""
+    with _lock:
+        prefetched = _ready.get(song_id)
+    if prefetched and not os.path.exists(prefetched['path']):
+        return None
+    return prefetched
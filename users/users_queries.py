@@ -0,0 +1,153 @@
+"""
+Shared queries for the User section of the Online Music Player application.
+The blocking functions in users_view and the coroutines in users_async run
+exactly the same SQL, so both are built from the statements and helpers here.
+Song lists read Active_Songs_Catalog (active_catalog.py), which only holds
+active songs, so they need neither an is_active filter nor name joins.
+"""
+
+import random
+
+# ------------------- Song Lists -------------------
+FEATURED_SONGS = """
+SELECT s.song_id, s.title, s.artist_name, COUNT(lh.history_id) as play_count
+FROM Active_Songs_Catalog s
+LEFT JOIN Listening_History lh ON s.song_id = lh.song_id
+GROUP BY s.song_id
+ORDER BY play_count DESC
+LIMIT %s
+"""
+
+RECENT_SONGS = """
+SELECT s.song_id, s.title, s.artist_name
+FROM Active_Songs_Catalog s
+ORDER BY s.upload_date DESC
+LIMIT %s
+"""
+
+USER_FAVORITE_SONGS = """
+SELECT s.song_id, s.title, s.artist_name, COUNT(lh.history_id) as play_count,
+       s.genre_name, s.file_size, s.file_type
+FROM Listening_History lh
+JOIN Active_Songs_Catalog s ON lh.song_id = s.song_id
+WHERE lh.user_id = %s
+GROUP BY s.song_id
+ORDER BY play_count DESC
+LIMIT %s
+"""
+
+POPULAR_SONGS = """
+SELECT s.song_id, s.title, s.artist_name, COUNT(lh.history_id) as play_count,
+       s.genre_name, s.file_size, s.file_type
+FROM Active_Songs_Catalog s
+LEFT JOIN Listening_History lh ON s.song_id = lh.song_id
+GROUP BY s.song_id
+ORDER BY play_count DESC
+LIMIT %s
+"""
+
+RECENT_SONGS_WITH_SIZE = """
+SELECT s.song_id, s.title, s.artist_name, s.file_size, s.file_type,
+       s.genre_name, 0 as play_count
+FROM Active_Songs_Catalog s
+ORDER BY s.upload_date DESC
+LIMIT %s
+"""
+
+# Shown when the catalog is empty
+FALLBACK_SONGS = [
+    {"song_id": 1, "title": "Blinding Lights", "artist_name": "The Weeknd", "genre_name": "Pop"},
+    {"song_id": 2, "title": "Levitating", "artist_name": "Dua Lipa", "genre_name": "Pop"},
+    {"song_id": 3, "title": "Believer", "artist_name": "Imagine Dragons", "genre_name": "Rock"},
+    {"song_id": 4, "title": "Shape of You", "artist_name": "Ed Sheeran", "genre_name": "Pop"}
+]
+
+def random_songs_query(limit, exclude_ids=None):
+    """(query, params) for random active songs, optionally excluding some ids"""
+    exclusion_filter = ""
+    params = []
+
+    if exclude_ids:
+        placeholders = ", ".join(["%s"] * len(exclude_ids))
+        exclusion_filter = f"WHERE s.song_id NOT IN ({placeholders})"
+        params = list(exclude_ids)
+
+    query = f"""
+    SELECT s.song_id, s.title, s.artist_name, s.genre_name
+    FROM Active_Songs_Catalog s
+    {exclusion_filter}
+    ORDER BY RAND()
+    LIMIT %s
+    """
+    return query, params + [limit]
+
+def fallback_songs(limit):
+    """Shuffled placeholder songs for an empty catalog"""
+    songs = [dict(song) for song in FALLBACK_SONGS]
+    random.shuffle(songs)
+    return songs[:limit]
+
+def add_formatted_sizes(songs, format_file_size):
+    """Add the file_size_formatted key the download page shows"""
+    for song in songs:
+        song['file_size_formatted'] = format_file_size(song['file_size'])
+    return songs
+
+# ------------------- Recommendations -------------------
+FAVORITE_GENRES = """
+SELECT g.genre_id, g.name as genre_name, COUNT(lh.history_id) as count
+FROM Listening_History lh
+JOIN Songs s ON lh.song_id = s.song_id
+JOIN Genres g ON s.genre_id = g.genre_id
+WHERE lh.user_id = %s AND g.genre_id IS NOT NULL
+GROUP BY g.genre_id
+ORDER BY count DESC
+LIMIT 3
+"""
+
+FAVORITE_ARTISTS = """
+SELECT a.artist_id, a.name as artist_name, COUNT(lh.history_id) as count
+FROM Listening_History lh
+JOIN Songs s ON lh.song_id = s.song_id
+JOIN Artists a ON s.artist_id = a.artist_id
+WHERE lh.user_id = %s
+GROUP BY a.artist_id
+ORDER BY count DESC
+LIMIT 3
+"""
+
+LISTENED_SONG_IDS = "SELECT song_id FROM Listening_History WHERE user_id = %s"
+
+def recommended_songs_query(favorite_genres, favorite_artists, listened_songs, limit):
+    """(query, params) for random songs in the user's favorite genres/artists they have not heard"""
+    genre_filter = ""
+    genre_params = []
+    if favorite_genres:
+        genre_ids = [g['genre_id'] for g in favorite_genres]
+        placeholders = ", ".join(["%s"] * len(genre_ids))
+        genre_filter = f"OR s.genre_id IN ({placeholders})"
+        genre_params = genre_ids
+
+    artist_filter = ""
+    artist_params = []
+    if favorite_artists:
+        artist_ids = [a['artist_id'] for a in favorite_artists]
+        placeholders = ", ".join(["%s"] * len(artist_ids))
+        artist_filter = f"OR s.artist_id IN ({placeholders})"
+        artist_params = artist_ids
+
+    exclusion_filter = ""
+    exclusion_params = []
+    if listened_songs:
+        placeholders = ", ".join(["%s"] * len(listened_songs))
+        exclusion_filter = f"AND s.song_id NOT IN ({placeholders})"
+        exclusion_params = listened_songs
+
+    query = f"""
+    SELECT s.song_id, s.title, s.artist_name, s.genre_name
+    FROM Active_Songs_Catalog s
+    WHERE 1=0 {genre_filter} {artist_filter} {exclusion_filter}
+    ORDER BY RAND()
+    LIMIT %s
+    """
+    return query, genre_params + artist_params + exclusion_params + [limit]
@@ -2,19 +2,40 @@ import os
 import sys
 import subprocess
 import customtkinter as ctk
-from tkinter import messagebox, filedialog, ttk
+from tkinter import messagebox, filedialog, ttk, Canvas
 from pygame import mixer
 import random
 import time
 import io
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 # Add parent directory to path so we can import from root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from blob_store import iter_blob_chunks
+from db_cache import hydrate_songs, get_cached_genres
+from db_statements import fetch_prepared, execute_prepared
+from playlist_store import (
+    append_songs, move_song, remove_songs, apply_operations, refresh_covers, parse_cover_song_ids
+)
+from smart_playlists import validate_rules, describe_rules, refresh_smart_playlist
+from change_log import changes_since, latest_version
+from users_prefetch import start_prefetcher, prefetch_songs, get_prefetched, write_song_file, set_files_in_use
+from users_async import run_async, gather_async, poll_async_results
+from users_offline import (
+    offline_available, pin_playlist, unpin_playlist, pinned_playlist_ids, offline_playlists,
+    offline_playlist_songs, offline_usage, get_offline_song, sync_offline_store,
+    queue_play, has_pending_plays, flush_pending_plays
+)
+import users_async
+import users_queries
+
 # Import from other modules
 try:
     from db_config import UI_CONFIG, COLORS, APP_CONFIG
-    from db_utils import connect_db, get_current_user, ensure_directories_exist, format_file_size, create_song_card
+    from db_utils import connect_db, get_current_user, get_current_user_id, ensure_directories_exist, format_file_size, create_song_card
     USE_CONFIG = True
 except ImportError:
     USE_CONFIG = False
@@ -60,7 +81,8 @@ current_song = {
     "title": "No song playing",
     "artist": "",
     "playing": False,
-    "paused": False
+    "paused": False,
+    "path": None
 }
 
 # Song queue for navigation
@@ -68,6 +90,23 @@ song_queue = []
 queue_index = -1
 queue_context = None
 
+# Precomputed waveform/loudness of the current song, and where playback was last started
+current_analysis = None
+seek_offset = 0.0
+waveform_columns = 0
+
+# Next track already handed to mixer.music.queue for a gapless transition
+queued_song = None
+
+# Thread writing plays to Listening_History (record_play_in_background)
+_history_writer = None
+
+# Songs per page of the playlist detail view
+PLAYLIST_PAGE_SIZE = 50
+
+# Playlist summaries per user id and the Change_Log version they reflect
+playlist_caches = {}
+
 # ------------------- Data Functions -------------------
 # Modify the get_featured_songs function
 def get_featured_songs(limit=3):
@@ -79,30 +118,11 @@ def get_featured_songs(limit=3):
             
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-        SELECT s.song_id, s.title, a.name as artist_name, COUNT(lh.history_id) as play_count 
-        FROM Songs s
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Listening_History lh ON s.song_id = lh.song_id
-        WHERE s.is_active = 1  # Only show active songs
-        GROUP BY s.song_id
-        ORDER BY play_count DESC
-        LIMIT %s
-        """
-        
-        cursor.execute(query, (limit,))
+        cursor.execute(users_queries.FEATURED_SONGS, (limit,))
         songs = cursor.fetchall()
         
         if not songs:
-            query = """
-            SELECT s.song_id, s.title, a.name as artist_name 
-            FROM Songs s
-            JOIN Artists a ON s.artist_id = a.artist_id
-            WHERE s.is_active = 1  # Only show active songs
-            ORDER BY s.upload_date DESC
-            LIMIT %s
-            """
-            cursor.execute(query, (limit,))
+            cursor.execute(users_queries.RECENT_SONGS, (limit,))
             songs = cursor.fetchall()
             
         return songs
@@ -134,12 +154,10 @@ def search_songs(query, search_type="all"):
         if search_type == "all":
             album_check_query = """
             SELECT COUNT(*) as album_count
-            FROM Albums al
-            JOIN Songs s ON s.album_id = al.album_id
-            WHERE al.title LIKE %s AND s.is_active = 1  # Only count albums with active songs
+            FROM Active_Songs_Catalog s
+            WHERE s.album_name LIKE %s  # Only count albums with active songs
             """
-            cursor.execute(album_check_query, (search_param,))
-            album_count = cursor.fetchone()['album_count']
+            album_count = fetch_prepared(connection, album_check_query, (search_param,))[0][0]
             
             # If albums are found, switch search type to album
             if album_count > 0:
@@ -147,57 +165,39 @@ def search_songs(query, search_type="all"):
         
         if search_type == "song":
             query = """
-            SELECT s.song_id, s.title, a.name as artist_name, al.title as album_name, 
-                   g.name as genre, s.duration
-            FROM Songs s
-            JOIN Artists a ON s.artist_id = a.artist_id
-            LEFT JOIN Albums al ON s.album_id = al.album_id
-            LEFT JOIN Genres g ON s.genre_id = g.genre_id
-            WHERE s.title LIKE %s AND s.is_active = 1  # Only show active songs
+            SELECT s.song_id, s.title, s.artist_name, s.album_name, s.genre_name as genre, s.duration
+            FROM Active_Songs_Catalog s
+            WHERE s.title LIKE %s
             ORDER BY s.title
             """
-            cursor.execute(query, (search_param,))
+            songs = fetch_prepared(connection, query, (search_param,), dictionary=True)
         
         elif search_type == "artist":
             query = """
-            SELECT s.song_id, s.title, a.name as artist_name, al.title as album_name, 
-                   g.name as genre, s.duration
-            FROM Songs s
-            JOIN Artists a ON s.artist_id = a.artist_id
-            LEFT JOIN Albums al ON s.album_id = al.album_id
-            LEFT JOIN Genres g ON s.genre_id = g.genre_id
-            WHERE a.name LIKE %s AND s.is_active = 1  # Only show active songs
-            ORDER BY a.name, s.title
+            SELECT s.song_id, s.title, s.artist_name, s.album_name, s.genre_name as genre, s.duration
+            FROM Active_Songs_Catalog s
+            WHERE s.artist_name LIKE %s
+            ORDER BY s.artist_name, s.title
             """
-            cursor.execute(query, (search_param,))
+            songs = fetch_prepared(connection, query, (search_param,), dictionary=True)
             
         elif search_type == "album":
             query = """
-            SELECT s.song_id, s.title, a.name as artist_name, al.title as album_name, 
-                   g.name as genre, s.duration
-            FROM Songs s
-            JOIN Artists a ON s.artist_id = a.artist_id
-            LEFT JOIN Albums al ON s.album_id = al.album_id
-            LEFT JOIN Genres g ON s.genre_id = g.genre_id
-            WHERE al.title LIKE %s AND s.is_active = 1  # Only show active songs
-            ORDER BY al.title, s.title
+            SELECT s.song_id, s.title, s.artist_name, s.album_name, s.genre_name as genre, s.duration
+            FROM Active_Songs_Catalog s
+            WHERE s.album_name LIKE %s
+            ORDER BY s.album_name, s.title
             """
-            cursor.execute(query, (search_param,))
+            songs = fetch_prepared(connection, query, (search_param,), dictionary=True)
             
         else:  # "all" without album matches
             query = """
-            SELECT s.song_id, s.title, a.name as artist_name, al.title as album_name, 
-                   g.name as genre, s.duration
-            FROM Songs s
-            JOIN Artists a ON s.artist_id = a.artist_id
-            LEFT JOIN Albums al ON s.album_id = al.album_id
-            LEFT JOIN Genres g ON s.genre_id = g.genre_id
-            WHERE (s.title LIKE %s OR a.name LIKE %s OR al.title LIKE %s) AND s.is_active = 1  # Only show active songs
+            SELECT s.song_id, s.title, s.artist_name, s.album_name, s.genre_name as genre, s.duration
+            FROM Active_Songs_Catalog s
+            WHERE s.title LIKE %s OR s.artist_name LIKE %s OR s.album_name LIKE %s
             ORDER BY s.title
             """
-            cursor.execute(query, (search_param, search_param, search_param))
-        
-        songs = cursor.fetchall()
+            songs = fetch_prepared(connection, query, (search_param, search_param, search_param), dictionary=True)
         
         for song in songs:
             minutes, seconds = divmod(song['duration'] or 0, 60)
@@ -219,8 +219,7 @@ def search_songs(query, search_type="all"):
 def get_user_favorite_songs(limit=8):
     """Get the current user's favorite songs"""
     try:
-        with open("current_user.txt", "r") as f:
-            user_id = f.read().strip()
+        user_id = get_current_user_id()
             
         connection = connect_db()
         if not connection:
@@ -228,26 +227,10 @@ def get_user_favorite_songs(limit=8):
             
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-        SELECT s.song_id, s.title, a.name as artist_name, COUNT(lh.history_id) as play_count,
-               g.name as genre_name, s.file_size, s.file_type
-        FROM Listening_History lh
-        JOIN Songs s ON lh.song_id = s.song_id
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        WHERE lh.user_id = %s AND s.is_active = 1  # Only show active songs
-        GROUP BY s.song_id
-        ORDER BY play_count DESC
-        LIMIT %s
-        """
-        
-        cursor.execute(query, (user_id, limit))
+        cursor.execute(users_queries.USER_FAVORITE_SONGS, (user_id, limit))
         songs = cursor.fetchall()
-        
-        for song in songs:
-            song['file_size_formatted'] = format_file_size(song['file_size'])
             
-        return songs
+        return users_queries.add_formatted_sizes(songs, format_file_size)
         
     except Exception as e:
         print(f"Error getting user favorite songs: {e}")
@@ -269,19 +252,17 @@ def get_random_songs(limit=8, exclude_ids=None):
             
         cursor = connection.cursor(dictionary=True)
         
-        exclusion_filter = "WHERE s.is_active = 1"  # Always filter for active songs
+        exclusion_filter = ""
         params = []
         
         if exclude_ids and len(exclude_ids) > 0:
             placeholders = ", ".join(["%s"] * len(exclude_ids))
-            exclusion_filter = f"WHERE s.is_active = 1 AND s.song_id NOT IN ({placeholders})"
+            exclusion_filter = f"WHERE s.song_id NOT IN ({placeholders})"
             params = exclude_ids
         
         query = f"""
-        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name
-        FROM Songs s
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
+        SELECT s.song_id, s.title, s.artist_name, s.genre_name
+        FROM Active_Songs_Catalog s
         {exclusion_filter}
         ORDER BY RAND()
         LIMIT %s
@@ -322,12 +303,10 @@ def get_playlist_songs(playlist_id):
         cursor = connection.cursor(dictionary=True)
         
         query = """
-        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name
+        SELECT s.song_id, s.title, s.artist_name, s.genre_name
         FROM Playlist_Songs ps
-        JOIN Songs s ON ps.song_id = s.song_id
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        WHERE ps.playlist_id = %s AND s.is_active = 1  # Only show active songs
+        JOIN Active_Songs_Catalog s ON ps.song_id = s.song_id  # Only show active songs
+        WHERE ps.playlist_id = %s
         ORDER BY ps.position
         """
         
@@ -344,8 +323,12 @@ def get_playlist_songs(playlist_id):
             cursor.close()
             connection.close()
 
-def get_song_data(song_id):
-    """Get binary song data from database"""
+def get_song_data(song_id, quality=None):
+    """Get binary song data from database
+
+    quality is the minimum rendition bitrate in kbps; the smallest rendition
+    that meets it is returned, else the original upload.
+    """
     try:
         connection = connect_db()
         if not connection:
@@ -354,20 +337,43 @@ def get_song_data(song_id):
         cursor = connection.cursor()
         
         query = """
-        SELECT s.file_data, s.file_type, s.title, a.name as artist_name 
+        SELECT s.file_type, s.title, a.name as artist_name, s.content_hash
         FROM Songs s
         JOIN Artists a ON s.artist_id = a.artist_id
         WHERE s.song_id = %s
         """
-        cursor.execute(query, (song_id,))
+        rows = fetch_prepared(connection, query, (song_id,))
         
-        result = cursor.fetchone()
+        result = rows[0] if rows else None
         if result:
+            file_type, title, artist, content_hash = result
+            
+            if quality:
+                renditions = fetch_prepared(
+                    connection,
+                    """
+                    SELECT content_hash, file_type FROM Song_Renditions
+                    WHERE song_id = %s AND bitrate >= %s
+                    ORDER BY bitrate
+                    LIMIT 1
+                    """,
+                    (song_id, quality)
+                )
+                if renditions:
+                    content_hash, file_type = renditions[0]
+            
+            # Shared audio bytes, streamed uploads being stored as chunk rows
+            data = b''.join(iter_blob_chunks(cursor, content_hash)) if content_hash else b''
+            if not data:
+                # Songs from before the blob store still hold their audio inline
+                cursor.execute("SELECT file_data FROM Songs WHERE song_id = %s", (song_id,))
+                data = cursor.fetchone()[0]
+            
             return {
-                'data': result[0], 
-                'type': result[1],
-                'title': result[2],
-                'artist': result[3]
+                'data': data, 
+                'type': file_type,
+                'title': title,
+                'artist': artist
             }
         return None
         
@@ -379,52 +385,80 @@ def get_song_data(song_id):
             cursor.close()
             connection.close()
 
+def load_song_data(song_id):
+    """Song bytes and metadata for playback: the offline store first, else the database"""
+    return (get_offline_song(get_current_user_id(), song_id)
+            or get_song_data(song_id, APP_CONFIG.get("playback_quality")))
+
 def get_song_info(song_id):
-    """Get song information from the database"""
+    """Get song information (cached)"""
+    songs = hydrate_songs([song_id])
+    if not songs:
+        return None
+    song = songs[0]
+    return {
+        "title": song["title"],
+        "artist_name": song["artist_name"],
+        "duration": song["duration"],
+        "genre": song["genre_name"]
+    }
+
+def get_song_analysis(song_id):
+    """Get precomputed duration, loudness and waveform of a song, or None if not analyzed yet"""
     try:
-        connection = connect_db()
+        connection = connect_db(quiet=True)
         if not connection:
             return None
             
         cursor = connection.cursor(dictionary=True)
-        
-        query = """
-        SELECT s.title, a.name as artist_name, s.duration, g.name as genre
-        FROM Songs s
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        WHERE s.song_id = %s
-        """
-        
-        cursor.execute(query, (song_id,))
+        cursor.execute(
+            """
+            SELECT duration_ms, loudness_lufs, replay_gain_db, sample_peak, bpm, waveform
+            FROM Song_Analysis
+            WHERE song_id = %s
+            """,
+            (song_id,)
+        )
         return cursor.fetchone()
         
     except Exception as e:
-        print(f"Error fetching song info: {e}")
+        print(f"Error getting song analysis: {e}")
         return None
     finally:
         if 'connection' in locals() and connection and connection.is_connected():
             cursor.close()
             connection.close()
 
-def record_listening_history(song_id):
-    """Record that the current user listened to a song"""
+def record_listening_history(song_id, user_id=None):
+    """Record that the current user (or user_id) listened to a song
+
+    While the database is unreachable the play is queued on this device;
+    queued plays are written along with the next one that gets through.
+    """
+    recorded = False
     try:
-        with open("current_user.txt", "r") as f:
-            user_id = f.read().strip()
+        user_id = user_id or get_current_user_id()
             
-        connection = connect_db()
+        connection = connect_db(quiet=True)
         if not connection:
+            queue_play(user_id, song_id)
             return
             
         cursor = connection.cursor()
         
+        # Queued plays go first, so they cannot be mistaken for copies of this one
+        if has_pending_plays(user_id):
+            flush_pending_plays(connection, user_id)
+        
         query = "INSERT INTO Listening_History (user_id, song_id) VALUES (%s, %s)"
-        cursor.execute(query, (user_id, song_id))
+        execute_prepared(connection, query, (user_id, song_id))
         connection.commit()
+        recorded = True
         
     except Exception as e:
         print(f"Error recording listening history: {e}")
+        if not recorded and 'user_id' in locals():
+            queue_play(user_id, song_id)
     finally:
         if 'connection' in locals() and connection and connection.is_connected():
             cursor.close()
@@ -433,6 +467,13 @@ def record_listening_history(song_id):
 
 
 
+def record_play_in_background(song_id):
+    """record_listening_history on the history writer thread, so playback never waits on the database"""
+    global _history_writer
+    if _history_writer is None:
+        # One thread keeps the plays in order
+        _history_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-writer")
+    _history_writer.submit(record_listening_history, song_id, get_current_user_id())
 
 def get_popular_songs(limit=8):
     """Get most popular songs from the database"""
@@ -443,40 +484,14 @@ def get_popular_songs(limit=8):
             
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-        SELECT s.song_id, s.title, a.name as artist_name, COUNT(lh.history_id) as play_count, 
-               g.name as genre_name, s.file_size, s.file_type
-        FROM Songs s
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        LEFT JOIN Listening_History lh ON s.song_id = lh.song_id
-        WHERE s.is_active = 1  # Only show active songs
-        GROUP BY s.song_id
-        ORDER BY play_count DESC
-        LIMIT %s
-        """
-        
-        cursor.execute(query, (limit,))
+        cursor.execute(users_queries.POPULAR_SONGS, (limit,))
         songs = cursor.fetchall()
         
         if not songs:
-            query = """
-            SELECT s.song_id, s.title, a.name as artist_name, s.file_size, s.file_type,
-                   g.name as genre_name, 0 as play_count
-            FROM Songs s
-            JOIN Artists a ON s.artist_id = a.artist_id
-            LEFT JOIN Genres g ON s.genre_id = g.genre_id
-            WHERE s.is_active = 1  # Only show active songs
-            ORDER BY s.upload_date DESC
-            LIMIT %s
-            """
-            cursor.execute(query, (limit,))
+            cursor.execute(users_queries.RECENT_SONGS_WITH_SIZE, (limit,))
             songs = cursor.fetchall()
             
-        for song in songs:
-            song['file_size_formatted'] = format_file_size(song['file_size'])
-            
-        return songs
+        return users_queries.add_formatted_sizes(songs, format_file_size)
         
     except Exception as e:
         print(f"Error fetching popular songs: {e}")
@@ -489,8 +504,7 @@ def get_popular_songs(limit=8):
 def get_recommended_songs(limit=8):
     """Get songs recommended based on user's listening history"""
     try:
-        with open("current_user.txt", "r") as f:
-            user_id = f.read().strip()
+        user_id = get_current_user_id()
         
         favorite_genres = get_favorite_genres()
         favorite_artists = get_favorite_artists()
@@ -504,51 +518,13 @@ def get_recommended_songs(limit=8):
             
         cursor = connection.cursor(dictionary=True)
         
-        cursor.execute(
-            "SELECT song_id FROM Listening_History WHERE user_id = %s",
-            (user_id,)
-        )
+        cursor.execute(users_queries.LISTENED_SONG_IDS, (user_id,))
         listened_songs = [row['song_id'] for row in cursor.fetchall()]
         
-        genre_filter = ""
-        genre_params = []
-        if favorite_genres:
-            genre_ids = [g['genre_id'] for g in favorite_genres]
-            placeholders = ", ".join(["%s"] * len(genre_ids))
-            genre_filter = f"OR s.genre_id IN ({placeholders})"
-            genre_params = genre_ids
-        
-        artist_filter = ""
-        artist_params = []
-        if favorite_artists:
-            artist_ids = [a['artist_id'] for a in favorite_artists]
-            placeholders = ", ".join(["%s"] * len(artist_ids))
-            artist_filter = f"OR s.artist_id IN ({placeholders})"
-            artist_params = artist_ids
-        
-        exclusion_filter = ""
-        exclusion_params = []
-        if listened_songs:
-            placeholders = ", ".join(["%s"] * len(listened_songs))
-            exclusion_filter = f"AND s.song_id NOT IN ({placeholders})"
-            exclusion_params = listened_songs
-        
-        if not listened_songs:
-            exclusion_filter = ""
-            exclusion_params = []
-        
-        query = f"""
-        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name
-        FROM Songs s
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        WHERE 1=0 {genre_filter} {artist_filter} {exclusion_filter}
-        ORDER BY RAND()
-        LIMIT %s
-        """
-        
-        all_params = genre_params + artist_params + exclusion_params + [limit]
-        cursor.execute(query, all_params)
+        query, params = users_queries.recommended_songs_query(
+            favorite_genres, favorite_artists, listened_songs, limit
+        )
+        cursor.execute(query, params)
         recommendations = cursor.fetchall()
         
         if len(recommendations) < limit:
@@ -571,8 +547,7 @@ def get_recommended_songs(limit=8):
 def get_favorite_genres():
     """Get user's favorite genres based on listening history"""
     try:
-        with open("current_user.txt", "r") as f:
-            user_id = f.read().strip()
+        user_id = get_current_user_id()
             
         connection = connect_db()
         if not connection:
@@ -580,18 +555,7 @@ def get_favorite_genres():
             
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-        SELECT g.genre_id, g.name as genre_name, COUNT(lh.history_id) as count
-        FROM Listening_History lh
-        JOIN Songs s ON lh.song_id = s.song_id
-        JOIN Genres g ON s.genre_id = g.genre_id
-        WHERE lh.user_id = %s AND g.genre_id IS NOT NULL
-        GROUP BY g.genre_id
-        ORDER BY count DESC
-        LIMIT 3
-        """
-        
-        cursor.execute(query, (user_id,))
+        cursor.execute(users_queries.FAVORITE_GENRES, (user_id,))
         genres = cursor.fetchall()
         
         return genres
@@ -607,8 +571,7 @@ def get_favorite_genres():
 def get_favorite_artists():
     """Get user's favorite artists based on listening history"""
     try:
-        with open("current_user.txt", "r") as f:
-            user_id = f.read().strip()
+        user_id = get_current_user_id()
             
         connection = connect_db()
         if not connection:
@@ -616,18 +579,7 @@ def get_favorite_artists():
             
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-        SELECT a.artist_id, a.name as artist_name, COUNT(lh.history_id) as count
-        FROM Listening_History lh
-        JOIN Songs s ON lh.song_id = s.song_id
-        JOIN Artists a ON s.artist_id = a.artist_id
-        WHERE lh.user_id = %s
-        GROUP BY a.artist_id
-        ORDER BY count DESC
-        LIMIT 3
-        """
-        
-        cursor.execute(query, (user_id,))
+        cursor.execute(users_queries.FAVORITE_ARTISTS, (user_id,))
         artists = cursor.fetchall()
         
         return artists
@@ -649,37 +601,12 @@ def get_random_songs(limit=8, exclude_ids=None):
             
         cursor = connection.cursor(dictionary=True)
         
-        exclusion_filter = "WHERE s.is_active = 1"  # Always filter for active songs
-        params = []
-        
-        if exclude_ids and len(exclude_ids) > 0:
-            placeholders = ", ".join(["%s"] * len(exclude_ids))
-            exclusion_filter = f"WHERE s.is_active = 1 AND s.song_id NOT IN ({placeholders})"
-            params = exclude_ids
-        
-        query = f"""
-        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name
-        FROM Songs s
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        {exclusion_filter}
-        ORDER BY RAND()
-        LIMIT %s
-        """
-        
-        params.append(limit)
+        query, params = users_queries.random_songs_query(limit, exclude_ids)
         cursor.execute(query, params)
         songs = cursor.fetchall()
         
         if not songs:
-            songs = [
-                {"song_id": 1, "title": "Blinding Lights", "artist_name": "The Weeknd", "genre_name": "Pop"},
-                {"song_id": 2, "title": "Levitating", "artist_name": "Dua Lipa", "genre_name": "Pop"},
-                {"song_id": 3, "title": "Believer", "artist_name": "Imagine Dragons", "genre_name": "Rock"},
-                {"song_id": 4, "title": "Shape of You", "artist_name": "Ed Sheeran", "genre_name": "Pop"}
-            ]
-            random.shuffle(songs)
-            songs = songs[:limit]
+            songs = users_queries.fallback_songs(limit)
         
         return songs
         
@@ -694,8 +621,7 @@ def get_random_songs(limit=8, exclude_ids=None):
 def create_playlist(name, description=""):
     """Create a new playlist for the current user"""
     try:
-        with open("current_user.txt", "r") as f:
-            user_id = f.read().strip()
+        user_id = get_current_user_id()
             
         connection = connect_db()
         if not connection:
@@ -717,65 +643,145 @@ def create_playlist(name, description=""):
             cursor.close()
             connection.close()
 
+def _with_duration_text(playlists):
+    """Add total_duration_formatted (m:ss or h:mm:ss) to playlist summaries"""
+    for playlist in playlists:
+        hours, remainder = divmod(playlist["total_duration"] or 0, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        playlist["total_duration_formatted"] = (
+            f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+        )
+    return playlists
+
 def get_user_playlists():
-    """Get all playlists for the current user"""
+    """Get all playlists for the current user with their summaries
+
+    song_count, total_duration, cover_song_ids and last_modified are kept
+    current by playlist_store. The summaries are cached per user and
+    brought up to date from Change_Log, so a repeated listing reads only
+    the playlists changed since; only covers invalidated since the last
+    listing are recomputed.
+    """
     try:
-        with open("current_user.txt", "r") as f:
-            user_id = f.read().strip()
+        user_id = get_current_user_id()
             
         connection = connect_db()
         if not connection:
-            return []
+            # Database unreachable: the playlists pinned on this device
+            return _with_duration_text(offline_playlists(user_id))
             
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-        SELECT playlist_id, name, description, created_at
-        FROM Playlists
-        WHERE user_id = %s
-        ORDER BY created_at DESC
-        """
+        cache = playlist_caches.get(user_id)
+        changes = changes_since(connection, cache["version"], ["Playlists"], user_id) if cache else None
+        if changes and not changes["reset"] and not changes["more"]:
+            playlists = dict(cache["playlists"])
+            for playlist_id in changes["deletes"].get("Playlists", []):
+                playlists.pop(playlist_id, None)
+            for playlist in changes["upserts"].get("Playlists", []):
+                playlists[playlist["playlist_id"]] = playlist
+            version = changes["version"]
+        else:
+            # Read before the playlists, so changes made meanwhile are applied next time
+            version = latest_version(connection)
+            
+            query = """
+            SELECT playlist_id, name, description, created_at,
+                   song_count, total_duration, cover_song_ids, last_modified
+            FROM Playlists
+            WHERE user_id = %s
+            """
+            
+            cursor.execute(query, (user_id,))
+            playlists = {playlist["playlist_id"]: playlist for playlist in cursor.fetchall()}
         
-        cursor.execute(query, (user_id,))
-        playlists = cursor.fetchall()
+        stale = [playlist_id for playlist_id, playlist in playlists.items() if playlist["cover_song_ids"] is None]
+        if stale:
+            for playlist_id, covers in refresh_covers(connection, stale).items():
+                playlists[playlist_id] = dict(playlists[playlist_id], cover_song_ids=",".join(map(str, covers)))
+            connection.commit()
+        playlist_caches[user_id] = {"version": version, "playlists": playlists}
         
-        return playlists
+        ordered = sorted(playlists.values(), key=lambda p: (p["created_at"], p["playlist_id"]), reverse=True)
+        return _with_duration_text([
+            dict(playlist, cover_song_ids=parse_cover_song_ids(playlist["cover_song_ids"])) for playlist in ordered
+        ])
         
     except Exception as e:
         print(f"Error fetching playlists: {e}")
-        return []
+        return _with_duration_text(offline_playlists(get_current_user_id()))
     finally:
         if 'connection' in locals() and connection and connection.is_connected():
             cursor.close()
             connection.close()
 
-def get_playlist_songs(playlist_id):
-    """Get all songs in a specific playlist"""
+def get_playlist_songs(playlist_id, offset=0, limit=None):
+    """Get the songs in a specific playlist, optionally one page of them
+
+    Only the ordered ids come from the database; titles and names are
+    hydrated from the metadata cache.
+    """
     try:
         connection = connect_db()
         if not connection:
-            return []
+            # Database unreachable: the songs stored for a pinned playlist
+            return offline_playlist_songs(get_current_user_id(), playlist_id, offset, limit)
             
-        cursor = connection.cursor(dictionary=True)
+        cursor = connection.cursor()
         
         query = """
-        SELECT s.song_id, s.title, a.name as artist_name, g.name as genre_name
+        SELECT ps.song_id
         FROM Playlist_Songs ps
-        JOIN Songs s ON ps.song_id = s.song_id
-        JOIN Artists a ON s.artist_id = a.artist_id
-        LEFT JOIN Genres g ON s.genre_id = g.genre_id
-        WHERE ps.playlist_id = %s AND s.is_active = 1  # Only show active songs
+        JOIN Active_Songs_Catalog s ON ps.song_id = s.song_id  # Only show active songs
+        WHERE ps.playlist_id = %s
         ORDER BY ps.position
         """
+        params = [playlist_id]
+        if limit is not None:
+            # Walks idx_playlist_songs_position, so a page costs offset + limit index entries
+            query += " LIMIT %s OFFSET %s"
+            params += [limit, offset]
         
-        cursor.execute(query, (playlist_id,))
-        songs = cursor.fetchall()
-        
-        return songs
+        cursor.execute(query, params)
+        song_ids = [row[0] for row in cursor.fetchall()]
         
     except Exception as e:
         print(f"Error fetching playlist songs: {e}")
-        return []
+        return offline_playlist_songs(get_current_user_id(), playlist_id, offset, limit)
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+    return hydrate_songs(song_ids)
+
+def count_playlist_songs(playlist_id):
+    """Number of active songs in a playlist, i.e. the rows get_playlist_songs pages through
+
+    The summary's song_count also counts songs that have since been made
+    inactive, which would leave empty pages at the end.
+    """
+    try:
+        connection = connect_db()
+        if not connection:
+            return len(offline_playlist_songs(get_current_user_id(), playlist_id))
+            
+        cursor = connection.cursor()
+        
+        cursor.execute(
+            """
+            SELECT COUNT(*)
+            FROM Playlist_Songs ps
+            JOIN Active_Songs_Catalog s ON ps.song_id = s.song_id
+            WHERE ps.playlist_id = %s
+            """,
+            (playlist_id,)
+        )
+        return cursor.fetchone()[0]
+        
+    except Exception as e:
+        print(f"Error counting playlist songs: {e}")
+        return len(offline_playlist_songs(get_current_user_id(), playlist_id))
     finally:
         if 'connection' in locals() and connection and connection.is_connected():
             cursor.close()
@@ -790,49 +796,201 @@ def add_song_to_playlist(playlist_id, song_id):
             
         cursor = connection.cursor()
         
-        cursor.execute("SELECT MAX(position) FROM Playlist_Songs WHERE playlist_id = %s", (playlist_id,))
-        max_position = cursor.fetchone()[0]
-        position = (max_position or 0) + 1
+        if not append_songs(connection, playlist_id, [song_id]):
+            return False
+        connection.commit()
+        
+        return True
+        
+    except Exception as e:
+        print(f"Error adding song to playlist: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def move_song_in_playlist(playlist_id, song_id, after_song_id=None):
+    """Move a song right after another one in a playlist (None = to the top)"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+            
+        cursor = connection.cursor()
+        
+        if move_song(connection, playlist_id, song_id, after_song_id) is None:
+            return False
+        connection.commit()
+        
+        return True
+        
+    except Exception as e:
+        print(f"Error moving song in playlist: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def apply_playlist_operations(playlist_id, operations):
+    """Apply a batch of playlist edits in one transaction (see playlist_store.apply_operations)
+
+    Returns the new song order, or None on failure (nothing is changed then).
+    """
+    try:
+        connection = connect_db()
+        if not connection:
+            return None
+            
+        cursor = connection.cursor()
+        
+        order = apply_operations(connection, playlist_id, operations)
+        if order is None:
+            return None
+        connection.commit()
+        
+        return order
+        
+    except Exception as e:
+        print(f"Error updating playlist: {e}")
+        return None
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def remove_song_from_playlist(playlist_id, song_id):
+    """Remove a song from a playlist"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+            
+        cursor = connection.cursor()
+        
+        remove_songs(connection, playlist_id, [song_id])
+        connection.commit()
+        
+        return True
+        
+    except Exception as e:
+        print(f"Error removing song from playlist: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def delete_playlist(playlist_id):
+    """Delete a playlist"""
+    try:
+        connection = connect_db()
+        if not connection:
+            return False
+            
+        cursor = connection.cursor()
         
-        query = "INSERT INTO Playlist_Songs (playlist_id, song_id, position) VALUES (%s, %s, %s)"
-        cursor.execute(query, (playlist_id, song_id, position))
+        query = "DELETE FROM Playlists WHERE playlist_id = %s"
+        cursor.execute(query, (playlist_id,))
         connection.commit()
         
         return True
         
     except Exception as e:
-        print(f"Error adding song to playlist: {e}")
-        return False
+        print(f"Error deleting playlist: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def create_smart_playlist(name, rules, sort_by="play_count", max_songs=None):
+    """Create a smart playlist for the current user from [field, operator, value] rules"""
+    try:
+        user_id = get_current_user_id()
+        rules = validate_rules(rules, sort_by, max_songs)
+            
+        connection = connect_db()
+        if not connection:
+            return False
+            
+        cursor = connection.cursor()
+        
+        query = "INSERT INTO Smart_Playlists (user_id, name, rules, sort_by, max_songs) VALUES (%s, %s, %s, %s, %s)"
+        cursor.execute(query, (user_id, name, json.dumps(rules), sort_by, max_songs))
+        connection.commit()
+        
+        return True
+        
+    except Exception as e:
+        print(f"Error creating smart playlist: {e}")
+        return False
+    finally:
+        if 'connection' in locals() and connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+def get_user_smart_playlists():
+    """Get all smart playlists of the current user with a readable summary of their rules"""
+    try:
+        user_id = get_current_user_id()
+            
+        connection = connect_db()
+        if not connection:
+            return []
+            
+        cursor = connection.cursor(dictionary=True)
+        
+        query = """
+        SELECT smart_playlist_id, name, rules, sort_by, max_songs
+        FROM Smart_Playlists
+        WHERE user_id = %s
+        ORDER BY created_at DESC
+        """
+        
+        cursor.execute(query, (user_id,))
+        playlists = cursor.fetchall()
+        
+        for playlist in playlists:
+            playlist["rules"] = json.loads(playlist["rules"])
+            playlist["description"] = describe_rules(playlist["rules"], playlist["sort_by"], playlist["max_songs"])
+        
+        return playlists
+        
+    except Exception as e:
+        print(f"Error fetching smart playlists: {e}")
+        return []
     finally:
         if 'connection' in locals() and connection and connection.is_connected():
             cursor.close()
             connection.close()
 
-def remove_song_from_playlist(playlist_id, song_id):
-    """Remove a song from a playlist"""
+def get_smart_playlist_songs(smart_playlist_id):
+    """Get the songs of a smart playlist, applying only the plays since it was last opened"""
     try:
         connection = connect_db()
         if not connection:
-            return False
+            return []
             
         cursor = connection.cursor()
         
-        query = "DELETE FROM Playlist_Songs WHERE playlist_id = %s AND song_id = %s"
-        cursor.execute(query, (playlist_id, song_id))
+        song_ids = refresh_smart_playlist(connection, smart_playlist_id)
         connection.commit()
         
-        return True
-        
     except Exception as e:
-        print(f"Error removing song from playlist: {e}")
-        return False
+        print(f"Error fetching smart playlist songs: {e}")
+        return []
     finally:
         if 'connection' in locals() and connection and connection.is_connected():
             cursor.close()
             connection.close()
 
-def delete_playlist(playlist_id):
-    """Delete a playlist"""
+    # Songs deactivated since the last full evaluation are still materialized
+    return [song for song in hydrate_songs(song_ids or []) if song["is_active"]]
+
+def delete_smart_playlist(smart_playlist_id):
+    """Delete a smart playlist"""
     try:
         connection = connect_db()
         if not connection:
@@ -840,14 +998,14 @@ def delete_playlist(playlist_id):
             
         cursor = connection.cursor()
         
-        query = "DELETE FROM Playlists WHERE playlist_id = %s"
-        cursor.execute(query, (playlist_id,))
+        query = "DELETE FROM Smart_Playlists WHERE smart_playlist_id = %s"
+        cursor.execute(query, (smart_playlist_id,))
         connection.commit()
         
         return True
         
     except Exception as e:
-        print(f"Error deleting playlist: {e}")
+        print(f"Error deleting smart playlist: {e}")
         return False
     finally:
         if 'connection' in locals() and connection and connection.is_connected():
@@ -857,7 +1015,7 @@ def delete_playlist(playlist_id):
 def download_song(song_id):
     """Download a song to local storage"""
     try:
-        song_data = get_song_data(song_id)
+        song_data = get_song_data(song_id, APP_CONFIG.get("download_quality"))
         if not song_data:
             messagebox.showerror("Error", "Could not retrieve song data")
             return False
@@ -890,10 +1048,12 @@ def download_song(song_id):
 # ------------------- Music Player Functions -------------------
 def play_song(song_id, context=None, songs_list=None):
     """Play a song from its binary data in the database and manage queue"""
-    global current_song, song_queue, queue_index, queue_context
+    global current_song, song_queue, queue_index, queue_context, current_analysis, seek_offset, queued_song
     
     try:
-        song_data = get_song_data(song_id)
+        # Queue neighbours are usually prefetched already; otherwise fetch directly
+        prefetched = get_prefetched(song_id)
+        song_data = prefetched or load_song_data(song_id)
         if not song_data:
             messagebox.showerror("Error", "Could not retrieve song data")
             return False
@@ -914,27 +1074,40 @@ def play_song(song_id, context=None, songs_list=None):
                 song_queue.append({'song_id': song_id, 'title': song_data['title'], 'artist_name': song_data['artist']})
                 queue_index = len(song_queue) - 1
         
-        temp_dir = APP_CONFIG["temp_dir"]
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        temp_file = os.path.join(temp_dir, f"song_{song_id}.{song_data['type']}")
-        
-        with open(temp_file, 'wb') as f:
-            f.write(song_data['data'])
+        if prefetched:
+            temp_file = prefetched['path']
+        else:
+            temp_file = write_song_file(APP_CONFIG["temp_dir"], song_id, song_data)
             
+        # Loading a new file also drops anything queued in the mixer
+        set_files_in_use(temp_file)
         mixer.music.load(temp_file)
         mixer.music.play()
+        queued_song = None
+        
+        if prefetched:
+            current_analysis = prefetched['analysis']
+        elif 'analysis' in song_data:
+            # From the offline store: no database round trip
+            current_analysis = song_data['analysis']
+        else:
+            current_analysis = get_song_analysis(song_id)
+        seek_offset = 0.0
+        apply_volume_normalization()
+        draw_waveform()
         
         current_song = {
             "id": song_id,
             "title": song_data["title"],
             "artist": song_data["artist"],
             "playing": True,
-            "paused": False
+            "paused": False,
+            "path": temp_file
         }
         
         update_now_playing_display()
-        record_listening_history(song_id)
+        record_play_in_background(song_id)
+        prefetch_upcoming()
         
         return True
         
@@ -999,6 +1172,142 @@ def update_now_playing_display():
         else:
             play_btn.configure(text="⏸️")
 
+def current_position():
+    """Seconds into the current track"""
+    return seek_offset + max(mixer.music.get_pos(), 0) / 1000
+
+def prefetch_upcoming():
+    """Fetch the next tracks of the queue in the background"""
+    if not song_queue or queue_index < 0:
+        return
+    depth = APP_CONFIG.get("prefetch_depth", 2)
+    upcoming = [song['song_id'] for song in song_queue[queue_index + 1:queue_index + 1 + depth]]
+    prefetch_songs(upcoming, keep=[current_song["id"]])
+
+def advance_to_queued_song(previous_duration):
+    """Follow the mixer onto the queued track once the current one has ended"""
+    global current_song, queue_index, current_analysis, seek_offset, queued_song
+    
+    # get_pos() keeps counting across queued tracks
+    seek_offset -= previous_duration
+    queue_index = queued_song['index']
+    current_analysis = queued_song['analysis']
+    current_song = {
+        "id": queued_song['song_id'],
+        "title": queued_song["title"],
+        "artist": queued_song["artist"],
+        "playing": True,
+        "paused": False,
+        "path": queued_song["path"]
+    }
+    queued_song = None
+    set_files_in_use(current_song["path"])
+    
+    apply_volume_normalization()
+    draw_waveform()
+    update_now_playing_display()
+    record_play_in_background(current_song["id"])
+    prefetch_upcoming()
+
+def update_gapless_playback():
+    """Queue the prefetched next track with the mixer and follow the handover; reschedules itself"""
+    global queued_song
+    
+    try:
+        if current_song["playing"] and queue_index >= 0:
+            next_index = queue_index + 1
+            # The handover is detected by duration, so only analyzed songs are queued
+            duration = current_analysis["duration_ms"] / 1000 if current_analysis else None
+            
+            if queued_song is None and duration and next_index < len(song_queue):
+                next_song_id = song_queue[next_index]['song_id']
+                prefetched = get_prefetched(next_song_id)
+                if prefetched:
+                    set_files_in_use(current_song["path"], prefetched['path'])
+                    mixer.music.queue(prefetched['path'])
+                    queued_song = dict(prefetched, song_id=next_song_id, index=next_index)
+            
+            if queued_song and current_position() >= duration:
+                advance_to_queued_song(duration)
+            elif not queued_song and not mixer.music.get_busy() and next_index < len(song_queue):
+                # Finished before the next track was ready
+                play_next_song()
+    except Exception as e:
+        print(f"Error updating gapless playback: {e}")
+    
+    now_playing_label.after(250, update_gapless_playback)
+
+def apply_volume_normalization():
+    """Turn louder songs down to APP_CONFIG["normalize_lufs"] using the stored loudness"""
+    volume = 1.0
+    target = APP_CONFIG.get("normalize_lufs")
+    if current_analysis and target is not None:
+        volume = min(1.0, 10 ** ((target - current_analysis["loudness_lufs"]) / 20))
+    mixer.music.set_volume(volume)
+
+def draw_waveform():
+    """Draw the current song's stored waveform as the seek bar"""
+    global waveform_columns
+    if 'waveform_canvas' not in globals():
+        return
+    
+    waveform_canvas.delete("all")
+    waveform_columns = 0
+    if not current_analysis or not current_analysis["waveform"]:
+        return
+    
+    peaks = current_analysis["waveform"]
+    width = int(waveform_canvas.cget("width"))
+    height = int(waveform_canvas.cget("height"))
+    loudest = max(peaks) or 1
+    
+    for x in range(width):
+        start = x * len(peaks) // width
+        end = max(start + 1, (x + 1) * len(peaks) // width)
+        bar = max(1, max(peaks[start:end]) * (height - 2) // loudest)
+        waveform_canvas.create_line(
+            x, (height - bar) // 2, x, (height + bar) // 2,
+            fill=COLORS["text_secondary"], tags=f"col{x}"
+        )
+
+def update_waveform_progress():
+    """Colour the played part of the waveform; reschedules itself"""
+    global waveform_columns
+    if 'waveform_canvas' not in globals():
+        return
+    
+    if current_analysis and current_song["playing"] and current_analysis["duration_ms"]:
+        position = current_position()
+        width = int(waveform_canvas.cget("width"))
+        played = min(width, int(position * 1000 / current_analysis["duration_ms"] * width))
+        for x in range(waveform_columns, played):
+            waveform_canvas.itemconfigure(f"col{x}", fill=COLORS["primary"])
+        waveform_columns = max(waveform_columns, played)
+    
+    waveform_canvas.after(500, update_waveform_progress)
+
+def seek_waveform(event):
+    """Jump to the clicked position of the waveform"""
+    global seek_offset, queued_song
+    if not current_analysis or current_song["id"] is None:
+        return
+    
+    width = int(waveform_canvas.cget("width"))
+    position = max(0, min(event.x, width)) / width * current_analysis["duration_ms"] / 1000
+    try:
+        mixer.music.play(start=position)
+    except Exception as e:
+        print(f"Seeking not supported for this song: {e}")
+        return
+    
+    # Restarting playback dropped the gapless queue; the poller re-queues it
+    queued_song = None
+    seek_offset = position
+    current_song["playing"] = True
+    current_song["paused"] = False
+    draw_waveform()
+    update_now_playing_display()
+
 # ------------------- UI Creation Functions -------------------
 def update_sidebar_active_page(active_page):
     """Update sidebar button colors to highlight the active page"""
@@ -1022,7 +1331,7 @@ def update_sidebar_active_page(active_page):
 
 def create_sidebar(parent_frame, user, active_page="home"):
     """Create the sidebar navigation"""
-    global sidebar, sidebar_buttons, now_playing_label, play_btn
+    global sidebar, sidebar_buttons, now_playing_label, play_btn, waveform_canvas
     if sidebar is not None:
         update_sidebar_active_page(active_page)
         return sidebar
@@ -1087,6 +1396,20 @@ def create_sidebar(parent_frame, user, active_page="home"):
     )
     now_playing_label.pack(pady=10)
     
+    waveform_canvas = Canvas(
+        now_playing_frame,
+        width=220,
+        height=36,
+        bg=COLORS["sidebar"],
+        highlightthickness=0,
+        cursor="hand2"
+    )
+    waveform_canvas.pack(pady=(0, 10))
+    waveform_canvas.bind("<Button-1>", seek_waveform)
+    draw_waveform()
+    update_waveform_progress()
+    update_gapless_playback()
+    
     player_frame = ctk.CTkFrame(sidebar, fg_color=COLORS["sidebar"], corner_radius=8)
     player_frame.pack(side="bottom", fill="x", pady=10, padx=10)
     
@@ -1225,23 +1548,26 @@ def create_home_frame(parent_frame, user):
     songs_frame = ctk.CTkFrame(featured_frame, fg_color="transparent")
     songs_frame.pack(fill="x", padx=20)
     
-    featured_songs = get_featured_songs(3)
-    if not featured_songs:
-        featured_songs = [
-            {"song_id": 1, "title": "Blinding Lights", "artist_name": "The Weeknd"},
-            {"song_id": 2, "title": "Levitating", "artist_name": "Dua Lipa"},
-            {"song_id": 3, "title": "Shape of You", "artist_name": "Ed Sheeran"}
-        ]
+    def show_featured_songs(featured_songs):
+        if not featured_songs:
+            featured_songs = [
+                {"song_id": 1, "title": "Blinding Lights", "artist_name": "The Weeknd"},
+                {"song_id": 2, "title": "Levitating", "artist_name": "Dua Lipa"},
+                {"song_id": 3, "title": "Shape of You", "artist_name": "Ed Sheeran"}
+            ]
+        
+        for song in featured_songs:
+            song_card = create_song_card(
+                songs_frame,
+                song["song_id"],
+                song["title"],
+                song["artist_name"],
+                play_command=lambda sid=song["song_id"]: play_song(sid, context='featured', songs_list=featured_songs)
+            )
+            song_card.pack(side="left", padx=10)
     
-    for song in featured_songs:
-        song_card = create_song_card(
-            songs_frame,
-            song["song_id"],
-            song["title"],
-            song["artist_name"],
-            play_command=lambda sid=song["song_id"]: play_song(sid, context='featured', songs_list=featured_songs)
-        )
-        song_card.pack(side="left", padx=10)
+    # Loaded on the async bridge so the page appears without waiting on the database
+    run_async(users_async.get_featured_songs(3), show_featured_songs, songs_frame)
 
 def create_search_frame(parent_frame, user):
     """Create the search page UI with enhanced artist search"""
@@ -1682,11 +2008,30 @@ def create_download_frame(parent_frame, user):
             )
             song_frames.append(song_frame)
     
-    favorite_songs = get_user_favorite_songs()
-    display_songs_in_tab(favorite_tab, favorite_songs)
-    
-    popular_songs = get_popular_songs()
-    display_songs_in_tab(popular_tab, popular_songs)
+    loading_labels = []
+    for tab in (favorite_tab, popular_tab):
+        label = ctk.CTkLabel(
+            tab,
+            text="Loading songs...",
+            font=("Inter", 14),
+            text_color=COLORS["text_secondary"]
+        )
+        label.pack(pady=30)
+        loading_labels.append(label)
+    
+    def show_download_songs(results):
+        favorite_songs, popular_songs = results
+        for label in loading_labels:
+            label.destroy()
+        display_songs_in_tab(favorite_tab, favorite_songs)
+        display_songs_in_tab(popular_tab, popular_songs)
+    
+    # Favorites and popular songs are independent, so both queries run concurrently
+    run_async(
+        gather_async(users_async.get_user_favorite_songs(), users_async.get_popular_songs()),
+        show_download_songs,
+        favorite_songs_frame
+    )
     
     button_frame = ctk.CTkFrame(favorite_songs_frame, fg_color="transparent")
     button_frame.pack(pady=20)
@@ -1726,30 +2071,41 @@ def create_recommend_frame(parent_frame, user):
         text_color=COLORS["primary"]
     ).pack(pady=(20, 10))
     
-    subtitle_text = "Discover music based on your listening history."
-    if not get_user_favorite_songs(limit=1):
-        subtitle_text = "Start listening to songs to get personalized recommendations."
-    
-    ctk.CTkLabel(
+    subtitle_label = ctk.CTkLabel(
         songs_frame,
-        text=subtitle_text,
+        text="Discover music based on your listening history.",
         font=("Inter", 14),
         text_color=COLORS["text_secondary"]
-    ).pack(pady=(0, 20))
+    )
+    subtitle_label.pack(pady=(0, 20))
     
     recommended_songs_frame = ctk.CTkFrame(songs_frame, fg_color="transparent")
     recommended_songs_frame.pack(fill="both", expand=True)
     
-    recommended_songs = get_recommended_songs(8)
+    loading_label = ctk.CTkLabel(
+        recommended_songs_frame,
+        text="Loading recommendations...",
+        font=("Inter", 14),
+        text_color=COLORS["text_secondary"]
+    )
+    loading_label.pack(pady=30)
     
-    if not recommended_songs:
-        ctk.CTkLabel(
-            recommended_songs_frame,
-            text="No recommended songs available",
-            font=("Inter", 14),
-            text_color=COLORS["text_secondary"]
-        ).pack(pady=30)
-    else:
+    def show_recommendations(results):
+        has_history, recommended_songs = results
+        loading_label.destroy()
+        
+        if not has_history:
+            subtitle_label.configure(text="Start listening to songs to get personalized recommendations.")
+        
+        if not recommended_songs:
+            ctk.CTkLabel(
+                recommended_songs_frame,
+                text="No recommended songs available",
+                font=("Inter", 14),
+                text_color=COLORS["text_secondary"]
+            ).pack(pady=30)
+            return
+        
         for song in recommended_songs:
             song_frame = ctk.CTkFrame(recommended_songs_frame, fg_color=COLORS["card"], corner_radius=8, height=50)
             song_frame.pack(fill="x", pady=5, ipady=5)
@@ -1793,6 +2149,13 @@ def create_recommend_frame(parent_frame, user):
             
             song_frame.bind("<Button-1>", lambda e, sid=song["song_id"]: play_song(sid, context='recommend', songs_list=recommended_songs))
     
+    # The history check and the recommendation queries run concurrently
+    run_async(
+        gather_async(users_async.get_user_favorite_songs(limit=1), users_async.get_recommended_songs(8)),
+        show_recommendations,
+        recommended_songs_frame
+    )
+    
     button_frame = ctk.CTkFrame(songs_frame, fg_color="transparent")
     button_frame.pack(pady=20)
     
@@ -1866,6 +2229,81 @@ def create_playlist_frame(parent_frame, user):
         command=create_new_playlist
     ).pack(side="left", padx=10)
     
+    user_id = get_current_user_id()
+    pinned = pinned_playlist_ids(user_id)
+    
+    if offline_available():
+        offline_frame = ctk.CTkFrame(main_content_frame, fg_color=COLORS["card"], corner_radius=8)
+        offline_frame.pack(fill="x", pady=(0, 10))
+        
+        offline_label = ctk.CTkLabel(
+            offline_frame,
+            text="",
+            font=("Inter", 12),
+            text_color=COLORS["text_secondary"]
+        )
+        offline_label.pack(side="left", padx=10, pady=10)
+        
+        def show_offline_usage():
+            songs, used, pending = offline_usage(user_id)
+            budget = APP_CONFIG.get("offline_budget_mb", 2048) * 1024 * 1024
+            text = f"📥 Offline: {songs} songs • {format_file_size(used)} of {format_file_size(budget)}"
+            if pending:
+                text += f" • {pending} plays waiting to sync"
+            offline_label.configure(text=text)
+        
+        def sync_finished(result):
+            sync_button.configure(state="normal", text="Sync Offline")
+            if result is None:
+                messagebox.showerror("Error", "Offline sync failed; is the database reachable?")
+            elif result["skipped"]:
+                messagebox.showwarning(
+                    "Offline Storage Full",
+                    f"{result['skipped']} pinned songs did not fit in the offline storage budget."
+                )
+            show_offline_usage()
+        
+        def sync_in_background():
+            try:
+                return sync_offline_store(
+                    user_id,
+                    lambda song_id: get_song_data(song_id, APP_CONFIG.get("playback_quality")),
+                    APP_CONFIG.get("playback_quality")
+                )
+            except Exception as e:
+                print(f"Error syncing offline songs: {e}")
+                return None
+        
+        def start_offline_sync():
+            sync_button.configure(state="disabled", text="Syncing...")
+            run_async(asyncio.to_thread(sync_in_background), sync_finished, offline_frame)
+        
+        sync_button = ctk.CTkButton(
+            offline_frame,
+            text="Sync Offline",
+            font=("Inter", 12),
+            fg_color=COLORS["secondary"],
+            hover_color=COLORS["secondary_hover"],
+            height=32,
+            corner_radius=8,
+            command=start_offline_sync
+        )
+        sync_button.pack(side="right", padx=10)
+        show_offline_usage()
+        
+        def toggle_pin(playlist):
+            if playlist["playlist_id"] in pinned:
+                unpin_playlist(user_id, playlist["playlist_id"])
+                pinned.discard(playlist["playlist_id"])
+            else:
+                pin_playlist(user_id, playlist["playlist_id"], playlist["name"])
+                pinned.add(playlist["playlist_id"])
+            pin_buttons[playlist["playlist_id"]].configure(
+                text="📌 Offline" if playlist["playlist_id"] in pinned else "📥 Keep Offline"
+            )
+            start_offline_sync()
+    
+    pin_buttons = {}
     playlists_frame = ctk.CTkFrame(main_content_frame, fg_color="transparent")
     playlists_frame.pack(fill="both", expand=True)
     
@@ -1890,6 +2328,14 @@ def create_playlist_frame(parent_frame, user):
                 text_color=COLORS["text"]
             ).pack(side="left", padx=10)
             
+            song_word = "song" if playlist["song_count"] == 1 else "songs"
+            ctk.CTkLabel(
+                playlist_frame,
+                text=f"{playlist['song_count']} {song_word} • {playlist['total_duration_formatted']}",
+                font=("Inter", 12),
+                text_color=COLORS["text_secondary"]
+            ).pack(side="left", padx=10)
+            
             ctk.CTkButton(
                 playlist_frame,
                 text="View Songs",
@@ -1913,8 +2359,24 @@ def create_playlist_frame(parent_frame, user):
                 corner_radius=8,
                 command=lambda pid=playlist["playlist_id"]: delete_playlist_and_refresh(pid)
             ).pack(side="right", padx=5)
+            
+            if offline_available():
+                pin_buttons[playlist["playlist_id"]] = ctk.CTkButton(
+                    playlist_frame,
+                    text="📌 Offline" if playlist["playlist_id"] in pinned else "📥 Keep Offline",
+                    font=("Inter", 12),
+                    fg_color=COLORS["secondary"],
+                    hover_color=COLORS["secondary_hover"],
+                    width=120,
+                    height=40,
+                    corner_radius=8,
+                    command=lambda p=playlist: toggle_pin(p)
+                )
+                pin_buttons[playlist["playlist_id"]].pack(side="right", padx=5)
     
-    def show_playlist_songs(playlist_id):
+    create_smart_playlist_section(main_content_frame, parent_frame, user)
+    
+    def show_playlist_songs(playlist_id, page=0):
         clear_content_frame()
         create_header(parent_frame, "Playlist Songs", user)
         
@@ -1929,7 +2391,10 @@ def create_playlist_frame(parent_frame, user):
             text_color=COLORS["primary"]
         ).pack(pady=(20, 10))
         
-        songs = get_playlist_songs(playlist_id)
+        # One page at a time, over the active songs only
+        page_count = max(1, -(-count_playlist_songs(playlist_id) // PLAYLIST_PAGE_SIZE))
+        page = min(page, page_count - 1)
+        songs = get_playlist_songs(playlist_id, page * PLAYLIST_PAGE_SIZE, PLAYLIST_PAGE_SIZE)
         
         if not songs:
             ctk.CTkLabel(
@@ -1939,10 +2404,59 @@ def create_playlist_frame(parent_frame, user):
                 text_color=COLORS["text_secondary"]
             ).pack(pady=20)
         else:
+            selected = {song["song_id"]: ctk.BooleanVar(value=False) for song in songs}
+            
+            def apply_to_selection(action):
+                chosen = [song["song_id"] for song in songs if selected[song["song_id"]].get()]
+                if action != "dedupe" and not chosen:
+                    messagebox.showwarning("Warning", "Select one or more songs first.")
+                    return
+                
+                if action == "remove":
+                    operations = [("remove", chosen)]
+                elif action == "dedupe":
+                    operations = [("dedupe",)]
+                elif action == "bottom":
+                    operations = [("to_end", chosen)]
+                else:
+                    operations = [("to_top", chosen)]
+                
+                if apply_playlist_operations(playlist_id, operations) is None:
+                    messagebox.showerror("Error", "Failed to update playlist.")
+                    return
+                refresh_playlist_songs(playlist_id, page)
+            
+            actions_frame = ctk.CTkFrame(songs_frame, fg_color="transparent")
+            actions_frame.pack(fill="x", pady=(0, 5))
+            
+            for text, action, color, hover in [
+                ("Remove Selected", "remove", COLORS["danger"], COLORS["danger_hover"]),
+                ("Move to Top", "top", COLORS["secondary"], COLORS["secondary_hover"]),
+                ("Move to Bottom", "bottom", COLORS["secondary"], COLORS["secondary_hover"]),
+                ("Remove Duplicates", "dedupe", COLORS["primary"], COLORS["primary_hover"])
+            ]:
+                ctk.CTkButton(
+                    actions_frame,
+                    text=text,
+                    font=("Inter", 12),
+                    fg_color=color,
+                    hover_color=hover,
+                    height=32,
+                    corner_radius=8,
+                    command=lambda a=action: apply_to_selection(a)
+                ).pack(side="left", padx=5)
+            
             for song in songs:
                 song_frame = ctk.CTkFrame(songs_frame, fg_color=COLORS["card"], corner_radius=8, height=50)
                 song_frame.pack(fill="x", pady=5)
                 
+                ctk.CTkCheckBox(
+                    song_frame,
+                    text="",
+                    variable=selected[song["song_id"]],
+                    width=24
+                ).pack(side="left", padx=(10, 0))
+                
                 ctk.CTkLabel(
                     song_frame,
                     text=f"🎵 {song['artist_name']} - {song['title']}",
@@ -1971,9 +2485,46 @@ def create_playlist_frame(parent_frame, user):
                     width=40,
                     height=40,
                     corner_radius=8,
-                    command=lambda sid=song["song_id"]: remove_song_and_refresh(playlist_id, sid)
+                    command=lambda sid=song["song_id"]: remove_song_and_refresh(playlist_id, sid, page)
                 ).pack(side="right", padx=5)
         
+        if page_count > 1:
+            pager_frame = ctk.CTkFrame(songs_frame, fg_color="transparent")
+            pager_frame.pack(pady=(10, 0))
+            
+            ctk.CTkButton(
+                pager_frame,
+                text="◀ Previous",
+                font=("Inter", 12),
+                fg_color=COLORS["primary"],
+                hover_color=COLORS["primary_hover"],
+                width=100,
+                height=32,
+                corner_radius=8,
+                state="normal" if page > 0 else "disabled",
+                command=lambda: show_playlist_songs(playlist_id, page - 1)
+            ).pack(side="left", padx=5)
+            
+            ctk.CTkLabel(
+                pager_frame,
+                text=f"Page {page + 1} of {page_count}",
+                font=("Inter", 12),
+                text_color=COLORS["text_secondary"]
+            ).pack(side="left", padx=10)
+            
+            ctk.CTkButton(
+                pager_frame,
+                text="Next ▶",
+                font=("Inter", 12),
+                fg_color=COLORS["primary"],
+                hover_color=COLORS["primary_hover"],
+                width=100,
+                height=32,
+                corner_radius=8,
+                state="normal" if page < page_count - 1 else "disabled",
+                command=lambda: show_playlist_songs(playlist_id, page + 1)
+            ).pack(side="left", padx=5)
+        
         ctk.CTkButton(
             songs_frame,
             text="Back to Playlists",
@@ -1993,13 +2544,234 @@ def create_playlist_frame(parent_frame, user):
         else:
             messagebox.showerror("Error", "Failed to delete playlist.")
     
-    def remove_song_and_refresh(playlist_id, song_id):
+    def remove_song_and_refresh(playlist_id, song_id, page=0):
         if remove_song_from_playlist(playlist_id, song_id):
             messagebox.showinfo("Success", "Song removed from playlist!")
-            clear_content_frame()
-            show_playlist_songs(playlist_id)
+            refresh_playlist_songs(playlist_id, page)
         else:
             messagebox.showerror("Error", "Failed to remove song.")
+    
+    def refresh_playlist_songs(playlist_id, page=0):
+        # Re-read the summaries so the page count follows the edit
+        playlists[:] = get_user_playlists()
+        show_playlist_songs(playlist_id, page)
+
+# Smart playlist orders offered in the builder
+SMART_SORT_LABELS = {
+    "Most played": "play_count",
+    "Recently played": "last_played",
+    "Recently added": "recently_added",
+    "Title": "title"
+}
+
+def create_smart_playlist_section(container, parent_frame, user):
+    """Smart playlist builder and list, below the regular playlists"""
+    ctk.CTkLabel(
+        container,
+        text="Smart Playlists ⚡",
+        font=("Inter", 20, "bold"),
+        text_color=COLORS["primary"]
+    ).pack(pady=(20, 5))
+    
+    builder_frame = ctk.CTkFrame(container, fg_color=COLORS["card"], corner_radius=8)
+    builder_frame.pack(fill="x", pady=5)
+    
+    first_row = ctk.CTkFrame(builder_frame, fg_color="transparent")
+    first_row.pack(fill="x", pady=(10, 5))
+    second_row = ctk.CTkFrame(builder_frame, fg_color="transparent")
+    second_row.pack(fill="x", pady=(5, 10))
+    
+    def entry(row, placeholder, width):
+        field = ctk.CTkEntry(
+            row,
+            placeholder_text=placeholder,
+            font=("Inter", 12),
+            text_color=COLORS["text"],
+            fg_color=COLORS["content"],
+            border_color=COLORS["primary"],
+            height=36,
+            width=width
+        )
+        field.pack(side="left", padx=10)
+        return field
+    
+    def option_menu(row, variable, values):
+        ctk.CTkOptionMenu(
+            row,
+            variable=variable,
+            values=values,
+            font=("Inter", 12),
+            fg_color=COLORS["primary"],
+            button_color=COLORS["primary_hover"],
+            button_hover_color=COLORS["primary"],
+            text_color=COLORS["text"],
+            width=160,
+            height=36
+        ).pack(side="left", padx=10)
+    
+    name_entry = entry(first_row, "Smart playlist name", 220)
+    genre_var = ctk.StringVar(value="Any genre")
+    option_menu(first_row, genre_var, ["Any genre"] + [genre["name"] for genre in get_cached_genres()])
+    sort_var = ctk.StringVar(value="Most played")
+    option_menu(first_row, sort_var, list(SMART_SORT_LABELS))
+    
+    played_entry = entry(second_row, "Played in last … days", 160)
+    not_played_entry = entry(second_row, "Not played in last … days", 180)
+    limit_entry = entry(second_row, "Max songs", 100)
+    
+    def create_new_smart_playlist():
+        name = name_entry.get().strip()
+        if not name:
+            messagebox.showwarning("Warning", "Please enter a smart playlist name.")
+            return
+        
+        numbers = {}
+        for key, field in [("played", played_entry), ("not_played", not_played_entry), ("limit", limit_entry)]:
+            text = field.get().strip()
+            if text and (not text.isdigit() or int(text) < 1):
+                messagebox.showwarning("Warning", "Days and max songs must be positive whole numbers.")
+                return
+            numbers[key] = int(text) if text else None
+        
+        rules = []
+        if genre_var.get() != "Any genre":
+            rules.append(["genre", "is", genre_var.get()])
+        if numbers["played"]:
+            rules.append(["played", "within_days", numbers["played"]])
+        if numbers["not_played"]:
+            rules.append(["played", "not_within_days", numbers["not_played"]])
+        
+        if create_smart_playlist(name, rules, SMART_SORT_LABELS[sort_var.get()], numbers["limit"]):
+            messagebox.showinfo("Success", f"Smart playlist '{name}' created!")
+            show_playlist_view()
+        else:
+            messagebox.showerror("Error", "Failed to create smart playlist.")
+    
+    ctk.CTkButton(
+        second_row,
+        text="Create Smart Playlist",
+        font=("Inter", 14, "bold"),
+        fg_color=COLORS["primary"],
+        hover_color=COLORS["primary_hover"],
+        corner_radius=8,
+        height=36,
+        command=create_new_smart_playlist
+    ).pack(side="left", padx=10)
+    
+    def delete_smart_playlist_and_refresh(smart_playlist_id):
+        if delete_smart_playlist(smart_playlist_id):
+            messagebox.showinfo("Success", "Smart playlist deleted!")
+            show_playlist_view()
+        else:
+            messagebox.showerror("Error", "Failed to delete smart playlist.")
+    
+    def show_smart_playlist_songs(smart_playlist):
+        clear_content_frame()
+        create_header(parent_frame, "Smart Playlist", user)
+        
+        songs_frame = ctk.CTkFrame(parent_frame, fg_color=COLORS["content"], corner_radius=12)
+        songs_frame.pack(fill="both", expand=True, padx=20, pady=(20, 10))
+        
+        ctk.CTkLabel(
+            songs_frame,
+            text=f"{smart_playlist['name']} ⚡",
+            font=("Inter", 24, "bold"),
+            text_color=COLORS["primary"]
+        ).pack(pady=(20, 5))
+        
+        ctk.CTkLabel(
+            songs_frame,
+            text=smart_playlist["description"],
+            font=("Inter", 12),
+            text_color=COLORS["text_secondary"]
+        ).pack(pady=(0, 10))
+        
+        songs = get_smart_playlist_songs(smart_playlist["smart_playlist_id"])
+        context = f'smart_{smart_playlist["smart_playlist_id"]}'
+        
+        if not songs:
+            ctk.CTkLabel(
+                songs_frame,
+                text="No songs match these rules yet.",
+                font=("Inter", 16),
+                text_color=COLORS["text_secondary"]
+            ).pack(pady=20)
+        
+        for song in songs:
+            song_frame = ctk.CTkFrame(songs_frame, fg_color=COLORS["card"], corner_radius=8, height=50)
+            song_frame.pack(fill="x", pady=5)
+            
+            ctk.CTkLabel(
+                song_frame,
+                text=f"🎵 {song['artist_name']} - {song['title']}",
+                font=("Inter", 14),
+                text_color=COLORS["text"]
+            ).pack(side="left", padx=10)
+            
+            ctk.CTkButton(
+                song_frame,
+                text="▶️",
+                font=("Inter", 12),
+                fg_color=COLORS["success"],
+                hover_color=COLORS["success_hover"],
+                width=40,
+                height=40,
+                corner_radius=8,
+                command=lambda sid=song["song_id"]: play_song(sid, context=context, songs_list=songs)
+            ).pack(side="right", padx=5)
+        
+        ctk.CTkButton(
+            songs_frame,
+            text="Back to Playlists",
+            font=("Inter", 14, "bold"),
+            fg_color=COLORS["primary"],
+            hover_color=COLORS["primary_hover"],
+            corner_radius=8,
+            height=40,
+            command=show_playlist_view
+        ).pack(pady=20)
+    
+    for smart_playlist in get_user_smart_playlists():
+        smart_frame = ctk.CTkFrame(container, fg_color=COLORS["card"], corner_radius=8)
+        smart_frame.pack(fill="x", pady=5)
+        
+        ctk.CTkLabel(
+            smart_frame,
+            text=f"⚡ {smart_playlist['name']}",
+            font=("Inter", 16, "bold"),
+            text_color=COLORS["text"]
+        ).pack(side="left", padx=10)
+        
+        ctk.CTkLabel(
+            smart_frame,
+            text=smart_playlist["description"],
+            font=("Inter", 12),
+            text_color=COLORS["text_secondary"]
+        ).pack(side="left", padx=10)
+        
+        ctk.CTkButton(
+            smart_frame,
+            text="View Songs",
+            font=("Inter", 12),
+            fg_color=COLORS["primary"],
+            hover_color=COLORS["primary_hover"],
+            width=100,
+            height=40,
+            corner_radius=8,
+            command=lambda sp=smart_playlist: show_smart_playlist_songs(sp)
+        ).pack(side="right", padx=5)
+        
+        ctk.CTkButton(
+            smart_frame,
+            text="🗑️",
+            font=("Inter", 12),
+            fg_color=COLORS["danger"],
+            hover_color=COLORS["danger_hover"],
+            width=40,
+            height=40,
+            corner_radius=8,
+            command=lambda spid=smart_playlist["smart_playlist_id"]: delete_smart_playlist_and_refresh(spid)
+        ).pack(side="right", padx=5)
 
 # ------------------- Navigation Functions -------------------
 def open_login_page():
@@ -2067,12 +2839,18 @@ if __name__ == "__main__":
             exit()
 
         ensure_directories_exist()
+        start_prefetcher(
+            load_song_data,
+            get_song_analysis,
+            APP_CONFIG["temp_dir"]
+        )
         
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("dark-blue")
 
         root = ctk.CTk()
         root.title(f"{APP_CONFIG['name']} - User Interface")
+        poll_async_results(root)
         
         # Maximize the window
         try: